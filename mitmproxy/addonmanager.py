@@ -44,7 +44,7 @@ def safecall():
         raise
     except Exception:
         etype, value, tb = sys.exc_info()
-        tb = cut_traceback(tb, "invoke_addon")
+        tb = cut_traceback(tb, "_invoke")
         ctx.log.error(
             "Addon error: %s" % "".join(
                 traceback.format_exception(etype, value, tb)
@@ -109,11 +109,22 @@ def traverse(chain):
             yield from traverse(a.addons)
 
 
+def _is_handler(func) -> bool:
+    # Module imports with the same name as a hook are not handlers, see _invoke.
+    return bool(func) and not isinstance(func, types.ModuleType)
+
+
 class AddonManager:
     def __init__(self, master):
         self.lookup = {}
         self.chain = []
         self.master = master
+        # The addons that handle each event, in chain order, and the events
+        # that have no handlers or only handlers marked with @inline. Both are
+        # replaced as a whole in invalidate(), so that proxy threads can read
+        # them without locking.
+        self.handlers: typing.Dict[str, typing.List[typing.Any]] = {}
+        self.inline: typing.FrozenSet[str] = eventsequence.Events
         master.options.changed.connect(self._configure_all)
 
     def _configure_all(self, options, updated):
@@ -127,6 +138,34 @@ class AddonManager:
             self.invoke_addon(a, "done")
         self.lookup = {}
         self.chain = []
+        self.invalidate()
+
+    def invalidate(self):
+        """
+            Rebuild the per-event handler index. This is done automatically
+            when addons are added or removed, but addons that manage their
+            own sub-addons must call it after changing them.
+        """
+        handlers: typing.Dict[str, typing.List[typing.Any]] = {}
+        blocking = set()
+        for a in traverse(self.chain):
+            for name in eventsequence.Events:
+                func = getattr(a, name, None)
+                if _is_handler(func):
+                    handlers.setdefault(name, []).append(a)
+                    if not getattr(func, "mitmproxy_inline", False):
+                        blocking.add(name)
+        self.handlers = handlers
+        self.inline = eventsequence.Events - blocking
+
+    def can_inline(self, name, message) -> bool:
+        """
+            True if all handlers for this lifecycle event may run on the
+            calling thread instead of the master's event loop.
+        """
+        if name not in self.inline:
+            return False
+        return not isinstance(message, flow.Flow) or "update" in self.inline
 
     def get(self, name):
         """
@@ -160,6 +199,7 @@ class AddonManager:
         for a in traverse([addon]):
             self.master.commands.collect_commands(a)
         self.master.options.process_deferred()
+        self.invalidate()
         return addon
 
     def add(self, *addons):
@@ -169,6 +209,7 @@ class AddonManager:
         """
         for i in addons:
             self.chain.append(self.register(i))
+        self.invalidate()
 
     def remove(self, addon):
         """
@@ -184,6 +225,7 @@ class AddonManager:
                 raise exceptions.AddonManagerError("No such addon: %s" % n)
             self.chain = [i for i in self.chain if i is not a]
             del self.lookup[_get_name(a)]
+        self.invalidate()
         self.invoke_addon(addon, "done")
 
     def __len__(self):
@@ -200,6 +242,12 @@ class AddonManager:
         """
             Handle a lifecycle event.
         """
+        self.handle_lifecycle_sync(name, message)
+
+    def handle_lifecycle_sync(self, name, message):
+        """
+            Handle a lifecycle event on the calling thread.
+        """
         if not hasattr(message, "reply"):  # pragma: no cover
             raise exceptions.ControlException(
                 "Message %s has no reply attribute" % message
@@ -232,28 +280,48 @@ class AddonManager:
         if name not in eventsequence.Events:
             raise exceptions.AddonManagerError("Unknown event: %s" % name)
         for a in traverse([addon]):
-            func = getattr(a, name, None)
-            if func:
-                if callable(func):
-                    func(*args, **kwargs)
-                elif isinstance(func, types.ModuleType):
-                    # we gracefully exclude module imports with the same name as hooks.
-                    # For example, a user may have "from mitmproxy import log" in an addon,
-                    # which has the same name as the "log" hook. In this particular case,
-                    # we end up in an error loop because we "log" this error.
-                    pass
-                else:
-                    raise exceptions.AddonManagerError(
-                        "Addon handler {} ({}) not callable".format(name, a)
-                    )
+            self._invoke(a, name, *args, **kwargs)
+
+    def _invoke(self, a, name, *args, **kwargs):
+        func = getattr(a, name, None)
+        if func:
+            if callable(func):
+                func(*args, **kwargs)
+            elif isinstance(func, types.ModuleType):
+                # we gracefully exclude module imports with the same name as hooks.
+                # For example, a user may have "from mitmproxy import log" in an addon,
+                # which has the same name as the "log" hook. In this particular case,
+                # we end up in an error loop because we "log" this error.
+                pass
+            else:
+                raise exceptions.AddonManagerError(
+                    "Addon handler {} ({}) not callable".format(name, a)
+                )
 
     def trigger(self, name, *args, **kwargs):
         """
-            Trigger an event across all addons.
+            Trigger an event across all addons that handle it.
         """
-        for i in self.chain:
+        if name not in eventsequence.Events:
+            with safecall():
+                raise exceptions.AddonManagerError("Unknown event: %s" % name)
+            return
+        index = self.handlers
+        addons = index.get(name, [])
+        i = 0
+        while i < len(addons):
+            a = addons[i]
+            i += 1
             try:
                 with safecall():
-                    self.invoke_addon(i, name, *args, **kwargs)
+                    self._invoke(a, name, *args, **kwargs)
             except exceptions.AddonHalt:
                 return
+            if self.handlers is not index:
+                # A handler has changed the addons, e.g. the script loader
+                # reordering scripts on configure. Continue with the new index,
+                # skipping the addons we have already called.
+                called = set(map(id, addons[:i]))
+                index = self.handlers
+                addons = [x for x in index.get(name, []) if id(x) not in called]
+                i = 0
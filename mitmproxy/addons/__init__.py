@@ -13,6 +13,7 @@ from mitmproxy.addons import onboarding
 from mitmproxy.addons import proxyauth
 from mitmproxy.addons import script
 from mitmproxy.addons import serverplayback
+from mitmproxy.addons import serverpool
 from mitmproxy.addons import mapremote
 from mitmproxy.addons import maplocal
 from mitmproxy.addons import modifybody
@@ -41,6 +42,7 @@ def default_addons():
         proxyauth.ProxyAuth(),
         script.ScriptLoader(),
         serverplayback.ServerPlayback(),
+        serverpool.ServerPool(),
         mapremote.MapRemote(),
         maplocal.MapLocal(),
         modifybody.ModifyBody(),
@@ -156,10 +156,9 @@ class ClientPlayback:
     def configure(self, updated):
         if "client_replay" in updated and ctx.options.client_replay:
             try:
-                flows = io.read_flows_from_paths(ctx.options.client_replay)
+                self.start_replay(io.stream_flows_from_paths(ctx.options.client_replay))
             except exceptions.FlowReadException as e:
                 raise exceptions.OptionsError(str(e))
-            self.start_replay(flows)
 
     @command.command("replay.client.count")
     def count(self) -> int:
@@ -217,7 +216,6 @@ class ClientPlayback:
             Load flows from file, and add them to the replay queue.
         """
         try:
-            flows = io.read_flows_from_paths([path])
+            self.start_replay(io.stream_flows_from_paths([path]))
         except exceptions.FlowReadException as e:
             raise exceptions.CommandError(str(e))
-        self.start_replay(flows)
@@ -10,6 +10,8 @@ from mitmproxy import flow
 from mitmproxy import optmanager
 from mitmproxy import platform
 from mitmproxy.net import server_spec
+from mitmproxy.net.http import encoding
+from mitmproxy.net.http import message
 from mitmproxy.net.http import status_codes
 import mitmproxy.types
 
@@ -52,12 +54,16 @@ class Core:
             )
         if "body_size_limit" in updated:
             try:
-                human.parse_size(opts.body_size_limit)
+                limit = human.parse_size(opts.body_size_limit)
             except ValueError:
                 raise exceptions.OptionsError(
                     "Invalid body size limit specification: %s" %
                     opts.body_size_limit
                 )
+            # Compressed bodies must not decode to more than we would accept
+            # on the wire.
+            encoding.set_max_decoded_size(limit)
+            message.decoded_cache.clear()
         if "mode" in updated:
             mode = opts.mode
             if mode.startswith("reverse:") or mode.startswith("upstream:"):
@@ -82,6 +88,11 @@ class Core:
                         "Client certificate path does not exist: {}".format(opts.client_certs)
                     )
 
+    def done(self):
+        # The limit is module state, which must not outlive this master.
+        encoding.set_max_decoded_size(None)
+        message.decoded_cache.clear()
+
     @command.command("set")
     def set(self, option: str, value: str = "") -> None:
         """
@@ -3,6 +3,7 @@ import os.path
 import sys
 import typing
 
+import mitmproxy.flow
 from mitmproxy import ctx
 from mitmproxy import exceptions
 from mitmproxy import flowfilter
@@ -40,10 +41,44 @@ class ReadFile:
             self.filter = filt
 
     async def load_flows(self, fo: typing.IO[bytes]) -> int:
+        reader = io.open_reader(fo)
+        if not isinstance(reader, io.IndexedFlowReader):
+            return await self._load(self._stream(reader.stream()))
+        # Flows from an indexed dump are only deserialized once the filter
+        # or the addons look at them. Every flow we hand out is either
+        # dropped or loaded before we are done, so we can unmap the file.
+        try:
+            return await self._load(self._stream(reader.lazy()))
+        finally:
+            reader.close()
+
+    @staticmethod
+    async def _stream(flows: typing.Iterable[mitmproxy.flow.Flow]) -> typing.AsyncIterator[mitmproxy.flow.Flow]:
+        for flow in flows:
+            yield flow
+
+    @staticmethod
+    async def _stream_parallel(path: str, processes: int) -> typing.AsyncIterator[mitmproxy.flow.Flow]:
+        """
+            Decode a file with io.read_flows_parallel(). We wait for each batch
+            on a worker thread, so that the event loop keeps running meanwhile.
+        """
+        loop = asyncio.get_event_loop()
+        batches = iter(io.read_flows_parallel(path, processes))
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, next, batches, None)
+                if batch is None:
+                    return
+                for flow in batch:
+                    yield flow
+        finally:
+            await loop.run_in_executor(None, batches.close)
+
+    async def _load(self, flows: typing.AsyncIterable[mitmproxy.flow.Flow]) -> int:
         cnt = 0
-        freader = io.FlowReader(fo)
         try:
-            for flow in freader.stream():
+            async for flow in flows:
                 if self.filter and not self.filter(flow):
                     continue
                 await ctx.master.load_flow(flow)
@@ -59,12 +94,17 @@ class ReadFile:
 
     async def load_flows_from_path(self, path: str) -> int:
         path = os.path.expanduser(path)
+        processes = ctx.options.readfile_processes
         try:
-            with open(path, "rb") as f:
-                return await self.load_flows(f)
+            # Pipes cannot be split into segments, and files of a single
+            # segment are not worth the worker processes.
+            if processes == 1 or not io.is_splittable(path):
+                with open(path, "rb") as f:
+                    return await self.load_flows(f)
         except IOError as e:
             ctx.log.error("Cannot load flows: {}".format(e))
             raise exceptions.FlowReadException(str(e)) from e
+        return await self._load(self._stream_parallel(path, processes))
 
     async def doread(self, rfile):
         self.is_reading = True
@@ -25,24 +25,44 @@ class Save:
             "save_stream_filter", typing.Optional[str], None,
             "Filter which flows are written to file."
         )
+        loader.add_option(
+            "save_indexed", bool, False,
+            """
+            Write an index to the end of saved flow files, so that they can
+            be listed without reading every flow.
+            """
+        )
 
     def open_file(self, path):
         if path.startswith("+"):
             path = path[1:]
-            mode = "ab"
+            # Indexed writers need to read the flows they append to.
+            mode = "a+b" if ctx.options.save_indexed else "ab"
         else:
             mode = "wb"
         path = os.path.expanduser(path)
+        if mode == "wb":
+            # Flows loaded lazily from this file must not lose their data.
+            io.load_pending(path)
         return open(path, mode)
 
     def start_stream_to_path(self, path, flt):
         try:
             f = self.open_file(path)
-        except IOError as v:
+        except (IOError, exceptions.FlowReadException) as v:
+            raise exceptions.OptionsError(str(v))
+        try:
+            self.stream = self.make_writer(f, flt)
+        except (IOError, exceptions.FlowReadException) as v:
+            f.close()
             raise exceptions.OptionsError(str(v))
-        self.stream = io.FilteredFlowWriter(f, flt)
         self.active_flows = set()
 
+    def make_writer(self, f, flt):
+        if ctx.options.save_indexed:
+            return io.IndexedFlowWriter(f, flt)
+        return io.FilteredFlowWriter(f, flt)
+
     def configure(self, updated):
         # We're already streaming - stop the previous stream and restart
         if "save_stream_filter" in updated:
@@ -54,7 +74,7 @@ class Save:
                     )
             else:
                 self.filt = None
-        if "save_stream_file" in updated or "save_stream_filter" in updated:
+        if "save_stream_file" in updated or "save_stream_filter" in updated or "save_indexed" in updated:
             if self.stream:
                 self.done()
             if ctx.options.save_stream_file:
@@ -68,12 +88,18 @@ class Save:
         """
         try:
             f = self.open_file(path)
-        except IOError as v:
+        except (IOError, exceptions.FlowReadException) as v:
+            raise exceptions.CommandError(v) from v
+        try:
+            stream = self.make_writer(f, None)
+            for i in flows:
+                stream.add(i)
+            if isinstance(stream, io.IndexedFlowWriter):
+                stream.close()
+        except (IOError, exceptions.FlowReadException) as v:
             raise exceptions.CommandError(v) from v
-        stream = io.FlowWriter(f)
-        for i in flows:
-            stream.add(i)
-        f.close()
+        finally:
+            f.close()
         ctx.log.alert("Saved %s flows." % len(flows))
 
     def tcp_start(self, flow):
@@ -108,5 +134,7 @@ class Save:
             for f in self.active_flows:
                 self.stream.add(f)
             self.active_flows = set([])
+            if isinstance(self.stream, io.IndexedFlowWriter):
+                self.stream.close()
             self.stream.fo.close()
             self.stream = None
@@ -54,7 +54,7 @@ def script_error_handler(path, exc, msg="", tb=False):
     log_msg = "in script {}:{} {}".format(path, lineno, exception)
     if tb:
         etype, value, tback = sys.exc_info()
-        tback = addonmanager.cut_traceback(tback, "invoke_addon")
+        tback = addonmanager.cut_traceback(tback, "_invoke")
         log_msg = log_msg + "\n" + "".join(traceback.format_exception(etype, value, tback))
     ctx.log.error(log_msg)
 
@@ -113,6 +113,7 @@ class Script:
                 )
             except exceptions.OptionsError as e:
                 script_error_handler(self.fullpath, e, msg=str(e))
+        ctx.master.addons.invalidate()
 
     async def watcher(self):
         last_mtime = 0
@@ -204,6 +205,7 @@ class ScriptLoader:
                     newscripts.append(sc)
 
             self.addons = ordered
+            ctx.master.addons.invalidate()
 
             for s in newscripts:
                 ctx.master.addons.register(s)
@@ -1,4 +1,5 @@
 import hashlib
+import os
 import typing
 import urllib
 
@@ -10,8 +11,17 @@ from mitmproxy import flow
 from mitmproxy import io
 
 
+class FlowRef(typing.NamedTuple):
+    """
+        A flow in a replay file that is read from disk when it is needed.
+    """
+    path: str
+    offset: int
+    has_response: bool
+
+
 class ServerPlayback:
-    flowmap: typing.Dict[typing.Hashable, typing.List[http.HTTPFlow]]
+    flowmap: typing.Dict[typing.Hashable, typing.List[typing.Union[http.HTTPFlow, FlowRef]]]
     configured: bool
 
     def __init__(self):
@@ -78,6 +88,14 @@ class ServerPlayback:
             to replay.
             """
         )
+        loader.add_option(
+            "server_replay_lazy", bool, False,
+            """
+            Keep only request fingerprints and file offsets of server replay
+            files in memory, and read saved responses from disk when they are
+            replayed. The files must not change while replaying.
+            """
+        )
 
     @command.command("replay.server")
     def load_flows(self, flows: typing.Sequence[flow.Flow]) -> None:
@@ -94,10 +112,36 @@ class ServerPlayback:
     @command.command("replay.server.file")
     def load_file(self, path: mitmproxy.types.Path) -> None:
         try:
-            flows = io.read_flows_from_paths([path])
+            self.load_paths([path])
         except exceptions.FlowReadException as e:
             raise exceptions.CommandError(str(e))
-        self.load_flows(flows)
+
+    def load_paths(self, paths: typing.Sequence[str]) -> None:
+        """
+            Replay server responses from files. With server_replay_lazy, only
+            references to their flows are kept. The files are read in a
+            single pass, and replay state is only replaced once all of them
+            have been read successfully.
+
+            Raises:
+                FlowReadException, if any error occurs.
+        """
+        if not ctx.options.server_replay_lazy:
+            self.load_flows(io.read_flows_from_paths(paths))
+            return
+        flowmap: typing.Dict[typing.Hashable, typing.List[FlowRef]] = {}
+        for path in paths:
+            path = os.path.expanduser(path)
+            try:
+                with open(path, "rb") as fo:
+                    for offset, f in io.FlowReader(fo).stream_offsets():
+                        if isinstance(f, http.HTTPFlow):
+                            lst = flowmap.setdefault(self._hash(f), [])
+                            lst.append(FlowRef(path, offset, f.response is not None))
+            except IOError as e:
+                raise exceptions.FlowReadException(e.strerror)
+        self.flowmap = flowmap
+        ctx.master.addons.trigger("update", [])
 
     @command.command("replay.server.stop")
     def clear(self) -> None:
@@ -164,18 +208,21 @@ class ServerPlayback:
         """
             Returns the next flow object, or None if no matching flow was
             found.
+
+            Raises:
+                FlowReadException, if a flow cannot be read from its replay file.
         """
         hash = self._hash(flow)
         if hash in self.flowmap:
             if ctx.options.server_replay_nopop:
                 return next((
-                    flow
+                    self._resolve(flow)
                     for flow in self.flowmap[hash]
-                    if flow.response
+                    if self._has_response(flow)
                 ), None)
             else:
                 ret = self.flowmap[hash].pop(0)
-                while not ret.response:
+                while not self._has_response(ret):
                     if self.flowmap[hash]:
                         ret = self.flowmap[hash].pop(0)
                     else:
@@ -183,22 +230,37 @@ class ServerPlayback:
                         return None
                 if not self.flowmap[hash]:
                     del self.flowmap[hash]
-                return ret
+                return self._resolve(ret)
         else:
             return None
 
+    @staticmethod
+    def _has_response(f: typing.Union[http.HTTPFlow, FlowRef]) -> bool:
+        if isinstance(f, FlowRef):
+            return f.has_response
+        return bool(f.response)
+
+    @staticmethod
+    def _resolve(f: typing.Union[http.HTTPFlow, FlowRef]) -> http.HTTPFlow:
+        if isinstance(f, FlowRef):
+            return typing.cast(http.HTTPFlow, io.read_flow_at(f.path, f.offset))
+        return f
+
     def configure(self, updated):
         if not self.configured and ctx.options.server_replay:
             self.configured = True
             try:
-                flows = io.read_flows_from_paths(ctx.options.server_replay)
+                self.load_paths(ctx.options.server_replay)
             except exceptions.FlowReadException as e:
                 raise exceptions.OptionsError(str(e))
-            self.load_flows(flows)
 
     def request(self, f: http.HTTPFlow) -> None:
         if self.flowmap:
-            rflow = self.next_flow(f)
+            try:
+                rflow = self.next_flow(f)
+            except exceptions.FlowReadException as e:
+                ctx.log.error("server_playback: {}".format(e))
+                rflow = None
             if rflow:
                 assert rflow.response
                 response = rflow.response.copy()
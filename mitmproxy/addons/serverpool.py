@@ -0,0 +1,50 @@
+import asyncio
+import typing
+
+from mitmproxy import command
+from mitmproxy import ctx
+from mitmproxy.proxy import pool
+
+
+class ServerPool:
+    """
+        Closes expired connections in the pool of idle upstream connections,
+        and reports its statistics.
+    """
+    # Seconds between two reaps.
+    interval = 1
+
+    def __init__(self):
+        self.reaper: typing.Optional[asyncio.Task] = None
+
+    def _pool(self) -> typing.Optional[pool.ServerConnectionPool]:
+        config = getattr(ctx.master.server, "config", None)
+        return getattr(config, "server_pool", None)
+
+    async def reap(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            p = self._pool()
+            if p:
+                p.reap()
+
+    def running(self):
+        self.reaper = asyncio.get_event_loop().create_task(self.reap())
+
+    def done(self):
+        if self.reaper:
+            self.reaper.cancel()
+            self.reaper = None
+
+    @command.command("proxy.server_pool.stats")
+    def stats(self) -> str:
+        """
+            Idle connections and hits, misses and evictions of the upstream
+            connection pool.
+        """
+        p = self._pool()
+        if p is None:
+            return "No server connection pool."
+        return "idle: {}, hits: {}, misses: {}, evictions: {}".format(
+            len(p), p.hits, p.misses, p.evictions
+        )
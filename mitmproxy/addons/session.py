@@ -1,17 +1,21 @@
 import collections
+import functools
+import heapq
+import queue
+import re
 import tempfile
 import asyncio
 import typing
 import bisect
 import shutil
 import sqlite3
-import copy
 import os
 
 from mitmproxy import flowfilter
 from mitmproxy import types
 from mitmproxy import http
 from mitmproxy import ctx
+from mitmproxy.coretypes import basethread
 from mitmproxy.io import protobuf
 from mitmproxy.exceptions import SessionLoadException, CommandError
 from mitmproxy.utils.data import pkg_data
@@ -29,12 +33,131 @@ class KeyifyList(object):
         return self.key(self.inner[k])
 
 
-# Could be implemented using async libraries
+# Upgraded sessions have the metadata columns after the content column.
+FLOW_COLUMNS = (
+    "id, timestamp_start, method, host, pretty_host, url, pretty_url, "
+    "status_code, request_size, response_size, content"
+)
+
+
+class SessionWriter(basethread.BaseThread):
+    """
+    Writes batches of flows to the session database on its own connection,
+    so that the event loop never waits for a commit.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__("SessionWriter ({})".format(path), daemon=True)
+        self.path = path
+        self.queue: queue.Queue = queue.Queue()
+        self.error: typing.Optional[Exception] = None
+
+    def run(self):
+        con = sqlite3.connect(self.path)
+        try:
+            while True:
+                batch = self.queue.get()
+                try:
+                    if batch is None:
+                        return
+                    flow_rows, body_rows = batch
+                    with con:
+                        con.executemany("DELETE FROM body WHERE flow_id = ?;", [(r[0],) for r in flow_rows])
+                        con.executemany(
+                            f"INSERT OR REPLACE INTO flow ({FLOW_COLUMNS}) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                            flow_rows
+                        )
+                        con.executemany("INSERT INTO body (flow_id, type_id, content) VALUES(?, ?, ?);", body_rows)
+                except sqlite3.Error as e:
+                    self.error = e
+                finally:
+                    self.queue.task_done()
+        finally:
+            con.close()
+
+
+@functools.lru_cache(maxsize=128)
+def _compile(pattern: str, flags: int) -> typing.Pattern:
+    return re.compile(pattern, flags)
+
+
+def _search(pattern: str, flags: int, value: typing.Optional[str]) -> bool:
+    return value is not None and bool(_compile(pattern, flags).search(value))
+
+
+def _sql_filter(flt) -> typing.Optional[typing.Tuple[str, list]]:
+    """
+    Translate a filter expression into an equivalent SQL condition on the
+    metadata columns of the flow table, or return None if that is not
+    possible.
+    """
+    rex_columns = {
+        flowfilter.FMethod: "method",
+        flowfilter.FUrl: "pretty_url",
+    }
+    if isinstance(flt, flowfilter.FHTTP):
+        return "1", []
+    if isinstance(flt, flowfilter.FReq):
+        return "status_code IS NULL", []
+    if isinstance(flt, flowfilter.FResp):
+        return "status_code IS NOT NULL", []
+    if isinstance(flt, flowfilter.FCode):
+        return "status_code IS ?", [flt.num]
+    if type(flt) in rex_columns:
+        return f"mitm_search(?, ?, {rex_columns[type(flt)]})", [flt.expr, flt.flags]
+    if isinstance(flt, flowfilter.FDomain):
+        return "(mitm_search(?, ?, host) OR mitm_search(?, ?, pretty_host))", [flt.expr, flt.flags] * 2
+    if isinstance(flt, flowfilter.FNot):
+        inner = _sql_filter(flt.itm)
+        if inner:
+            return f"NOT {inner[0]}", inner[1]
+        return None
+    if isinstance(flt, (flowfilter.FAnd, flowfilter.FOr)):
+        parts = [_sql_filter(i) for i in flt.lst]
+        if any(p is None for p in parts):
+            return None
+        op = " AND " if isinstance(flt, flowfilter.FAnd) else " OR "
+        return "(" + op.join(p[0] for p in parts) + ")", [v for p in parts for v in p[1]]
+    return None
+
+
+def _sql_prefilter(flt) -> typing.Tuple[typing.Optional[str], list, bool]:
+    """
+    Like _sql_filter, but for conjunctions with some operands that cannot be
+    translated, return a condition for the others. The last element of the
+    returned tuple is True if the condition is exact.
+    """
+    sql = _sql_filter(flt)
+    if sql:
+        return sql[0], sql[1], True
+    if isinstance(flt, flowfilter.FAnd):
+        parts = [p for p in map(_sql_filter, flt.lst) if p]
+        if parts:
+            return " AND ".join(p[0] for p in parts), [v for p in parts for v in p[1]], False
+    return None, [], False
+
+
+def _needs_bodies(flt) -> bool:
+    if isinstance(flt, (flowfilter.FBod, flowfilter.FBodRequest, flowfilter.FBodResponse)):
+        return True
+    if isinstance(flt, (flowfilter.FAnd, flowfilter.FOr)):
+        return any(_needs_bodies(i) for i in flt.lst)
+    if isinstance(flt, flowfilter.FNot):
+        return _needs_bodies(flt.itm)
+    return False
+
+
 class SessionDB:
     """
     This class wraps connection to DB
     for Sessions and handles creation,
     retrieving and insertion in tables.
+
+    Sortable and filterable metadata is kept in indexed columns of the flow
+    table. Bodies larger than content_threshold are kept in the body table
+    and only loaded on request. Writes are batched and committed by a
+    SessionWriter thread; the database runs in WAL mode so that we can read
+    while it writes.
     """
     content_threshold = 1000
     type_mappings = {
@@ -43,6 +166,12 @@ class SessionDB:
             2: "response"
         }
     }
+    order_columns = {
+        "time": "IFNULL(timestamp_start, 0)",
+        "method": "method",
+        "url": "url",
+        "size": "request_size + response_size",
+    }
 
     def __init__(self, db_path=None):
         """
@@ -53,12 +182,11 @@ class SessionDB:
         self.live_components: typing.Dict[str, tuple] = {}
         self.tempdir: tempfile.TemporaryDirectory = None
         self.con: sqlite3.Connection = None
-        # This is used for fast look-ups over bodies already dumped to database.
-        # This permits to enforce one-to-one relationship between flow and body table.
-        self.body_ledger: typing.Set[str] = set()
+        self.writer: SessionWriter = None
         self.id_ledger: typing.Set[str] = set()
         if db_path is not None and os.path.isfile(db_path):
             self._load_session(db_path)
+            path = db_path
         else:
             if db_path:
                 path = db_path
@@ -67,12 +195,26 @@ class SessionDB:
                 path = os.path.join(self.tempdir, 'tmp.sqlite')
             self.con = sqlite3.connect(path)
             self._create_session()
+        self.con.execute("PRAGMA journal_mode=WAL;")
+        self.con.create_function("mitm_search", 3, _search)
+        self.id_ledger.update(fid for fid, in self.con.execute("SELECT id FROM flow;"))
+        self.writer = SessionWriter(path)
+        self.writer.start()
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        if self.writer:
+            self.writer.queue.put(None)
+            self.writer.join()
+            self.writer = None
         if self.con:
             self.con.close()
+            self.con = None
         if self.tempdir:
             shutil.rmtree(self.tempdir)
+            self.tempdir = None
 
     def __contains__(self, fid):
         return fid in self.id_ledger
@@ -84,6 +226,42 @@ class SessionDB:
         if not self.is_session_db(path):
             raise SessionLoadException('Given path does not point to a valid Session')
         self.con = sqlite3.connect(path)
+        columns = [r[1] for r in self.con.execute("PRAGMA table_info(flow);")]
+        if "timestamp_start" not in columns:
+            self._upgrade_session()
+
+    def _upgrade_session(self):
+        """
+        Sessions from before the metadata columns only have id and content in
+        the flow table. Add the columns and backfill them from the stored flows.
+        Bodies in the body table were cleared from the flow, so their sizes
+        are taken from there. The upgrade runs in a single transaction.
+        """
+        script_path = pkg_data.path("io/sql/session_upgrade.sql")
+        with open(script_path, 'r') as qry:
+            self.con.executescript(qry.read())
+        sizes = {
+            (fid, type_id): size
+            for fid, type_id, size in self.con.execute("SELECT flow_id, type_id, LENGTH(content) FROM body;")
+        }
+        rows = []
+        for fid, content in self.con.execute("SELECT id, content FROM flow;"):
+            try:
+                f = protobuf.loads(content)
+            except Exception:
+                # Leave unreadable flows without metadata.
+                continue
+            metadata = list(self._metadata(f))
+            metadata[8] = sizes.get((fid, 1), metadata[8])
+            if f.response:
+                metadata[9] = sizes.get((fid, 2), metadata[9])
+            rows.append(metadata[1:] + [fid])
+        with self.con:
+            self.con.executemany(
+                "UPDATE flow SET timestamp_start = ?, method = ?, host = ?, pretty_host = ?, url = ?, "
+                "pretty_url = ?, status_code = ?, request_size = ?, response_size = ? WHERE id = ?;",
+                rows
+            )
 
     def _create_session(self):
         script_path = pkg_data.path("io/sql/session_create.sql")
@@ -109,8 +287,9 @@ class SessionDB:
                 c.close()
                 return True
         except sqlite3.Error:
-            if c:
-                c.close()
+            pass
+        if c:
+            c.close()
         return False
 
     def _disassemble(self, flow):
@@ -143,57 +322,107 @@ class SessionDB:
                 flow.server_conn.via.rfile, flow.server_conn.via.wfile, flow.server_conn.via.reply = via
         return flow
 
+    @staticmethod
+    def _metadata(f: http.HTTPFlow) -> tuple:
+        req, resp = f.request, f.response
+        return (
+            f.id,
+            req.timestamp_start,
+            req.method,
+            req.host,
+            req.pretty_host,
+            req.url,
+            req.pretty_url,
+            resp.status_code if resp else None,
+            len(req.raw_content or b""),
+            len(resp.raw_content or b"") if resp else 0,
+        )
+
     def store_flows(self, flows):
+        """
+        Queue flows for writing. The flows are serialized immediately, so
+        later changes are not picked up until they are stored again.
+        """
         body_buf = []
         flow_buf = []
         for flow in flows:
             self.id_ledger.add(flow.id)
             self._disassemble(flow)
-            f = copy.copy(flow)
-            f.request = copy.deepcopy(flow.request)
-            if flow.response:
-                f.response = copy.deepcopy(flow.response)
-            f.id = flow.id
-            if len(f.request.content) > self.content_threshold and f.id not in self.body_ledger:
-                body_buf.append((f.id, 1, f.request.content))
-                f.request.content = b""
-                self.body_ledger.add(f.id)
-            if f.response and f.id not in self.body_ledger:
-                if len(f.response.content) > self.content_threshold:
-                    body_buf.append((f.id, 2, f.response.content))
-                    f.response.content = b""
-            flow_buf.append((f.id, protobuf.dumps(f)))
-        self.con.executemany("INSERT OR REPLACE INTO flow VALUES(?, ?);", flow_buf)
-        if body_buf:
-            self.con.executemany("INSERT INTO body (flow_id, type_id, content) VALUES(?, ?, ?);", body_buf)
-        self.con.commit()
-
-    def retrieve_flows(self, ids=None):
-        flows = []
-        with self.con as con:
-            if not ids:
-                sql = "SELECT f.content, b.type_id, b.content " \
-                      "FROM flow f " \
-                      "LEFT OUTER JOIN body b ON f.id = b.flow_id;"
-                rows = con.execute(sql).fetchall()
-            else:
-                sql = "SELECT f.content, b.type_id, b.content " \
-                      "FROM flow f " \
-                      "LEFT OUTER JOIN body b ON f.id = b.flow_id " \
-                      f"AND f.id IN ({','.join(['?' for _ in range(len(ids))])});"
-                rows = con.execute(sql, ids).fetchall()
-            for row in rows:
-                flow = protobuf.loads(row[0])
-                if row[1]:
-                    typ = self.type_mappings["body"][row[1]]
-                    if typ and row[2]:
-                        setattr(getattr(flow, typ), "content", row[2])
-                flow = self._reassemble(flow)
-                flows.append(flow)
+            pf = protobuf.dump_http(flow)
+            for type_id, typ in self.type_mappings["body"].items():
+                if pf.HasField(typ) and len(getattr(pf, typ).content) > self.content_threshold:
+                    body_buf.append((flow.id, type_id, getattr(pf, typ).content))
+                    getattr(pf, typ).ClearField("content")
+            flow_buf.append(self._metadata(flow) + (pf.SerializeToString(),))
+        self.writer.queue.put((flow_buf, body_buf))
+
+    def flush(self):
+        """
+        Wait until all queued flows are committed.
+        """
+        self.writer.queue.join()
+        if self.writer.error:
+            e, self.writer.error = self.writer.error, None
+            raise e
+
+    def query(
+        self, order: str, where: typing.Optional[str] = None, params: typing.Sequence = ()
+    ) -> typing.List[typing.Tuple[typing.Any, str]]:
+        """
+        Return (order value, id) pairs for the committed flows matching an
+        SQL condition, sorted by the given view order.
+        """
+        col = self.order_columns[order]
+        sql = f"SELECT {col}, id FROM flow"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {col}, id;"
+        return self.con.execute(sql, params).fetchall()
+
+    def _chunks(self, ids, size=500):
+        # Stay below SQLITE_MAX_VARIABLE_NUMBER.
+        ids = list(ids)
+        for i in range(0, len(ids), size):
+            yield ids[i:i + size]
+
+    def retrieve_flows(self, ids=None, bodies=True):
+        """
+        Load committed flows by id, or all of them if ids is None. If bodies
+        is False, bodies stored in the body table are not loaded; use
+        load_bodies.
+        """
+        if ids is None:
+            rows = self.con.execute("SELECT content FROM flow;").fetchall()
+        else:
+            rows = []
+            for chunk in self._chunks(ids):
+                rows += self.con.execute(
+                    f"SELECT content FROM flow WHERE id IN ({','.join('?' * len(chunk))});", chunk
+                ).fetchall()
+        flows = [self._reassemble(protobuf.loads(row[0])) for row in rows]
+        if bodies:
+            self.load_bodies(flows)
         return flows
 
+    def load_bodies(self, flows):
+        """
+        Load the bodies of flows retrieved with bodies=False.
+        """
+        by_id = {f.id: f for f in flows}
+        for chunk in self._chunks(by_id):
+            rows = self.con.execute(
+                "SELECT flow_id, type_id, content FROM body "
+                f"WHERE flow_id IN ({','.join('?' * len(chunk))});", chunk
+            )
+            for fid, type_id, content in rows:
+                message = getattr(by_id[fid], self.type_mappings["body"][type_id])
+                if message is not None and content:
+                    message.content = content
+
     def clear(self):
+        self.flush()
         self.con.executescript("DELETE FROM body; DELETE FROM annotation; DELETE FROM flow;")
+        self.id_ledger.clear()
 
 
 matchall = flowfilter.parse(".")
@@ -215,6 +444,8 @@ class Session:
     def __init__(self):
         self.db_store: SessionDB = None
         self._hot_store: collections.OrderedDict = collections.OrderedDict()
+        # Flows handed to the database writer, but not committed yet.
+        self._writing: typing.Dict[str, http.HTTPFlow] = {}
         self._order_store: typing.Dict[str, typing.Dict[str, typing.Union[int, float, str, None]]] = {}
         self._view: typing.List[typing.Tuple[typing.Union[int, float, str, None], str]] = []
         self.order: str = orders[0]
@@ -245,6 +476,10 @@ class Session:
             loop = asyncio.get_event_loop()
             loop.create_task(self._writer())
 
+    def done(self):
+        if self.db_store:
+            self.db_store.close()
+
     def configure(self, updated):
         if "view_order" in updated:
             self.set_order(ctx.options.view_order)
@@ -252,6 +487,7 @@ class Session:
             self.set_filter(ctx.options.view_filter)
 
     async def _writer(self):
+        loop = asyncio.get_event_loop()
         while True:
             await asyncio.sleep(self._flush_period)
             batches = -(-len(self._hot_store) // self._flush_rate)
@@ -262,8 +498,23 @@ class Session:
                 for _ in range(to_dump):
                     tof.append(self._hot_store.popitem(last=False)[1])
                 self.db_store.store_flows(tof)
+                self._writing.update((f.id, f) for f in tof)
                 batches -= 1
                 await asyncio.sleep(0.01)
+            if self._writing:
+                # Queries only see committed flows, so we serve the others from
+                # memory until the writer is done with them.
+                try:
+                    await loop.run_in_executor(None, self.db_store.flush)
+                except sqlite3.Error as e:
+                    ctx.log.error("Cannot store flows in session: {}".format(e))
+                self._writing.clear()
+
+    def _unstored(self) -> typing.Dict[str, http.HTTPFlow]:
+        """
+        Flows that are not committed to the database yet.
+        """
+        return {**self._writing, **self._hot_store}
 
     def load_view(self) -> typing.Sequence[http.HTTPFlow]:
         ids = [fid for _, fid in self._view]
@@ -278,20 +529,23 @@ class Session:
                 # A same flow could be at the same time in hot and db storage. We want the most updated version.
                 if fid in self._hot_store:
                     flows.append(self._hot_store[fid])
+                elif fid in self._writing:
+                    flows.append(self._writing[fid])
                 elif fid in self.db_store:
                     ids_from_store.append(fid)
             flows += self.db_store.retrieve_flows(ids_from_store)
         else:
-            for flow in self._hot_store.values():
-                flows.append(flow)
+            unstored = self._unstored()
+            flows += unstored.values()
             for flow in self.db_store.retrieve_flows():
-                if flow.id not in self._hot_store:
+                if flow.id not in unstored:
                     flows.append(flow)
         return flows
 
     def clear_storage(self):
         self.db_store.clear()
         self._hot_store.clear()
+        self._writing.clear()
         self._view = []
 
     def store_count(self) -> int:
@@ -330,17 +584,26 @@ class Session:
             )
         if order != self.order:
             self.order = order
-            newview = [
-                (self._order_store[t[1]][order], t[1]) for t in self._view
-            ]
-            self._view = sorted(newview)
+            self._refilter()
 
     def _refilter(self):
-        self._view = []
-        flows = self.load_storage()
-        for f in flows:
-            if self.filter(f):
-                self.update_view(f)
+        unstored = self._unstored()
+        hot = sorted(
+            (self._order_store[f.id][self.order], f.id)
+            for f in unstored.values() if self.filter(f)
+        )
+        where, params, exact = _sql_prefilter(self.filter)
+        stored = [
+            row for row in self.db_store.query(self.order, where, params)
+            if row[1] not in unstored
+        ]
+        if not exact:
+            flows = self.db_store.retrieve_flows(
+                [fid for _, fid in stored], bodies=_needs_bodies(self.filter)
+            )
+            matching = {f.id for f in flows if self.filter(f)}
+            stored = [row for row in stored if row[1] in matching]
+        self._view = list(heapq.merge(stored, hot))
 
     def set_filter(self, input_filter: typing.Optional[str]) -> None:
         filt = matchall if not input_filter else flowfilter.parse(input_filter)
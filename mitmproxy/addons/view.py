@@ -8,8 +8,12 @@ The View:
 - Exposes a settings store for flows that automatically expires if the flow is
   removed from the store.
 """
+import asyncio
 import collections
+import itertools
+import time
 import typing
+import uuid
 
 import blinker
 import sortedcontainers
@@ -23,6 +27,7 @@ from mitmproxy import ctx
 from mitmproxy import io
 from mitmproxy import http
 from mitmproxy import tcp
+from mitmproxy import websocket
 from mitmproxy.utils import human
 
 
@@ -72,11 +77,17 @@ class _OrderKey:
 
 class OrderRequestStart(_OrderKey):
     def generate(self, f: mitmproxy.flow.Flow) -> float:
+        summary = io.lazy_summary(f)
+        if summary is not None:
+            return summary["timestamp_start"]
         return f.timestamp_start
 
 
 class OrderRequestMethod(_OrderKey):
     def generate(self, f: mitmproxy.flow.Flow) -> str:
+        summary = io.lazy_summary(f)
+        if summary is not None:
+            return summary["method"]
         if isinstance(f, http.HTTPFlow):
             return f.request.method
         elif isinstance(f, tcp.TCPFlow):
@@ -87,6 +98,9 @@ class OrderRequestMethod(_OrderKey):
 
 class OrderRequestURL(_OrderKey):
     def generate(self, f: mitmproxy.flow.Flow) -> str:
+        summary = io.lazy_summary(f)
+        if summary is not None:
+            return summary["url"]
         if isinstance(f, http.HTTPFlow):
             return f.request.url
         elif isinstance(f, tcp.TCPFlow):
@@ -97,6 +111,9 @@ class OrderRequestURL(_OrderKey):
 
 class OrderKeySize(_OrderKey):
     def generate(self, f: mitmproxy.flow.Flow) -> int:
+        summary = io.lazy_summary(f)
+        if summary is not None:
+            return summary["request_size"] + (summary["response_size"] or 0)
         if isinstance(f, http.HTTPFlow):
             size = 0
             if f.request.raw_content:
@@ -115,6 +132,143 @@ class OrderKeySize(_OrderKey):
 
 matchall = flowfilter.parse("~http | ~tcp")
 
+# Refilters over more flows than this run incrementally on the event loop,
+# yielding to other tasks after every REFILTER_SLICE seconds of work.
+REFILTER_SYNC_LIMIT = 10000
+REFILTER_SLICE = 0.05
+
+
+class FlowIndex:
+    """
+        Hash indexes on the flow store, keyed on host, method, status code
+        and response content type.
+
+        candidates() answers the indexable parts of a filter expression with
+        a superset of the ids of the matching flows, so callers still have to
+        apply the filter to the candidates.
+    """
+    rex_indexes = {
+        flowfilter.FDomain: "host",
+        flowfilter.FMethod: "method",
+        flowfilter.FContentTypeResponse: "ctype",
+    }
+
+    def __init__(self) -> None:
+        self.indexes: typing.Dict[str, typing.Dict[typing.Any, typing.Set[str]]] = dict(
+            host={}, method={}, code={}, ctype={}
+        )
+        # The keys each flow is indexed under, and its insertion order.
+        self.keys: typing.Dict[str, typing.Dict[str, typing.Set]] = {}
+        self.seq: typing.Dict[str, int] = {}
+        self.counter = itertools.count()
+
+    @staticmethod
+    def _keys(f: mitmproxy.flow.Flow) -> typing.Dict[str, typing.Set]:
+        summary = io.lazy_summary(f)
+        if summary is not None:
+            return FlowIndex._summary_keys(summary)
+        if isinstance(f, websocket.WebSocketFlow):
+            # ~d matches WebSocket flows on their handshake; the other indexed
+            # filters only match HTTP flows.
+            if not f.handshake_flow:
+                return {}
+            req = f.handshake_flow.request
+            return dict(host={req.host, req.pretty_host})
+        if not isinstance(f, http.HTTPFlow):
+            return {}
+        keys = dict(
+            host={f.request.host, f.request.pretty_host},
+            method={f.request.data.method},
+        )
+        if f.response:
+            keys["code"] = {f.response.status_code}
+            keys["ctype"] = {
+                v for k, v in f.response.headers.fields if k.lower() == b"content-type"
+            }
+        return keys
+
+    @staticmethod
+    def _summary_keys(summary: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Set]:
+        """
+            The keys of a flow that has not been loaded from its dump yet.
+        """
+        keys = dict(
+            host={summary["host"], summary["pretty_host"]},
+            method={summary["method"].encode("utf-8", "surrogateescape")},
+        )
+        if summary["status_code"] is not None:
+            keys["code"] = {summary["status_code"]}
+            keys["ctype"] = set(summary["content_type"])
+        return keys
+
+    def add(self, f: mitmproxy.flow.Flow) -> None:
+        """
+            Index a flow, or re-index it if it has changed.
+        """
+        if f.id not in self.seq:
+            self.seq[f.id] = next(self.counter)
+        new = self._keys(f)
+        old = self.keys.get(f.id, {})
+        if new != old:
+            self._drop(f.id, old)
+            for name, keys in new.items():
+                for k in keys:
+                    self.indexes[name].setdefault(k, set()).add(f.id)
+            self.keys[f.id] = new
+
+    def remove(self, f: mitmproxy.flow.Flow) -> None:
+        self._drop(f.id, self.keys.pop(f.id, {}))
+        self.seq.pop(f.id, None)
+
+    def _drop(self, flow_id: str, keys: typing.Dict[str, typing.Set]) -> None:
+        for name, ks in keys.items():
+            index = self.indexes[name]
+            for k in ks:
+                ids = index[k]
+                ids.discard(flow_id)
+                if not ids:
+                    del index[k]
+
+    def clear(self) -> None:
+        for index in self.indexes.values():
+            index.clear()
+        self.keys.clear()
+        self.seq.clear()
+
+    def candidates(self, flt: flowfilter.TFilter) -> typing.Optional[typing.Set[str]]:
+        """
+            Returns the ids of the flows that may match the filter, or None
+            if the filter cannot be answered from the indexes.
+        """
+        if isinstance(flt, flowfilter.FCode):
+            return set(self.indexes["code"].get(flt.num, ()))
+        name = self.rex_indexes.get(type(flt))
+        if name:
+            # Indexed values are few, so we can afford to run the filter's
+            # regex over all of them.
+            return set().union(*(
+                ids for k, ids in self.indexes[name].items() if flt.re.search(k)
+            ))
+        if isinstance(flt, flowfilter.FAnd):
+            sets = [c for c in map(self.candidates, flt.lst) if c is not None]
+            if not sets:
+                return None
+            sets.sort(key=len)
+            return sets[0].intersection(*sets[1:])
+        if isinstance(flt, flowfilter.FOr):
+            sets = list(map(self.candidates, flt.lst))
+            if any(c is None for c in sets):
+                return None
+            return set().union(*sets)
+        return None
+
+    def sort(self, ids: typing.Iterable[str]) -> typing.List[str]:
+        """
+            Sort flow ids by insertion order.
+        """
+        return sorted(ids, key=self.seq.__getitem__)
+
+
 orders = [
     ("t", "time"),
     ("m", "method"),
@@ -163,6 +317,8 @@ class View(collections.abc.Sequence):
 
         self.focus = Focus(self)
         self.settings = Settings(self)
+        self._refilter_task: typing.Optional[asyncio.Future] = None
+        self._index = FlowIndex()
 
     def load(self, loader):
         loader.add_option(
@@ -224,14 +380,67 @@ class View(collections.abc.Sequence):
         self.settings[f][self._order_key_name()] = self.order_key(f)
         self._view.add(f)
 
-    def _refilter(self):
+    def _refilter(self, narrow: bool = False):
+        """
+            Rebuild the view from the store. If narrow is True, the current
+            filter only ever matches a subset of the flows in the view, so we
+            only need to look at those.
+
+            Large refilters run incrementally on the event loop: the view is
+            emptied, and matching flows are added chunk by chunk, each with a
+            sig_view_add. A new refilter cancels the one in flight.
+        """
+        if self._refilter_task:
+            # The view is incomplete, so we cannot narrow it down.
+            self._cancel_refilter()
+            narrow = False
+        flows = list(self._view) if narrow else self._candidates(self.filter)
         self._view.clear()
-        for i in self._store.values():
-            if self.show_marked and not i.marked:
+        try:
+            incremental = asyncio.get_event_loop().is_running()
+        except RuntimeError:  # pragma: no cover
+            incremental = False
+        if len(flows) <= REFILTER_SYNC_LIMIT or not incremental:
+            for f in flows:
+                if self.show_marked and not f.marked:
+                    continue
+                if self.filter(f):
+                    self._base_add(f)
+            self.sig_view_refresh.send(self)
+        else:
+            self.sig_view_refresh.send(self)
+            self._refilter_task = asyncio.ensure_future(self._refilter_incremental(flows))
+
+    async def _refilter_incremental(self, flows):
+        deadline = time.monotonic() + REFILTER_SLICE
+        for f in flows:
+            if time.monotonic() > deadline:
+                await asyncio.sleep(0)
+                deadline = time.monotonic() + REFILTER_SLICE
+            if self.show_marked and not f.marked:
                 continue
-            if self.filter(i):
-                self._base_add(i)
-        self.sig_view_refresh.send(self)
+            # Flows may have been removed, or added by an update, while we
+            # were waiting.
+            if f.id not in self._store or f in self._view:
+                continue
+            if self.filter(f):
+                self._base_add(f)
+                self.sig_view_add.send(self, flow=f)
+        self._refilter_task = None
+
+    def _candidates(self, flt: flowfilter.TFilter) -> typing.List[mitmproxy.flow.Flow]:
+        """
+            The flows in the store that may match the filter, in store order.
+        """
+        ids = self._index.candidates(flt)
+        if ids is None:
+            return list(self._store.values())
+        return [self._store[i] for i in self._index.sort(ids)]
+
+    def _cancel_refilter(self):
+        if self._refilter_task:
+            self._refilter_task.cancel()
+            self._refilter_task = None
 
     """ View API """
 
@@ -332,8 +541,9 @@ class View(collections.abc.Sequence):
         self.set_filter(filt)
 
     def set_filter(self, flt: typing.Optional[flowfilter.TFilter]):
+        old = self.filter
         self.filter = flt or matchall
-        self._refilter()
+        self._refilter(narrow=flowfilter.implies(self.filter, old))
 
     # View Updates
     @command.command("view.clear")
@@ -341,7 +551,9 @@ class View(collections.abc.Sequence):
         """
             Clears both the store and view.
         """
+        self._cancel_refilter()
         self._store.clear()
+        self._index.clear()
         self._view.clear()
         self.sig_view_refresh.send(self)
         self.sig_store_refresh.send(self)
@@ -354,6 +566,7 @@ class View(collections.abc.Sequence):
         for flow in self._store.copy().values():
             if not flow.marked:
                 self._store.pop(flow.id)
+                self._index.remove(flow)
 
         self._refilter()
         self.sig_store_refresh.send(self)
@@ -427,6 +640,7 @@ class View(collections.abc.Sequence):
                     self._view.remove(f)
                     self.sig_view_remove.send(self, flow=f, index=idx)
                 del self._store[f.id]
+                self._index.remove(f)
                 self.sig_store_remove.send(self, flow=f)
         if len(flows) > 1:
             ctx.log.alert("Removed %s flows" % len(flows))
@@ -452,7 +666,7 @@ class View(collections.abc.Sequence):
             filt = flowfilter.parse(flow_spec)
             if not filt:
                 raise exceptions.CommandError("Invalid flow filter: %s" % flow_spec)
-            return [i for i in self._store.values() if filt(i)]
+            return [i for i in self._candidates(filt) if filt(i)]
 
     @command.command("view.flows.create")
     def create(self, method: str, url: str) -> None:
@@ -471,19 +685,45 @@ class View(collections.abc.Sequence):
     def load_file(self, path: mitmproxy.types.Path) -> None:
         """
             Load flows into the view, without processing them with addons.
+
+            Flows from indexed dumps are listed from the index, and only
+            deserialized once they are accessed.
         """
         try:
             with open(path, "rb") as f:
-                for i in io.FlowReader(f).stream():
-                    # Do this to get a new ID, so we can load the same file N times and
-                    # get new flows each time. It would be more efficient to just have a
-                    # .newid() method or something.
-                    self.add([i.copy()])
+                reader = io.IndexedFlowReader(f) if io.is_indexed(f) else None
+                if not reader and not io.is_splittable(path):
+                    # Pipes cannot be split into segments, and files of a
+                    # single segment are not worth the worker processes.
+                    self.add([self._renew(i) for i in io.FlowReader(f).stream()])
+                    return
+            if reader:
+                # The reader keeps its own handle to the file, which is closed
+                # once all lazy flows have been loaded or dropped.
+                self.add([self._renew(i) for i in reader.lazy()])
+            else:
+                # Large files are decoded in parallel, and each segment is added
+                # as a batch as soon as it is ready.
+                for batch in io.read_flows_parallel(path, ctx.options.readfile_processes):
+                    self.add([self._renew(i) for i in batch])
         except IOError as e:
             ctx.log.error(e.strerror)
         except exceptions.FlowReadException as e:
             ctx.log.error(str(e))
 
+    @staticmethod
+    def _renew(f: mitmproxy.flow.Flow) -> mitmproxy.flow.Flow:
+        """
+            Give a flow from a file a new ID, so we can load the same file N
+            times and get new flows each time. It would be more efficient to
+            just have a .newid() method or something.
+        """
+        if io.lazy_summary(f) is None:
+            return f.copy()
+        # Copying would deserialize the flow.
+        f.id = str(uuid.uuid4())
+        return f
+
     def add(self, flows: typing.Sequence[mitmproxy.flow.Flow]) -> None:
         """
             Adds a flow to the state. If the flow already exists, it is
@@ -492,6 +732,7 @@ class View(collections.abc.Sequence):
         for f in flows:
             if f.id not in self._store:
                 self._store[f.id] = f
+                self._index.add(f)
                 if self.filter(f):
                     self._base_add(f)
                     if self.focus_follow:
@@ -526,7 +767,7 @@ class View(collections.abc.Sequence):
             Toggle whether to show marked views only.
         """
         self.show_marked = not self.show_marked
-        self._refilter()
+        self._refilter(narrow=self.show_marked)
 
     @command.command("view.properties.inbounds")
     def inbounds(self, index: int) -> bool:
@@ -593,6 +834,7 @@ class View(collections.abc.Sequence):
         """
         for f in flows:
             if f.id in self._store:
+                self._index.add(f)
                 if self.filter(f):
                     if f not in self._view:
                         self._base_add(f)
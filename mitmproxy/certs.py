@@ -1,5 +1,8 @@
+import collections
+import hashlib
 import os
 import ssl
+import threading
 import time
 import datetime
 import ipaddress
@@ -12,7 +15,7 @@ from pyasn1.codec.der.decoder import decode
 from pyasn1.error import PyAsn1Error
 import OpenSSL
 
-from mitmproxy.coretypes import serializable
+from mitmproxy.coretypes import basethread, serializable
 
 # Default expiry must not be too long: https://github.com/mitmproxy/mitmproxy/issues/815
 DEFAULT_EXP = 94608000  # = 60 * 60 * 24 * 365 * 3 = 3 years
@@ -149,10 +152,52 @@ TGeneratedCertId = typing.Tuple[typing.Optional[bytes], typing.Tuple[bytes, ...]
 TCertId = typing.Union[TCustomCertId, TGeneratedCertId]
 
 
+class _NameTrie:
+    """
+        Maps domain names, including wildcard names such as *.example.com,
+        to values. Labels are stored right to left, so a lookup walks a name
+        once instead of building all of its asterisk forms.
+    """
+
+    def __init__(self):
+        self.root: dict = {}
+
+    def __bool__(self):
+        return bool(self.root)
+
+    def __setitem__(self, name: bytes, value) -> None:
+        node = self.root
+        for label in reversed(name.split(b".")):
+            node = node.setdefault(label, {})
+        node[None] = value
+
+    def lookup(self, name: bytes):
+        """
+            Returns the value for the first of CertStore.asterisk_forms(name)
+            that is present, or None.
+        """
+        node = self.root
+        best = None
+        for i, label in enumerate(reversed(name.split(b"."))):
+            if i > 0:
+                wildcard = node.get(b"*")
+                if wildcard is not None and None in wildcard:
+                    best = wildcard[None]
+            node = node.get(label)
+            if node is None:
+                return best
+        return node.get(None, best)
+
+
 class CertStore:
 
     """
         Implements an in-memory certificate store.
+
+        Generated certificates are kept in a least recently used cache of
+        store_cap entries. If cache_dir is set, they are also written to disk
+        and read back when they are not in memory, e.g. after a restart.
+        Pregenerated certificates are kept separately, by hostname.
     """
     STORE_CAP = 100
 
@@ -161,19 +206,28 @@ class CertStore:
             default_privatekey,
             default_ca,
             default_chain_file,
-            dhparams):
+            dhparams,
+            cache_dir: typing.Optional[str] = None,
+            store_cap: int = STORE_CAP):
         self.default_privatekey = default_privatekey
         self.default_ca = default_ca
         self.default_chain_file = default_chain_file
         self.dhparams = dhparams
+        self.cache_dir = cache_dir
+        self.store_cap = store_cap
         self.certs: typing.Dict[TCertId, CertStoreEntry] = {}
-        self.expire_queue = []
-
-    def expire(self, entry):
-        self.expire_queue.append(entry)
-        if len(self.expire_queue) > self.STORE_CAP:
-            d = self.expire_queue.pop(0)
-            self.certs = {k: v for k, v in self.certs.items() if v != d}
+        self.names = _NameTrie()
+        # generated entries in least recently used order, mapped to their key in self.certs
+        self.expire_queue: "collections.OrderedDict[CertStoreEntry, TGeneratedCertId]" = collections.OrderedDict()
+        self.pregenerated: typing.Dict[bytes, CertStoreEntry] = {}
+        self.pregeneration_stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def expire(self, entry: CertStoreEntry, key: TGeneratedCertId) -> None:
+        self.expire_queue[entry] = key
+        while len(self.expire_queue) > self.store_cap:
+            _, k = self.expire_queue.popitem(last=False)
+            del self.certs[k]
 
     @staticmethod
     def load_dhparam(path):
@@ -196,7 +250,15 @@ class CertStore:
             return dh
 
     @classmethod
-    def from_store(cls, path, basename, key_size, passphrase: typing.Optional[bytes] = None):
+    def from_store(
+            cls,
+            path,
+            basename,
+            key_size,
+            passphrase: typing.Optional[bytes] = None,
+            cache_leaf_certs: bool = False,
+            store_cap: int = STORE_CAP
+    ):
         ca_path = os.path.join(path, basename + "-ca.pem")
         if not os.path.exists(ca_path):
             key, ca = cls.create_store(path, basename, key_size)
@@ -212,7 +274,11 @@ class CertStore:
                 passphrase)
         dh_path = os.path.join(path, basename + "-dhparam.pem")
         dh = cls.load_dhparam(dh_path)
-        return cls(key, ca, ca_path, dh)
+        if cache_leaf_certs:
+            cache_dir = os.path.join(path, basename + "-certs")
+        else:
+            cache_dir = None
+        return cls(key, ca, ca_path, dh, cache_dir, store_cap)
 
     @staticmethod
     @contextlib.contextmanager
@@ -306,11 +372,10 @@ class CertStore:
             any SANs, and also the list of names provided as an argument.
         """
         if entry.cert.cn:
-            self.certs[entry.cert.cn] = entry
-        for i in entry.cert.altnames:
-            self.certs[i] = entry
-        for i in names:
+            names = (entry.cert.cn, *names)
+        for i in (*entry.cert.altnames, *names):
             self.certs[i] = entry
+            self.names[i] = entry
 
     @staticmethod
     def asterisk_forms(dn: bytes) -> typing.List[bytes]:
@@ -341,35 +406,138 @@ class CertStore:
             organization: Organization name for the generated certificate.
         """
 
-        potential_keys: typing.List[TCertId] = []
-        if commonname:
-            potential_keys.extend(self.asterisk_forms(commonname))
-        for s in sans:
-            potential_keys.extend(self.asterisk_forms(s))
-        potential_keys.append(b"*")
-        potential_keys.append((commonname, tuple(sans)))
-
-        name = next(
-            filter(lambda key: key in self.certs, potential_keys),
-            None
-        )
-        if name:
-            entry = self.certs[name]
-        else:
-            entry = CertStoreEntry(
-                cert=dummy_cert(
-                    self.default_privatekey,
-                    self.default_ca,
-                    commonname,
-                    sans,
-                    organization),
-                privatekey=self.default_privatekey,
-                chain_file=self.default_chain_file)
-            self.certs[(commonname, tuple(sans))] = entry
-            self.expire(entry)
+        key = (commonname, tuple(sans))
+        with self.lock:
+            entry = self._lookup(commonname, sans)
+            if entry is None:
+                entry = self.certs.get(key)
+                if entry is not None:
+                    self.expire_queue.move_to_end(entry)
+            if entry is not None:
+                return entry.cert, entry.privatekey, entry.chain_file
+
+        cert = self._load_cached(commonname, sans, organization)
+        if cert is None:
+            cert = dummy_cert(
+                self.default_privatekey,
+                self.default_ca,
+                commonname,
+                sans,
+                organization)
+            self._store_cached(commonname, sans, organization, cert)
+        entry = CertStoreEntry(
+            cert=cert,
+            privatekey=self.default_privatekey,
+            chain_file=self.default_chain_file)
+        with self.lock:
+            # Another thread may have generated the same cert in the meantime.
+            entry = self.certs.setdefault(key, entry)
+            if entry.cert is cert:
+                self.expire(entry, key)
 
         return entry.cert, entry.privatekey, entry.chain_file
 
+    def _lookup(
+            self,
+            commonname: typing.Optional[bytes],
+            sans: typing.List[bytes]
+    ) -> typing.Optional[CertStoreEntry]:
+        """
+            Finds a manually added cert for the common name or any of the
+            SANs, in the order given by asterisk_forms.
+        """
+        if not self.names:
+            return None
+        for name in ([commonname] if commonname else []) + sans:
+            entry = self.names.lookup(name)
+            if entry is not None:
+                return entry
+        return self.names.lookup(b"*")
+
+    def _cache_path(
+            self,
+            commonname: typing.Optional[bytes],
+            sans: typing.List[bytes],
+            organization: typing.Optional[bytes]
+    ) -> typing.Optional[str]:
+        if not self.cache_dir:
+            return None
+        ca = self.default_ca.digest("sha256").replace(b":", b"").decode().lower()
+        names = b"\0".join([commonname or b"", organization or b""] + sorted(sans))
+        return os.path.join(self.cache_dir, ca[:16], hashlib.sha256(names).hexdigest() + ".pem")
+
+    def _load_cached(self, commonname, sans, organization) -> typing.Optional["Cert"]:
+        path = self._cache_path(commonname, sans, organization)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                cert = Cert.from_pem(f.read())
+        except (OSError, OpenSSL.crypto.Error):
+            return None
+        if cert.has_expired:
+            return None
+        return cert
+
+    def _store_cached(self, commonname, sans, organization, cert: "Cert") -> None:
+        path = self._cache_path(commonname, sans, organization)
+        if not path:
+            return
+        tmp = "%s.%s.tmp" % (path, threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(cert.to_pem())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def pregenerate(self, hostnames: typing.Iterable[bytes]) -> threading.Thread:
+        """
+            Generates certificates for the given hostnames on a background
+            thread, so that the first handshake for each of them does not have
+            to wait for the certificate to be signed. They are looked up with
+            get_pregenerated().
+        """
+        hostnames = list(hostnames)
+
+        def run():
+            for h in hostnames:
+                if self.pregeneration_stopped.is_set():
+                    return
+                try:
+                    entry = CertStoreEntry(*self.get_cert(h, [h]))
+                except (ValueError, OpenSSL.crypto.Error):
+                    continue
+                with self.lock:
+                    self.pregenerated[h] = entry
+
+        t = basethread.BaseThread("CertStore pregeneration", target=run, daemon=True)
+        t.start()
+        return t
+
+    def stop_pregeneration(self) -> None:
+        """
+            Stop generating certificates in the background, e.g. because the
+            store is being replaced.
+        """
+        self.pregeneration_stopped.set()
+
+    def get_pregenerated(
+            self,
+            hostname: bytes
+    ) -> typing.Optional[typing.Tuple["Cert", OpenSSL.SSL.PKey, str]]:
+        """
+            Returns the (cert, privkey, cert_chain) tuple pregenerated for
+            hostname, or None if there is none yet or a manually added cert
+            matches the hostname.
+        """
+        with self.lock:
+            entry = self.pregenerated.get(hostname)
+            if entry is None or self._lookup(hostname, []) is not None:
+                return None
+            return entry.cert, entry.privatekey, entry.chain_file
+
 
 class _GeneralName(univ.Choice):
     # We only care about dNSName and iPAddress
@@ -191,6 +191,9 @@ class ServerConnection(tcp.TCPClient, stateobject.StateObject):
         self.timestamp_tcp_setup = None
         self.timestamp_tls_setup = None
         self.channel = channel
+        # True while an HTTP/1 connection is idle between two requests,
+        # so that it can be handed to the server pool.
+        self.reusable = False
 
     def connected(self):
         return bool(self.connection) and not self.finished
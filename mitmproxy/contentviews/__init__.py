@@ -13,12 +13,15 @@ metadata depend on the protocol in use. For HTTP, the message headers are
 passed as the ``headers`` keyword argument. For HTTP requests, the query
 parameters are passed as the ``query`` keyword argument.
 """
+import collections
+import threading
 import traceback
-from typing import Dict, Optional  # noqa
+from typing import Any, Dict, Iterator, Optional, Tuple  # noqa
 from typing import List  # noqa
 
 from mitmproxy import exceptions
 from mitmproxy.net import http
+from mitmproxy.net.http import encoding
 from mitmproxy.utils import strutils
 from . import (
     auto, raw, hex, json, xml_html, wbxml, javascript, css,
@@ -29,6 +32,9 @@ from .base import View, KEY_MAX, format_text, format_dict, TViewResult
 views: List[View] = []
 content_types_map: Dict[str, List[View]] = {}
 
+STREAM_SIZE = 256 * 1024
+"""Compressed message bodies larger than this are decoded while their view is rendered."""
+
 
 def get(name: str) -> Optional[View]:
     for i in views:
@@ -49,6 +55,9 @@ def add(view: View) -> None:
         l = content_types_map.setdefault(ct, [])
         l.append(view)
 
+    auto.choose_view.cache_clear()
+    render_cache.clear()
+
 
 def remove(view: View) -> None:
     for ct in view.content_types:
@@ -59,6 +68,8 @@ def remove(view: View) -> None:
             del content_types_map[ct]
 
     views.remove(view)
+    auto.choose_view.cache_clear()
+    render_cache.clear()
 
 
 def safe_to_print(lines, encoding="utf8"):
@@ -75,28 +86,206 @@ def safe_to_print(lines, encoding="utf8"):
         yield clean_line
 
 
+class RenderedLines:
+    """
+    A content generator that remembers the lines it has produced, so that it
+    can be iterated again without rendering the content a second time.
+    Lines are only rendered as far as they are consumed.
+
+    size estimates the memory held: base_size for the content the generator
+    works on, plus the lines rendered so far.
+    """
+
+    def __init__(self, lines: Iterator, base_size: int = 0) -> None:
+        self._lines: Optional[Iterator] = lines
+        self._rendered: list = []
+        self.size = base_size
+        self.failed = False
+        self.lock = threading.Lock()
+        # The cache that accounts for our size, if any.
+        self.cache: Optional["RenderCache"] = None
+
+    def _advance(self, i: int) -> bool:
+        with self.lock:
+            if i < len(self._rendered):
+                return True
+            if self._lines is None:
+                return False
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                self._lines = None
+                return False
+            except Exception:
+                self._lines = None
+                self.failed = True
+                raise
+            self._rendered.append(line)
+            grown = 64 + sum(len(text) for _, text in line)
+            self.size += grown
+            cache = self.cache
+        if cache is not None:
+            cache.grow(self, grown)
+        return True
+
+    def __iter__(self):
+        i = 0
+        while self._advance(i):
+            yield self._rendered[i]
+            i += 1
+
+
+class RenderCache:
+    """
+    A process-wide LRU cache of rendered message content views.
+
+    Entries are keyed on the flow id, the message side and the view name.
+    Each entry holds a reference to the raw content it was rendered from and
+    a copy of the message headers, and is only used while both are
+    unchanged, so editing a message invalidates its cached views. The total
+    size of the entries, which includes the content they keep alive, is
+    bounded by budget; least recently used entries are evicted first. As
+    lines are rendered lazily, entries report their growth to the cache.
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.size = 0
+        self.entries: "collections.OrderedDict[Tuple[str, str, str], Tuple[Any, ...]]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _remove(self, key) -> None:
+        lines = self.entries.pop(key)[3]
+        lines.cache = None
+        self.size -= lines.size
+
+    def _evict(self) -> None:
+        while self.size > self.budget and self.entries:
+            self._remove(next(iter(self.entries)))
+
+    def grow(self, lines: RenderedLines, size: int) -> None:
+        with self.lock:
+            if lines.cache is self:
+                self.size += size
+                self._evict()
+
+    def get(self, key, raw, fingerprint):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not raw or entry[1] != fingerprint or entry[3].failed:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[2], entry[3], entry[4]
+
+    def put(self, key, raw, fingerprint, description: str, lines: RenderedLines, error: Optional[str]) -> None:
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (raw, fingerprint, description, lines, error)
+            # Hold the lines' lock, so that no growth is lost or counted twice.
+            with lines.lock:
+                lines.cache = self
+                self.size += lines.size
+            self._evict()
+
+    def clear(self) -> None:
+        with self.lock:
+            for lines in self.entries.values():
+                lines[3].cache = None
+            self.entries.clear()
+            self.size = 0
+
+
+render_cache = RenderCache(32 * 1024 * 1024)
+
+
 def get_message_content_view(viewname, message, flow):
     """
     Like get_content_view, but also handles message encoding.
+
+    Views of a flow's request and response are cached in render_cache,
+    so rendering the same view again is cheap.
+    """
+    if flow is not None and message is getattr(flow, "request", None):
+        side = "request"
+    elif flow is not None and message is getattr(flow, "response", None):
+        side = "response"
+    else:
+        return _get_message_content_view(viewname, message, flow)
+
+    key = (flow.id, side, viewname)
+    raw = message.raw_content
+    fingerprint = (message.headers.fields, getattr(message, "path", None))
+    cached = render_cache.get(key, raw, fingerprint)
+    if cached is not None:
+        description, lines, error = cached
+    else:
+        description, lines, error = _get_message_content_view(viewname, message, flow)
+        # The view's generator keeps the raw and the decoded content alive.
+        if _stream_encoding(message):
+            content = None
+        else:
+            content = message.get_content(strict=False)
+        base_size = len(raw or b"") + (len(content) if content is not None and content is not raw else 0)
+        lines = RenderedLines(lines, base_size)
+        render_cache.put(key, raw, fingerprint, description, lines, error)
+    return description, iter(lines), error
+
+
+def _stream_encoding(message) -> Optional[str]:
+    """
+    The content encoding to decode incrementally while rendering, if the
+    message body is large and compressed.
+    """
+    if not isinstance(message, http.Message) or message.raw_content is None:
+        return None
+    ce = message.headers.get("content-encoding")
+    if ce in encoding.COMPRESSED_ENCODINGS and len(message.raw_content) > STREAM_SIZE:
+        return ce
+    return None
+
+
+def _guard(lines):
+    """
+    Ends a content generator with an error line if it fails midway, e.g.
+    because a streamed body turns out to be corrupt.
     """
+    try:
+        yield from lines
+    except Exception as e:
+        yield [("error", "Couldn't render the rest of the content: {}".format(e))]
+
+
+def _get_message_content_view(viewname, message, flow):
     viewmode = get(viewname)
     if not viewmode:
         viewmode = get("auto")
-    try:
-        content = message.content
-    except ValueError:
-        content = message.raw_content
-        enc = "[cannot decode]"
+    ce = _stream_encoding(message)
+    if ce:
+        # Views that render incrementally only ever decode as much of the
+        # body as they have been asked to show.
+        chunks = encoding.decode_iter(message.raw_content, ce, max_size=encoding.max_decoded_size)
+        enc: Optional[str] = "[decoded {}]".format(ce)
     else:
-        if isinstance(message, http.Message) and content != message.raw_content:
-            enc = "[decoded {}]".format(
-                message.headers.get("content-encoding")
-            )
+        try:
+            content = message.content
+        except ValueError:
+            content = message.raw_content
+            enc = "[cannot decode]"
         else:
-            enc = None
+            if isinstance(message, http.Message) and content != message.raw_content:
+                enc = "[decoded {}]".format(
+                    message.headers.get("content-encoding")
+                )
+            else:
+                enc = None
 
-    if content is None:
-        return "", iter([[("error", "content missing")]]), None
+        if content is None:
+            return "", iter([[("error", "content missing")]]), None
+        chunks = iter([content])
 
     metadata = {}
     if isinstance(message, http.Request):
@@ -106,9 +295,14 @@ def get_message_content_view(viewname, message, flow):
     metadata["message"] = message
     metadata["flow"] = flow
 
-    description, lines, error = get_content_view(
-        viewmode, content, **metadata
+    description, lines, error = _render(
+        lambda: viewmode.stream(chunks, **metadata),
+        viewmode,
+        lambda: message.get_content(strict=False),
+        metadata
     )
+    if ce:
+        lines = _guard(lines)
 
     if enc:
         description = "{} {}".format(enc, description)
@@ -141,10 +335,17 @@ def get_content_view(viewmode: View, data: bytes, **metadata):
             the exception is returned in error and the flow is formatted in raw mode.
             In contrast to calling the views directly, text is always safe-to-print unicode.
     """
+    return _render(lambda: viewmode(data, **metadata), viewmode, lambda: data, metadata)
+
+
+def _render(render, viewmode: View, get_data, metadata):
+    """
+        Run a view, and fall back to the Raw view of get_data() if it fails.
+    """
     try:
-        ret = viewmode(data, **metadata)
+        ret = render()
         if ret is None:
-            ret = "Couldn't parse: falling back to Raw", get("Raw")(data, **metadata)[1]
+            ret = "Couldn't parse: falling back to Raw", get("Raw")(get_data(), **metadata)[1]
         desc, content = ret
         error = None
     # Third-party viewers can fail in unexpected ways...
@@ -152,7 +353,7 @@ def get_content_view(viewmode: View, data: bytes, **metadata):
         desc = "Couldn't parse: falling back to Raw"
         raw = get("Raw")
         assert raw
-        content = raw(data, **metadata)[1]
+        content = raw(get_data(), **metadata)[1]
         error = "{} Content viewer failed: \n{}".format(
             getattr(viewmode, "name"),
             traceback.format_exc()
@@ -1,28 +1,108 @@
+import functools
+import itertools
+from typing import Optional, Tuple
+
 from mitmproxy import contentviews
 from mitmproxy.net import http
 from mitmproxy.utils import strutils
 from . import base
 
+SNIFF_SIZE = 512
+"""Auto detection only ever looks at this many bytes at the start of a body."""
+
+IMAGE_MAGIC = (
+    b"\x89PNG\r\n\x1a\n",
+    b"GIF87a",
+    b"GIF89a",
+    b"\xff\xd8\xff",
+)
+
+SUFFIX_TYPES = {
+    "json": "application/json",
+    "xml": "text/xml",
+}
+"""Structured syntax suffixes (RFC 6839), e.g. application/ld+json, mapped to a content type with a view."""
+
+
+def sniff(data: bytes) -> Tuple[str, bool]:
+    """
+    Classify a body by its first SNIFF_SIZE bytes.
+
+    Returns a (kind, binary) signature, where kind is one of "empty",
+    "image", "xml" or "text", and binary tells whether the prefix is
+    mostly non-printable.
+    """
+    prefix = data[:SNIFF_SIZE]
+    if not prefix:
+        return "empty", False
+    if prefix.startswith(IMAGE_MAGIC):
+        return "image", True
+    if prefix.startswith(b"\xef\xbb\xbf"):
+        prefix = prefix[3:]
+    if strutils.is_xml(prefix):
+        kind = "xml"
+    else:
+        kind = "text"
+    return kind, strutils.is_mostly_bin(prefix)
+
+
+@functools.lru_cache(maxsize=256)
+def choose_view(ct: Optional[str], signature: Tuple[str, bool], query: bool) -> Optional[base.View]:
+    """
+    Pick a view for a (content type, sniff signature, query present) triple.
+    Returns None if there is no content to show.
+    The result is memoized; contentviews.add and contentviews.remove clear it.
+    """
+    kind, binary = signature
+    if kind != "empty" and ct:
+        if ct in contentviews.content_types_map:
+            return contentviews.content_types_map[ct][0]
+        suffix = SUFFIX_TYPES.get(ct.rpartition("+")[2]) if "+" in ct else None
+        if suffix in contentviews.content_types_map:
+            return contentviews.content_types_map[suffix][0]
+        elif kind == "xml":
+            return contentviews.get("XML/HTML")
+        elif ct.startswith("image/"):
+            return contentviews.get("Image")
+    if query:
+        return contentviews.get("Query")
+    if kind == "empty":
+        return None
+    if kind == "image":
+        return contentviews.get("Image")
+    if binary:
+        return contentviews.get("Hex")
+    return contentviews.get("Raw")
+
 
 class ViewAuto(base.View):
     name = "Auto"
 
-    def __call__(self, data, **metadata):
+    def _choose(self, data, metadata) -> Optional[base.View]:
         headers = metadata.get("headers", {})
         ctype = headers.get("content-type")
-        if data and ctype:
-            ct = http.parse_content_type(ctype) if ctype else None
+        ct = http.parse_content_type(ctype) if ctype else None
+        if ct:
             ct = "%s/%s" % (ct[0], ct[1])
-            if ct in contentviews.content_types_map:
-                return contentviews.content_types_map[ct][0](data, **metadata)
-            elif strutils.is_xml(data):
-                return contentviews.get("XML/HTML")(data, **metadata)
-            elif ct.startswith("image/"):
-                return contentviews.get("Image")(data, **metadata)
-        if metadata.get("query"):
-            return contentviews.get("Query")(data, **metadata)
-        if data and strutils.is_mostly_bin(data):
-            return contentviews.get("Hex")(data)
-        if not data:
+        return choose_view(ct, sniff(data), bool(metadata.get("query")))
+
+    def __call__(self, data, **metadata):
+        view = self._choose(data, metadata)
+        if view is None:
+            return "No content", []
+        return view(data, **metadata)
+
+    def stream(self, chunks, **metadata):
+        # Only read as far as we need to sniff the content.
+        chunks = iter(chunks)
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= SNIFF_SIZE:
+                break
+        view = self._choose(b"".join(head)[:SNIFF_SIZE], metadata)
+        if view is None:
             return "No content", []
-        return contentviews.get("Raw")(data)
+        return view.stream(itertools.chain(head, chunks), **metadata)
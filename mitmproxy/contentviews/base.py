@@ -34,6 +34,16 @@ class View:
         """
         raise NotImplementedError()  # pragma: no cover
 
+    def stream(self, chunks: typing.Iterable[bytes], **metadata) -> typing.Optional[TViewResult]:
+        """
+        Like calling the view, but the data arrives as an iterable of chunks,
+        e.g. from a streaming decoder. Views that can render incrementally
+        override this, so that the first lines are available before the
+        whole body has been read. By default, the chunks are joined and the
+        view is called with the complete data.
+        """
+        return self(b"".join(chunks), **metadata)
+
 
 def format_pairs(
         items: typing.Iterable[typing.Tuple[TTextType, TTextType]]
@@ -81,9 +91,26 @@ def format_dict(
     return format_pairs(d.items())
 
 
+def _lines(text, block_size: int = 64 * 1024):
+    """
+    Split text into lines like str.splitlines, but lazily, one block at a
+    time. Blocks end after a newline, so \r\n is never split.
+    """
+    newline = b"\n" if isinstance(text, bytes) else "\n"
+    start = 0
+    while start < len(text):
+        end = text.rfind(newline, start, start + block_size) + 1
+        if end == 0:
+            end = text.find(newline, start + block_size) + 1 or len(text)
+        yield from text[start:end].splitlines()
+        start = end
+
+
 def format_text(text: TTextType) -> typing.Iterator[TViewLine]:
     """
     Helper function that transforms bytes into the view output format.
+    Lines are split as they are consumed, so showing the first few lines of
+    a large body is cheap.
     """
-    for line in text.splitlines():
+    for line in _lines(text):
         yield [("text", line)]
@@ -1,3 +1,5 @@
+import codecs
+import itertools
 import re
 import json
 
@@ -7,6 +9,14 @@ from mitmproxy.contentviews import base
 
 PARSE_ERROR = object()
 
+STREAM_THRESHOLD = 1024 * 1024
+"""Documents larger than this are formatted as they are read, see format_json_stream."""
+
+BLOCK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r"\s*")
+SCALAR = re.compile(r"true|false|null|-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+
 
 def parse_json(s: bytes) -> typing.Any:
     try:
@@ -16,7 +26,8 @@ def parse_json(s: bytes) -> typing.Any:
 
 
 def format_json(data: typing.Any) -> typing.Iterator[base.TViewLine]:
-    encoder = json.JSONEncoder(indent=4, sort_keys=True, ensure_ascii=False)
+    # Keys keep their document order, as format_json_stream cannot sort them.
+    encoder = json.JSONEncoder(indent=4, ensure_ascii=False)
     current_line: base.TViewLine = []
     for chunk in encoder.iterencode(data):
         if "\n" in chunk:
@@ -36,6 +47,148 @@ def format_json(data: typing.Any) -> typing.Iterator[base.TViewLine]:
     yield current_line
 
 
+def _decode(chunks: typing.Iterable[bytes]) -> typing.Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        for i in range(0, len(chunk), BLOCK_SIZE):
+            text = decoder.decode(chunk[i:i + BLOCK_SIZE])
+            if text:
+                yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class _Tokenizer:
+    """
+    Splits a JSON document into (kind, text) tokens, where kind is one of
+    "punct", "string" and "scalar", reading only as much text as the current
+    token needs.
+    """
+
+    def __init__(self, chunks: typing.Iterable[bytes]) -> None:
+        self.pieces = _decode(chunks)
+        self.buf = ""
+        self.pos = 0
+        self.offset = 0
+
+    def _fill(self) -> bool:
+        """
+        Read more text, at least as much as is buffered, so that long tokens
+        are assembled in linear time. Returns False at the end of the input.
+        """
+        rest = self.buf[self.pos:]
+        parts = [rest]
+        size = 0
+        for piece in self.pieces:
+            parts.append(piece)
+            size += len(piece)
+            if size > len(rest):
+                break
+        self.offset += self.pos
+        self.buf = "".join(parts)
+        self.pos = 0
+        return size > 0
+
+    def _error(self, msg: str) -> ValueError:
+        return ValueError("{} at character {}".format(msg, self.offset + self.pos))
+
+    def _string_end(self) -> int:
+        i = self.pos + 1
+        while True:
+            i = self.buf.find('"', i)
+            if i == -1:
+                scanned = len(self.buf) - self.pos
+                if not self._fill():
+                    raise self._error("Unterminated string")
+                i = scanned
+                continue
+            j = i - 1
+            while self.buf[j] == "\\":
+                j -= 1
+            if (i - j) % 2 == 1:
+                return i + 1
+            i += 1
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[str, str]]:
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos == len(self.buf):
+                if not self._fill():
+                    return
+                continue
+            c = self.buf[self.pos]
+            if c in "{}[]:,":
+                self.pos += 1
+                yield "punct", c
+            elif c == '"':
+                end = self._string_end()
+                yield "string", self.buf[self.pos:end]
+                self.pos = end
+            else:
+                m = SCALAR.match(self.buf, self.pos)
+                # The scalar may continue in the text we have not read yet,
+                # e.g. "1" might be followed by ".5" or "e-3".
+                while (m is None or len(self.buf) - m.end() < 3) and len(self.buf) - self.pos < 64:
+                    more = self._fill()
+                    m = SCALAR.match(self.buf, self.pos)
+                    if not more:
+                        break
+                if m is None:
+                    raise self._error("Invalid JSON")
+                yield "scalar", m.group()
+                self.pos = m.end()
+
+
+def format_json_stream(chunks: typing.Iterable[bytes]) -> typing.Iterator[base.TViewLine]:
+    """
+    Lay out a JSON document as it is read, without parsing it first. Strings
+    and numbers are written the way format_json writes them, but the document
+    is only checked as far as the layout needs it.
+
+    Raises:
+        ValueError, when the document is not valid UTF-8 or not JSON.
+    """
+    indent = "    "
+    depth = 0
+    line: base.TViewLine = []
+    # An opening bracket has been written, and we do not know yet whether
+    # the container is empty.
+    opened = False
+    for kind, text in _Tokenizer(chunks):
+        if opened:
+            opened = False
+            if text in "]}" and kind == "punct":
+                depth -= 1
+                line.append(("text", text))
+                continue
+            yield line
+            line = [("text", indent * depth)]
+        if kind == "string":
+            line.append(("json_string", json.dumps(json.loads(text), ensure_ascii=False)))
+        elif kind == "scalar":
+            if text[0] in "tfn":
+                line.append(("json_boolean", text))
+            else:
+                line.append(("json_number", json.dumps(json.loads(text))))
+        elif text in "[{":
+            line.append(("text", text))
+            depth += 1
+            opened = True
+        elif text in "]}":
+            yield line
+            depth -= 1
+            line = [("text", indent * depth + text)]
+        elif text == ",":
+            line.append(("text", text))
+            yield line
+            line = [("text", indent * depth)]
+        else:
+            line.append(("text", ": "))
+    if line:
+        yield line
+
+
 class ViewJSON(base.View):
     name = "JSON"
     content_types = [
@@ -48,3 +201,14 @@ class ViewJSON(base.View):
         data = parse_json(data)
         if data is not PARSE_ERROR:
             return "JSON", format_json(data)
+
+    def stream(self, chunks, **metadata):
+        chunks = iter(chunks)
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > STREAM_THRESHOLD:
+                return "JSON", format_json_stream(itertools.chain(head, chunks))
+        return self(b"".join(head), **metadata)
@@ -1,7 +1,6 @@
-import io
 import re
 import textwrap
-from typing import Iterable, Optional
+from typing import Iterable, Iterator, Optional
 
 from mitmproxy.contentviews import base
 from mitmproxy.utils import sliding_window
@@ -174,42 +173,58 @@ class ElementStack:
             pass  # this closing tag has no start tag. let's keep indentation as-is.
 
 
-def format_xml(tokens: Iterable[Token]) -> str:
-    out = io.StringIO()
-
+def _format_xml(tokens: Iterable[Token]) -> Iterator[str]:
     context = ElementStack()
 
     for prev2, prev1, token, next1, next2 in sliding_window.window(tokens, 2, 2):
         if isinstance(token, Tag):
             if token.is_opening:
-                out.write(indent_text(token.data, context.indent))
+                yield indent_text(token.data, context.indent)
 
                 if not is_inline(prev2, prev1, token, next1, next2):
-                    out.write("\n")
+                    yield "\n"
 
                 context.push_tag(token.tag)
             elif token.is_closing:
                 context.pop_tag(token.tag)
 
                 if is_inline(prev2, prev1, token, next1, next2):
-                    out.write(token.data)
+                    yield token.data
                 else:
-                    out.write(indent_text(token.data, context.indent))
-                out.write("\n")
+                    yield indent_text(token.data, context.indent)
+                yield "\n"
 
             else:  # self-closing
-                out.write(indent_text(token.data, context.indent))
-                out.write("\n")
+                yield indent_text(token.data, context.indent)
+                yield "\n"
         elif isinstance(token, Text):
             if is_inline(prev2, prev1, token, next1, next2):
-                out.write(token.text)
+                yield token.text
             else:
-                out.write(indent_text(token.data, context.indent))
-                out.write("\n")
+                yield indent_text(token.data, context.indent)
+                yield "\n"
         else:  # pragma: no cover
             raise RuntimeError()
 
-    return out.getvalue()
+
+def format_xml(tokens: Iterable[Token]) -> str:
+    return "".join(_format_xml(tokens))
+
+
+def format_xml_lines(tokens: Iterable[Token]) -> Iterator[str]:
+    """
+    Like format_xml, but yields the formatted document line by line as the
+    tokens are consumed.
+    """
+    pending = ""
+    for chunk in _format_xml(tokens):
+        i = chunk.rfind("\n")
+        if i == -1:
+            pending += chunk
+        else:
+            yield from (pending + chunk[:i + 1]).splitlines()
+            pending = chunk[i + 1:]
+    yield from pending.splitlines()
 
 
 class ViewXmlHtml(base.View):
@@ -223,11 +238,7 @@ class ViewXmlHtml(base.View):
         # https://github.com/mitmproxy/mitmproxy/issues/1662#issuecomment-266192578
         data = data.decode("utf8", "xmlcharrefreplace")
         tokens = tokenize(data)
-        # TODO:
-        # Performance: Don't render the whole document right away.
-        # Let's wait with this until we have a sequence-like interface,
-        # this thing is reasonably fast right now anyway.
-        pretty = base.format_text(format_xml(tokens))
+        pretty = ([("text", line)] for line in format_xml_lines(tokens))
         if "html" in data.lower():
             t = "HTML"
         else:
@@ -23,10 +23,7 @@ class Channel:
         """
         if not self.should_exit.is_set():
             m.reply = Reply(m)
-            asyncio.run_coroutine_threadsafe(
-                self.master.addons.handle_lifecycle(mtype, m),
-                self.loop,
-            )
+            self._dispatch(mtype, m)
             g = m.reply.q.get()
             if g == exceptions.Kill:
                 raise exceptions.Kill()
@@ -39,6 +36,16 @@ class Channel:
         """
         if not self.should_exit.is_set():
             m.reply = DummyReply()
+            self._dispatch(mtype, m)
+
+    def _dispatch(self, mtype, m):
+        """
+        Run the event handlers on the calling thread if they are all marked
+        as inline (or if there are none), and on the master's event loop otherwise.
+        """
+        if self.master.addons.can_inline(mtype, m):
+            self.master.addons.handle_lifecycle_sync(mtype, m)
+        else:
             asyncio.run_coroutine_threadsafe(
                 self.master.addons.handle_lifecycle(mtype, m),
                 self.loop,
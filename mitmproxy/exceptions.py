@@ -28,6 +28,15 @@ class Kill(MitmproxyException):
     pass
 
 
+class ClientIdle(MitmproxyException):
+
+    """
+    Signal that the client connection is idle between two requests and can be
+    handed back to the proxy server until the client sends more data.
+    """
+    pass
+
+
 class ProtocolException(MitmproxyException):
     """
     ProtocolExceptions are caused by invalid user input, unavailable network resources,
@@ -44,6 +44,8 @@ from mitmproxy import http
 from mitmproxy import tcp
 from mitmproxy import websocket
 from mitmproxy.net import websockets as net_websockets
+from mitmproxy.net.http import encoding
+from mitmproxy.net.http import message
 
 
 def only(*types):
@@ -60,6 +62,14 @@ def only(*types):
 
 
 class _Token:
+    # Relative evaluation cost, see _Action.cost.
+    cost = 0
+
+    def compile(self) -> "TFilter":
+        """
+            Return a callable that matches a flow against this expression.
+        """
+        return self
 
     def dump(self, indent=0, fp=sys.stdout):
         print("{spacing}{name}{expr}".format(
@@ -72,6 +82,13 @@ class _Token:
 class _Action(_Token):
     code: ClassVar[str]
     help: ClassVar[str]
+    # Conjunctions and disjunctions evaluate their cheapest operands first:
+    # 0 flow type and flags, 1 method or status code, 2 URL, domain and
+    # addresses, 3 headers, 4 bodies.
+    cost: ClassVar[int]
+
+    def compile(self):
+        return self.__call__
 
     @classmethod
     def make(klass, s, loc, toks):
@@ -81,6 +98,7 @@ class _Action(_Token):
 class FErr(_Action):
     code = "e"
     help = "Match error"
+    cost = 0
 
     def __call__(self, f):
         return True if f.error else False
@@ -89,6 +107,7 @@ class FErr(_Action):
 class FMarked(_Action):
     code = "marked"
     help = "Match marked flows"
+    cost = 0
 
     def __call__(self, f):
         return f.marked
@@ -97,6 +116,7 @@ class FMarked(_Action):
 class FHTTP(_Action):
     code = "http"
     help = "Match HTTP flows"
+    cost = 0
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -106,6 +126,7 @@ class FHTTP(_Action):
 class FWebSocket(_Action):
     code = "websocket"
     help = "Match WebSocket flows (and HTTP-WebSocket handshake flows)"
+    cost = 0
 
     @only(http.HTTPFlow, websocket.WebSocketFlow)
     def __call__(self, f):
@@ -119,6 +140,7 @@ class FWebSocket(_Action):
 class FTCP(_Action):
     code = "tcp"
     help = "Match TCP flows"
+    cost = 0
 
     @only(tcp.TCPFlow)
     def __call__(self, f):
@@ -128,6 +150,7 @@ class FTCP(_Action):
 class FReq(_Action):
     code = "q"
     help = "Match request with no response"
+    cost = 0
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -138,6 +161,7 @@ class FReq(_Action):
 class FResp(_Action):
     code = "s"
     help = "Match response"
+    cost = 0
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -166,9 +190,49 @@ def _check_content_type(rex, message):
     )
 
 
+# Patterns that can match at the end of a truncated body, but not further into
+# the full one. They are only searched for once the body is fully decoded.
+_END_SENSITIVE = re.compile(rb"\$|\\[ZbB]|\(\?[=!]")
+
+
+def _search_body(rex, msg) -> bool:
+    """
+        Search the decoded body of a HTTP message. Compressed bodies are
+        decoded incrementally and searched as they grow, so that a match near
+        the start does not require decoding the rest. Bodies that cannot be
+        decoded within encoding.max_decoded_size are searched as they are.
+    """
+    ce = msg.headers.get("content-encoding")
+    if ce not in encoding.COMPRESSED_ENCODINGS:
+        return bool(rex.search(msg.get_content(strict=False)))
+    raw = msg.raw_content
+    content = message.decoded_cache.get(raw, ce)
+    if content is not None:
+        return bool(rex.search(content))
+
+    early = not _END_SENSITIVE.search(rex.pattern)
+    buf = bytearray()
+    searched = 0
+    try:
+        for chunk in encoding.decode_iter(raw, ce, max_size=encoding.max_decoded_size):
+            buf += chunk
+            if early and len(buf) >= 2 * searched:
+                # Search whenever the body has doubled, which keeps the
+                # total work linear.
+                searched = len(buf)
+                if rex.search(buf):
+                    return True
+    except ValueError:
+        return bool(rex.search(raw))
+    content = bytes(buf)
+    message.decoded_cache.put(raw, ce, content)
+    return bool(rex.search(content))
+
+
 class FAsset(_Action):
     code = "a"
     help = "Match asset in response: CSS, Javascript, Flash, images."
+    cost = 3
     ASSET_TYPES = [re.compile(x) for x in [
         b"text/javascript",
         b"application/x-javascript",
@@ -190,6 +254,7 @@ class FAsset(_Action):
 class FContentType(_Rex):
     code = "t"
     help = "Content-type header"
+    cost = 3
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -203,6 +268,7 @@ class FContentType(_Rex):
 class FContentTypeRequest(_Rex):
     code = "tq"
     help = "Request Content-Type header"
+    cost = 3
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -212,6 +278,7 @@ class FContentTypeRequest(_Rex):
 class FContentTypeResponse(_Rex):
     code = "ts"
     help = "Response Content-Type header"
+    cost = 3
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -223,6 +290,7 @@ class FContentTypeResponse(_Rex):
 class FHead(_Rex):
     code = "h"
     help = "Header"
+    cost = 3
     flags = re.MULTILINE
 
     @only(http.HTTPFlow)
@@ -237,6 +305,7 @@ class FHead(_Rex):
 class FHeadRequest(_Rex):
     code = "hq"
     help = "Request header"
+    cost = 3
     flags = re.MULTILINE
 
     @only(http.HTTPFlow)
@@ -248,6 +317,7 @@ class FHeadRequest(_Rex):
 class FHeadResponse(_Rex):
     code = "hs"
     help = "Response header"
+    cost = 3
     flags = re.MULTILINE
 
     @only(http.HTTPFlow)
@@ -259,16 +329,17 @@ class FHeadResponse(_Rex):
 class FBod(_Rex):
     code = "b"
     help = "Body"
+    cost = 4
     flags = re.DOTALL
 
     @only(http.HTTPFlow, websocket.WebSocketFlow, tcp.TCPFlow)
     def __call__(self, f):
         if isinstance(f, http.HTTPFlow):
             if f.request and f.request.raw_content:
-                if self.re.search(f.request.get_content(strict=False)):
+                if _search_body(self.re, f.request):
                     return True
             if f.response and f.response.raw_content:
-                if self.re.search(f.response.get_content(strict=False)):
+                if _search_body(self.re, f.response):
                     return True
         elif isinstance(f, websocket.WebSocketFlow) or isinstance(f, tcp.TCPFlow):
             for msg in f.messages:
@@ -280,13 +351,14 @@ class FBod(_Rex):
 class FBodRequest(_Rex):
     code = "bq"
     help = "Request body"
+    cost = 4
     flags = re.DOTALL
 
     @only(http.HTTPFlow, websocket.WebSocketFlow, tcp.TCPFlow)
     def __call__(self, f):
         if isinstance(f, http.HTTPFlow):
             if f.request and f.request.raw_content:
-                if self.re.search(f.request.get_content(strict=False)):
+                if _search_body(self.re, f.request):
                     return True
         elif isinstance(f, websocket.WebSocketFlow) or isinstance(f, tcp.TCPFlow):
             for msg in f.messages:
@@ -297,13 +369,14 @@ class FBodRequest(_Rex):
 class FBodResponse(_Rex):
     code = "bs"
     help = "Response body"
+    cost = 4
     flags = re.DOTALL
 
     @only(http.HTTPFlow, websocket.WebSocketFlow, tcp.TCPFlow)
     def __call__(self, f):
         if isinstance(f, http.HTTPFlow):
             if f.response and f.response.raw_content:
-                if self.re.search(f.response.get_content(strict=False)):
+                if _search_body(self.re, f.response):
                     return True
         elif isinstance(f, websocket.WebSocketFlow) or isinstance(f, tcp.TCPFlow):
             for msg in f.messages:
@@ -314,6 +387,7 @@ class FBodResponse(_Rex):
 class FMethod(_Rex):
     code = "m"
     help = "Method"
+    cost = 1
     flags = re.IGNORECASE
 
     @only(http.HTTPFlow)
@@ -324,6 +398,7 @@ class FMethod(_Rex):
 class FDomain(_Rex):
     code = "d"
     help = "Domain"
+    cost = 2
     flags = re.IGNORECASE
     is_binary = False
 
@@ -340,6 +415,7 @@ class FDomain(_Rex):
 class FUrl(_Rex):
     code = "u"
     help = "URL"
+    cost = 2
     is_binary = False
 
     # FUrl is special, because it can be "naked".
@@ -362,6 +438,7 @@ class FUrl(_Rex):
 class FSrc(_Rex):
     code = "src"
     help = "Match source address"
+    cost = 2
     is_binary = False
 
     def __call__(self, f):
@@ -374,6 +451,7 @@ class FSrc(_Rex):
 class FDst(_Rex):
     code = "dst"
     help = "Match destination address"
+    cost = 2
     is_binary = False
 
     def __call__(self, f):
@@ -392,6 +470,7 @@ class _Int(_Action):
 class FCode(_Int):
     code = "c"
     help = "HTTP response code"
+    cost = 1
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -399,10 +478,27 @@ class FCode(_Int):
             return True
 
 
+def _by_cost(lst):
+    return sorted(lst, key=lambda x: x.cost)
+
+
 class FAnd(_Token):
 
     def __init__(self, lst):
         self.lst = lst
+        self.cost = max(i.cost for i in lst)
+        self._match = self.compile()
+
+    def compile(self):
+        fns = tuple(i.compile() for i in _by_cost(self.lst))
+
+        def match_all(f):
+            for fn in fns:
+                if not fn(f):
+                    return False
+            return True
+
+        return match_all
 
     def dump(self, indent=0, fp=sys.stdout):
         super().dump(indent, fp)
@@ -410,13 +506,26 @@ class FAnd(_Token):
             i.dump(indent + 1, fp)
 
     def __call__(self, f):
-        return all(i(f) for i in self.lst)
+        return self._match(f)
 
 
 class FOr(_Token):
 
     def __init__(self, lst):
         self.lst = lst
+        self.cost = max(i.cost for i in lst)
+        self._match = self.compile()
+
+    def compile(self):
+        fns = tuple(i.compile() for i in _by_cost(self.lst))
+
+        def match_any(f):
+            for fn in fns:
+                if fn(f):
+                    return True
+            return False
+
+        return match_any
 
     def dump(self, indent=0, fp=sys.stdout):
         super().dump(indent, fp)
@@ -424,20 +533,30 @@ class FOr(_Token):
             i.dump(indent + 1, fp)
 
     def __call__(self, f):
-        return any(i(f) for i in self.lst)
+        return self._match(f)
 
 
 class FNot(_Token):
 
     def __init__(self, itm):
         self.itm = itm[0]
+        self.cost = self.itm.cost
+        self._match = self.compile()
+
+    def compile(self):
+        fn = self.itm.compile()
+
+        def match_not(f):
+            return not fn(f)
+
+        return match_not
 
     def dump(self, indent=0, fp=sys.stdout):
         super().dump(indent, fp)
         self.itm.dump(indent + 1, fp)
 
     def __call__(self, f):
-        return not self.itm(f)
+        return self._match(f)
 
 
 filter_unary: Sequence[Type[_Action]] = [
@@ -556,6 +675,42 @@ def match(flt, flow):
     return True
 
 
+def _same(a, b) -> bool:
+    if a is b:
+        return True
+    if type(a) is not type(b) or not isinstance(a, _Token):
+        # Arbitrary callables cannot be compared structurally.
+        return False
+    if isinstance(a, (FAnd, FOr)):
+        return len(a.lst) == len(b.lst) and all(_same(x, y) for x, y in zip(a.lst, b.lst))
+    if isinstance(a, FNot):
+        return _same(a.itm, b.itm)
+    return (
+        getattr(a, "expr", None) == getattr(b, "expr", None) and
+        getattr(a, "num", None) == getattr(b, "num", None)
+    )
+
+
+def implies(a: TFilter, b: TFilter) -> bool:
+    """
+        Returns True if every flow matched by filter a is also matched by
+        filter b, e.g. if a is "~b foo & ~d example.com" and b is
+        "~d example.com". The check is structural and conservative: False
+        means that we could not tell.
+    """
+    if _same(a, b):
+        return True
+    if isinstance(b, FAnd):
+        return all(implies(a, i) for i in b.lst)
+    if isinstance(a, FOr):
+        return all(implies(i, b) for i in a.lst)
+    if isinstance(a, FAnd) and any(implies(i, b) for i in a.lst):
+        return True
+    if isinstance(b, FOr) and any(implies(a, i) for i in b.lst):
+        return True
+    return False
+
+
 help = []
 for a in filter_unary:
     help.append(
@@ -1,8 +1,15 @@
 
 from .io import FlowWriter, FlowReader, FilteredFlowWriter, read_flows_from_paths
+from .io import IndexedFlowWriter, IndexedFlowReader, LazyHTTPFlow, lazy_summary, load_pending, is_indexed, open_reader
+from .io import validate_paths, stream_flows_from_paths, read_flow_at, read_flows_parallel
+from .io import is_splittable
 from .db import DBHandler
 
 
 __all__ = [
-    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths", "DBHandler"
+    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths", "DBHandler",
+    "IndexedFlowWriter", "IndexedFlowReader", "LazyHTTPFlow", "lazy_summary", "load_pending", "is_indexed",
+    "open_reader",
+    "validate_paths", "stream_flows_from_paths", "read_flow_at", "read_flows_parallel",
+    "is_splittable",
 ]
@@ -5,8 +5,9 @@ The flow file version is decoupled from the mitmproxy release cycle (since
 v3.0.0dev) and versioning. Every change or migration gets a new flow file
 version number, this prevents issues with developer builds and snapshots.
 """
+import functools
 import uuid
-from typing import Any, Dict, Mapping, Union  # noqa
+from typing import Any, Callable, Dict, Mapping, Tuple, Union  # noqa
 
 from mitmproxy import version
 from mitmproxy.utils import strutils
@@ -256,28 +257,42 @@ converters = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def _converter_chain(flow_version: Union[int, Tuple[int, ...]]) -> Tuple[Callable[[dict], dict], ...]:
+    """
+    The converters that take a flow from the given version to the current
+    one. Converters are listed in order, so the chain is the tail of the
+    converters dict that starts at flow_version. All records of a file
+    usually have the same version, so this is computed once per file.
+    """
+    if flow_version not in converters:
+        should_upgrade = (
+                isinstance(flow_version, int)
+                and flow_version > version.FLOW_FORMAT_VERSION
+        )
+        raise ValueError(
+            "{} cannot read files with flow format version {}{}.".format(
+                version.MITMPROXY,
+                flow_version,
+                ", please update mitmproxy" if should_upgrade else ""
+            )
+        )
+    versions = list(converters)
+    return tuple(converters[v] for v in versions[versions.index(flow_version):])
+
+
 def migrate_flow(flow_data: Dict[Union[bytes, str], Any]) -> Dict[Union[bytes, str], Any]:
-    while True:
-        flow_version = flow_data.get(b"version", flow_data.get("version"))
+    # Fast path for flows written by this version, which have str keys.
+    if flow_data.get("version") == version.FLOW_FORMAT_VERSION:
+        return flow_data
 
-        # Historically, we used the mitmproxy minor version tuple as the flow format version.
-        if not isinstance(flow_version, int):
-            flow_version = tuple(flow_version)[:2]
+    flow_version = flow_data.get(b"version", flow_data.get("version"))
 
-        if flow_version == version.FLOW_FORMAT_VERSION:
-            break
-        elif flow_version in converters:
-            flow_data = converters[flow_version](flow_data)
-        else:
-            should_upgrade = (
-                    isinstance(flow_version, int)
-                    and flow_version > version.FLOW_FORMAT_VERSION
-            )
-            raise ValueError(
-                "{} cannot read files with flow format version {}{}.".format(
-                    version.MITMPROXY,
-                    flow_version,
-                    ", please update mitmproxy" if should_upgrade else ""
-                )
-            )
+    # Historically, we used the mitmproxy minor version tuple as the flow format version.
+    if not isinstance(flow_version, int):
+        flow_version = tuple(flow_version)[:2]
+
+    if flow_version != version.FLOW_FORMAT_VERSION:
+        for converter in _converter_chain(flow_version):
+            flow_data = converter(flow_data)
     return flow_data
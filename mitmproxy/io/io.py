@@ -1,5 +1,14 @@
+import collections
+import concurrent.futures
+import importlib
+import io
+import itertools
+import multiprocessing
 import os
-from typing import Type, Iterable, Dict, Union, Any, cast  # noqa
+import stat
+import threading
+import weakref
+from typing import Type, Iterable, Dict, List, Optional, Tuple, Union, Any, cast  # noqa
 
 from mitmproxy import exceptions
 from mitmproxy import flow
@@ -18,6 +27,64 @@ FLOW_TYPES: Dict[str, Type[flow.Flow]] = dict(
 )
 
 
+# Indexed dumps are ordinary dumps followed by an index record and a
+# fixed-size trailer with the index offset. Both are tnetstrings, so
+# FlowReader can read indexed dumps like any other.
+INDEX_VERSION = 1
+INDEX_MARKER = b"mitmproxy-index:"
+INDEX_TRAILER_SIZE = len(tnetstring.dumps(INDEX_MARKER + b"0" * 20))
+
+IndexEntry = collections.namedtuple("IndexEntry", ["id", "offset", "length", "summary"])
+
+
+def _trailer(offset: int) -> bytes:
+    return tnetstring.dumps(INDEX_MARKER + b"%020d" % offset)
+
+
+def _migrate(loaded: Dict[Union[bytes, str], Any]) -> Dict[str, Any]:
+    try:
+        mdata = compat.migrate_flow(loaded)
+    except ValueError as e:
+        raise exceptions.FlowReadException(str(e))
+    if mdata["type"] not in FLOW_TYPES:
+        raise exceptions.FlowReadException("Unknown flow type: {}".format(mdata["type"]))
+    return mdata
+
+
+def _flow_from_state(loaded: Dict[Union[bytes, str], Any]) -> flow.Flow:
+    mdata = _migrate(loaded)
+    return FLOW_TYPES[mdata["type"]].from_state(mdata)
+
+
+def _is_index_record(loaded) -> bool:
+    if isinstance(loaded, bytes):
+        return loaded.startswith(INDEX_MARKER)
+    return isinstance(loaded, dict) and loaded.get("type") == "index"
+
+
+def flow_summary(f: flow.Flow) -> Dict[str, Any]:
+    """
+        The metadata that indexed dumps keep for each flow, so that flows
+        can be listed without deserializing them.
+    """
+    summary: Dict[str, Any] = dict(type=f.type, marked=f.marked)
+    if isinstance(f, http.HTTPFlow):
+        summary.update(
+            method=f.request.method,
+            url=f.request.pretty_url,
+            host=f.request.host,
+            pretty_host=f.request.pretty_host,
+            timestamp_start=f.request.timestamp_start,
+            request_size=len(f.request.raw_content or b""),
+            status_code=f.response.status_code if f.response else None,
+            response_size=len(f.response.raw_content or b"") if f.response else None,
+            content_type=[
+                v for k, v in f.response.headers.fields if k.lower() == b"content-type"
+            ] if f.response else [],
+        )
+    return summary
+
+
 class FlowWriter:
     def __init__(self, fo):
         self.fo = fo
@@ -35,26 +102,325 @@ class FlowReader:
         """
             Yields Flow objects from the dump.
         """
+        for _, f in self.stream_offsets():
+            yield f
+
+    def stream_offsets(self) -> Iterable[Tuple[int, flow.Flow]]:
+        """
+            Yields (offset, Flow) tuples from the dump. Offsets are relative
+            to the position of the file when reading started.
+        """
         try:
-            while True:
-                # FIXME: This cast hides a lack of dynamic type checking
-                loaded = cast(
-                    Dict[Union[bytes, str], Any],
-                    tnetstring.load(self.fo),
-                )
-                try:
-                    mdata = compat.migrate_flow(loaded)
-                except ValueError as e:
-                    raise exceptions.FlowReadException(str(e))
-                if mdata["type"] not in FLOW_TYPES:
-                    raise exceptions.FlowReadException("Unknown flow type: {}".format(mdata["type"]))
-                yield FLOW_TYPES[mdata["type"]].from_state(mdata)
-        except ValueError as e:
-            if str(e) == "not a tnetstring: empty file":
-                return  # Error is due to EOF
+            for offset, mdata in self.records():
+                yield offset, FLOW_TYPES[mdata["type"]].from_state(mdata)
+        except ValueError:
+            raise exceptions.FlowReadException("Invalid data format.")
+
+    def records(self) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        """
+            Yields (offset, state) tuples of the migrated flow states in the
+            dump, without creating Flow objects.
+        """
+        try:
+            # FIXME: This cast hides a lack of dynamic type checking
+            for offset, loaded in cast(Iterable[Tuple[int, Dict[Union[bytes, str], Any]]], tnetstring.iter_load(self.fo)):
+                if _is_index_record(loaded):
+                    continue
+                yield offset, _migrate(loaded)
+        except ValueError:
             raise exceptions.FlowReadException("Invalid data format.")
 
 
+class IndexedFlowWriter(FlowWriter):
+    """
+        Writes an indexed dump. The index is appended by close(), which must
+        be called before the file is closed. Flows that do not match flt are
+        skipped.
+
+        When appending to a dump, the flows already in it are indexed as
+        well, so the file must then be opened for reading too ("a+b").
+    """
+    def __init__(self, fo, flt: Optional[flowfilter.TFilter] = None):
+        super().__init__(fo)
+        self.flt = flt
+        try:
+            self.offset = fo.tell()
+        except (OSError, io.UnsupportedOperation):
+            self.offset = 0
+        self.entries: List[list] = []
+        if self.offset:
+            self.entries = self._existing_entries()
+            fo.seek(self.offset)
+
+    def _existing_entries(self) -> List[list]:
+        if is_indexed(self.fo):
+            reader = IndexedFlowReader(self.fo)
+            try:
+                return [list(e) for e in reader.entries]
+            finally:
+                reader.close()
+        self.fo.seek(0)
+        entries: List[list] = []
+        try:
+            for offset, loaded in tnetstring.iter_load(self.fo):
+                # A record ends where the next one starts.
+                if entries and entries[-1][2] is None:
+                    entries[-1][2] = offset - entries[-1][1]
+                if not _is_index_record(loaded):
+                    f = _flow_from_state(cast(Dict[Union[bytes, str], Any], loaded))
+                    entries.append([f.id, offset, None, flow_summary(f)])
+        except ValueError:
+            raise exceptions.FlowReadException("Invalid data format.")
+        if entries and entries[-1][2] is None:
+            entries[-1][2] = self.offset - entries[-1][1]
+        return entries
+
+    def add(self, flow):
+        if self.flt and not flowfilter.match(self.flt, flow):
+            return
+        data = tnetstring.dumps(flow.get_state())
+        self.fo.write(data)
+        self.entries.append([flow.id, self.offset, len(data), flow_summary(flow)])
+        self.offset += len(data)
+
+    def close(self):
+        self.fo.write(tnetstring.dumps(dict(
+            type="index",
+            version=INDEX_VERSION,
+            flows=self.entries,
+        )))
+        self.fo.write(_trailer(self.offset))
+
+
+def is_indexed(fo) -> bool:
+    """
+        Check whether a file is an indexed dump, without changing its position.
+    """
+    try:
+        if not fo.seekable():
+            return False
+        pos = fo.tell()
+        try:
+            fo.seek(0, os.SEEK_END)
+            if fo.tell() < INDEX_TRAILER_SIZE:
+                return False
+            fo.seek(-INDEX_TRAILER_SIZE, os.SEEK_END)
+            trailer = fo.read(INDEX_TRAILER_SIZE)
+        finally:
+            fo.seek(pos)
+    except (OSError, io.UnsupportedOperation):
+        return False
+    return _index_offset(trailer) is not None
+
+
+def _index_offset(trailer) -> Optional[int]:
+    try:
+        value = tnetstring.loads(trailer)
+    except ValueError:
+        return None
+    if not isinstance(value, bytes) or not value.startswith(INDEX_MARKER):
+        return None
+    return int(value[len(INDEX_MARKER):])
+
+
+# All open IndexedFlowReaders, so that their lazy flows can be loaded before
+# the file they are read from is overwritten.
+_readers: "weakref.WeakSet[IndexedFlowReader]" = weakref.WeakSet()
+
+
+class IndexedFlowReader:
+    """
+        Random access to the flows in an indexed dump. Flows can be listed
+        from the index alone, and are only deserialized when they are
+        accessed.
+
+        The reader keeps its own handle to the file, and reads each record
+        when it is needed. If the file is truncated or overwritten in the
+        meantime, reading fails with a FlowReadException.
+    """
+    def __init__(self, fo):
+        try:
+            self.file = os.fdopen(os.dup(fo.fileno()), "rb")
+            st = os.fstat(self.file.fileno())
+            self.ident: Optional[Tuple[int, int]] = (st.st_dev, st.st_ino)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            fo.seek(0)
+            self.file = io.BytesIO(fo.read())
+            self.ident = None
+        self._finalizer = weakref.finalize(self, self.file.close)
+        self.lock = threading.Lock()
+        # The lazy flows that have not been loaded yet, by position.
+        self.pending: "weakref.WeakValueDictionary[int, LazyHTTPFlow]" = weakref.WeakValueDictionary()
+        try:
+            self.file.seek(0, os.SEEK_END)
+            size = self.file.tell()
+            offset = None
+            if size >= INDEX_TRAILER_SIZE:
+                offset = _index_offset(self._read(size - INDEX_TRAILER_SIZE, INDEX_TRAILER_SIZE))
+            if offset is None:
+                raise exceptions.FlowReadException("Not an indexed dump.")
+            try:
+                if offset > size - INDEX_TRAILER_SIZE:
+                    raise ValueError
+                index, _ = tnetstring.loads_at(self._read(offset, size - INDEX_TRAILER_SIZE - offset), 0)
+                if not _is_index_record(index) or index["version"] != INDEX_VERSION:
+                    raise ValueError
+                self.entries = [IndexEntry(*e) for e in index["flows"]]
+            except (ValueError, KeyError, TypeError):
+                raise exceptions.FlowReadException("Invalid index.")
+        except Exception:
+            self.close()
+            raise
+        self.positions = {e.id: i for i, e in enumerate(self.entries)}
+        _readers.add(self)
+
+    def _read(self, offset: int, length: int) -> bytes:
+        try:
+            with self.lock:
+                self.file.seek(offset)
+                data = self.file.read(length)
+        except (OSError, ValueError):
+            raise exceptions.FlowReadException("Flow dump is closed or unreadable.")
+        if len(data) != length:
+            # The file has been truncated since the index was read.
+            raise exceptions.FlowReadException("Invalid data format.")
+        return data
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i: int) -> flow.Flow:
+        entry = self.entries[i]
+        try:
+            loaded, end = tnetstring.loads_at(self._read(entry.offset, entry.length), 0)
+        except ValueError:
+            raise exceptions.FlowReadException("Invalid data format.")
+        if end != entry.length:
+            raise exceptions.FlowReadException("Invalid index.")
+        return _flow_from_state(cast(Dict[Union[bytes, str], Any], loaded))
+
+    def get(self, flow_id: str) -> Optional[flow.Flow]:
+        """
+            Deserialize a flow by id.
+        """
+        i = self.positions.get(flow_id)
+        return None if i is None else self[i]
+
+    def stream(self) -> Iterable[flow.Flow]:
+        """
+            Yields Flow objects from the dump, in file order.
+        """
+        for i in range(len(self.entries)):
+            yield self[i]
+
+    def lazy(self) -> Iterable[flow.Flow]:
+        """
+            Yields the flows in the dump, in file order. HTTP flows are
+            LazyHTTPFlows, built from their index summary alone; other flows
+            are deserialized right away.
+
+            Lazy flows keep the reader, and with it the file, open until
+            they are loaded.
+        """
+        for i, entry in enumerate(self.entries):
+            if entry.summary.get("type") == "http":
+                f = LazyHTTPFlow(self, i)
+                self.pending[i] = f
+                yield f
+            else:
+                yield self[i]
+
+    def load_pending(self) -> None:
+        """
+            Load all lazy flows of this reader that have not been loaded yet.
+        """
+        for f in list(self.pending.values()):
+            if isinstance(f, LazyHTTPFlow):
+                f._load()
+
+    def close(self):
+        """
+            Close the file. Flows that have not been loaded yet cannot be
+            loaded afterwards.
+        """
+        _readers.discard(self)
+        self._finalizer()
+
+
+def load_pending(path: str) -> None:
+    """
+        Load all lazy flows that are read from the file at path, so that the
+        file can be overwritten without losing them.
+
+        Raises:
+            FlowReadException, if a flow cannot be loaded.
+    """
+    try:
+        st = os.stat(os.path.expanduser(path))
+    except OSError:
+        return
+    for reader in list(_readers):
+        if reader.ident == (st.st_dev, st.st_ino):
+            reader.load_pending()
+
+
+class LazyHTTPFlow(http.HTTPFlow):
+    """
+        An HTTP flow from an indexed dump that has not been deserialized yet.
+
+        Only the id, the type, the marked flag and the index summary are
+        available up front. Accessing any other attribute loads the flow
+        from the dump and turns this object into a plain HTTPFlow. Changes
+        to id and marked made before that are kept.
+    """
+    _eager = frozenset(["id", "type", "marked", "summary", "_source", "_load"])
+
+    def __init__(self, reader: IndexedFlowReader, i: int) -> None:
+        entry = reader.entries[i]
+        self.id = entry.id
+        self.type = "http"
+        self.marked = entry.summary.get("marked", False)
+        self.summary = entry.summary
+        self._source = (reader, i)
+
+    def __getattribute__(self, name):
+        if name.startswith("__") or name in LazyHTTPFlow._eager:
+            return object.__getattribute__(self, name)
+        self._load()
+        return getattr(self, name)
+
+    def _load(self) -> None:
+        state = self.__dict__
+        reader, i = state["_source"]
+        loaded = reader[i]
+        reader.pending.pop(i, None)
+        del state["_source"]
+        del state["summary"]
+        changed = dict(state)
+        state.update(loaded.__dict__)
+        state.update(changed)
+        self.__class__ = http.HTTPFlow
+
+
+def lazy_summary(f: flow.Flow) -> Optional[Dict[str, Any]]:
+    """
+        The index summary of a flow that has not been loaded yet, or None.
+    """
+    if isinstance(f, LazyHTTPFlow):
+        return f.summary
+    return None
+
+
+def open_reader(fo):
+    """
+        Returns an IndexedFlowReader for indexed dumps and a FlowReader
+        for everything else.
+    """
+    if is_indexed(fo):
+        return IndexedFlowReader(fo)
+    return FlowReader(fo)
+
+
 class FilteredFlowWriter:
     def __init__(self, fo, flt):
         self.fo = fo
@@ -70,18 +436,209 @@ class FilteredFlowWriter:
 def read_flows_from_paths(paths):
     """
     Given a list of filepaths, read all flows and return a list of them.
-    From a performance perspective, streaming would be advisable -
-    however, if there's an error with one of the files, we want it to be raised immediately.
+    If there's an error with one of the files, it is raised immediately.
+    Use stream_flows_from_paths() to avoid keeping all flows in memory.
+
+    Raises:
+        FlowReadException, if any error occurs.
+    """
+    return list(stream_flows_from_paths(paths, validate=False))
+
+
+def validate_paths(paths: Iterable[str]) -> None:
+    """
+    Check the framing of all records in the given files and migrate them,
+    without keeping any of them in memory.
 
     Raises:
         FlowReadException, if any error occurs.
     """
     try:
-        flows = []
         for path in paths:
-            path = os.path.expanduser(path)
-            with open(path, "rb") as f:
-                flows.extend(FlowReader(f).stream())
+            with open(os.path.expanduser(path), "rb") as f:
+                for _ in FlowReader(f).records():
+                    pass
+    except IOError as e:
+        raise exceptions.FlowReadException(e.strerror)
+
+
+def stream_flows_from_paths(paths: Iterable[str], validate: bool = True) -> Iterable[flow.Flow]:
+    """
+    Given a list of filepaths, yield their flows one at a time. Unless
+    validate is False, the files are checked with validate_paths() first,
+    so that errors are raised before any flow is yielded.
+
+    Raises:
+        FlowReadException, if any error occurs.
+    """
+    paths = list(paths)
+    if validate:
+        validate_paths(paths)
+    try:
+        for path in paths:
+            with open(os.path.expanduser(path), "rb") as f:
+                yield from FlowReader(f).stream()
+    except IOError as e:
+        raise exceptions.FlowReadException(e.strerror)
+
+
+# The size of the file segments that read_flows_parallel() hands to each worker.
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+def split_segments(path: str, segment_size: int = SEGMENT_SIZE) -> List[Tuple[int, int]]:
+    """
+    Split a dump into (start, end) ranges of whole records, each at least
+    segment_size bytes long except for the last one. Only the length prefix
+    of each record is read.
+
+    Raises:
+        FlowReadException, if any error occurs.
+    """
+    segments = []
+    try:
+        with open(os.path.expanduser(path), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start = offset = 0
+            while offset < size:
+                f.seek(offset)
+                head = f.read(11)
+                colon = head.find(b":")
+                try:
+                    if colon < 1:
+                        raise ValueError
+                    length = int(head[:colon])
+                    if length < 0:
+                        raise ValueError
+                    offset += colon + length + 2
+                except ValueError:
+                    raise exceptions.FlowReadException("Invalid data format.")
+                if offset - start >= segment_size:
+                    segments.append((start, offset))
+                    start = offset
     except IOError as e:
         raise exceptions.FlowReadException(e.strerror)
+    if offset > size:
+        raise exceptions.FlowReadException("Invalid data format.")
+    if start < offset:
+        segments.append((start, offset))
+    return segments
+
+
+def is_splittable(path: str, segment_size: int = SEGMENT_SIZE) -> bool:
+    """
+    Check whether read_flows_parallel() would split a file into more than one
+    segment. Pipes and other special files have no size to split by.
+
+    Raises:
+        OSError, if the file cannot be accessed.
+    """
+    st = os.stat(os.path.expanduser(path))
+    return stat.S_ISREG(st.st_mode) and st.st_size > segment_size
+
+
+def _read_segment(path: str, start: int, end: int) -> List[flow.Flow]:
+    with open(os.path.expanduser(path), "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    flows = []
+    offset = 0
+    try:
+        while offset < len(data):
+            loaded, offset = tnetstring.loads_at(data, offset)
+            if not _is_index_record(loaded):
+                flows.append(_flow_from_state(cast(Dict[Union[bytes, str], Any], loaded)))
+    except ValueError:
+        raise exceptions.FlowReadException("Invalid data format.")
     return flows
+
+
+def read_flows_parallel(
+    path: str,
+    processes: Optional[int] = None,
+    segment_size: int = SEGMENT_SIZE
+) -> Iterable[List[flow.Flow]]:
+    """
+    Decode a dump in a pool of worker processes. The file is split at
+    record boundaries into segments of about segment_size bytes, and the
+    flows of each segment are yielded as a batch as soon as it and all
+    segments before it are decoded, so flows come out in file order. At
+    most two segments per process are decoded ahead of the consumer.
+
+    processes defaults to the number of CPUs. Files with only a single
+    segment, or a single process, are decoded in the calling process. Pipes
+    and other files that are not regular files are read with a FlowReader,
+    and yielded as a single batch.
+
+    Raises:
+        FlowReadException, if any error occurs, including failures of the
+        worker processes.
+    """
+    try:
+        regular = stat.S_ISREG(os.stat(os.path.expanduser(path)).st_mode)
+        if not regular:
+            with open(os.path.expanduser(path), "rb") as f:
+                yield list(FlowReader(f).stream())
+            return
+    except IOError as e:
+        raise exceptions.FlowReadException(e.strerror)
+    segments = split_segments(path, segment_size)
+    processes = min(processes or os.cpu_count() or 1, len(segments))
+    if processes <= 1:
+        try:
+            for start, end in segments:
+                yield _read_segment(path, start, end)
+        except IOError as e:
+            raise exceptions.FlowReadException(e.strerror)
+        return
+    # Workers are spawned rather than forked, as the master is multithreaded.
+    # They have to import mitmproxy.ctx before mitmproxy.io to avoid an import
+    # cycle, so we do that before they unpickle their first task.
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=importlib.import_module,
+        initargs=("mitmproxy.ctx",),
+    )
+    pending: "collections.deque[concurrent.futures.Future]" = collections.deque()
+    try:
+        todo = iter(segments)
+        for start, end in itertools.islice(todo, 2 * processes):
+            pending.append(pool.submit(_read_segment, path, start, end))
+        while pending:
+            batch = pending.popleft().result()
+            for start, end in itertools.islice(todo, 1):
+                pending.append(pool.submit(_read_segment, path, start, end))
+            yield batch
+    except exceptions.FlowReadException:
+        raise
+    except IOError as e:
+        raise exceptions.FlowReadException(e.strerror)
+    except Exception as e:
+        # The pool broke, or a segment or its flows could not be pickled.
+        raise exceptions.FlowReadException("{}: {}".format(type(e).__name__, e)) from e
+    finally:
+        for fut in pending:
+            fut.cancel()
+        pool.shutdown(wait=False)
+
+
+def read_flow_at(path: str, offset: int) -> flow.Flow:
+    """
+    Read the flow whose record starts at the given offset of a file, as
+    returned by FlowReader.stream_offsets().
+
+    Raises:
+        FlowReadException, if any error occurs.
+    """
+    try:
+        with open(os.path.expanduser(path), "rb") as f:
+            f.seek(offset)
+            loaded = tnetstring.load(f)
+    except IOError as e:
+        raise exceptions.FlowReadException(e.strerror)
+    except (ValueError, IndexError):
+        raise exceptions.FlowReadException("Invalid data format.")
+    if _is_index_record(loaded):
+        raise exceptions.FlowReadException("Invalid data format.")
+    return _flow_from_state(cast(Dict[Union[bytes, str], Any], loaded))
@@ -113,6 +113,9 @@ def _load_http_request(o: http_pb2.HTTPRequest) -> HTTPRequest:
     d["headers"] = []
     for header in o.headers:
         d["headers"].append((bytes(header.name, "utf-8"), bytes(header.value, "utf-8")))
+    # Neither is part of the schema yet.
+    d.setdefault("authority", b"")
+    d["trailers"] = None
 
     return HTTPRequest(**d)
 
@@ -126,6 +129,7 @@ def _load_http_response(o: http_pb2.HTTPResponse) -> HTTPResponse:
     d["headers"] = []
     for header in o.headers:
         d["headers"].append((bytes(header.name, "utf-8"), bytes(header.value, "utf-8")))
+    d["trailers"] = None
 
     return HTTPResponse(**d)
 
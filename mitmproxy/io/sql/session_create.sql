@@ -2,9 +2,25 @@ PRAGMA foreign_keys = ON;
 
 CREATE TABLE flow (
 id VARCHAR(36) PRIMARY KEY,
+timestamp_start REAL,
+method VARCHAR(16),
+host TEXT,
+pretty_host TEXT,
+url TEXT,
+pretty_url TEXT,
+status_code INTEGER,
+request_size INTEGER,
+response_size INTEGER,
 content BLOB
 );
 
+CREATE INDEX flow_timestamp_start ON flow(timestamp_start);
+CREATE INDEX flow_method ON flow(method);
+CREATE INDEX flow_host ON flow(host);
+CREATE INDEX flow_url ON flow(url);
+CREATE INDEX flow_status_code ON flow(status_code);
+CREATE INDEX flow_size ON flow(request_size + response_size);
+
 CREATE TABLE body (
 id INTEGER PRIMARY KEY,
 flow_id VARCHAR(36),
@@ -13,6 +29,8 @@ content BLOB,
 FOREIGN KEY(flow_id) REFERENCES flow(id)
 );
 
+CREATE UNIQUE INDEX body_flow_id ON body(flow_id, type_id);
+
 CREATE TABLE annotation (
 id INTEGER PRIMARY KEY,
 flow_id VARCHAR(36),
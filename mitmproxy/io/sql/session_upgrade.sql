@@ -0,0 +1,21 @@
+BEGIN;
+
+ALTER TABLE flow ADD COLUMN timestamp_start REAL;
+ALTER TABLE flow ADD COLUMN method VARCHAR(16);
+ALTER TABLE flow ADD COLUMN host TEXT;
+ALTER TABLE flow ADD COLUMN pretty_host TEXT;
+ALTER TABLE flow ADD COLUMN url TEXT;
+ALTER TABLE flow ADD COLUMN pretty_url TEXT;
+ALTER TABLE flow ADD COLUMN status_code INTEGER;
+ALTER TABLE flow ADD COLUMN request_size INTEGER;
+ALTER TABLE flow ADD COLUMN response_size INTEGER;
+
+CREATE INDEX flow_timestamp_start ON flow(timestamp_start);
+CREATE INDEX flow_method ON flow(method);
+CREATE INDEX flow_host ON flow(host);
+CREATE INDEX flow_url ON flow(url);
+CREATE INDEX flow_status_code ON flow(status_code);
+CREATE INDEX flow_size ON flow(request_size + response_size);
+
+DELETE FROM body WHERE id NOT IN (SELECT MAX(id) FROM body GROUP BY flow_id, type_id);
+CREATE UNIQUE INDEX body_flow_id ON body(flow_id, type_id);
@@ -21,12 +21,20 @@ This module gives you the following functions:
     :dump:    dump an object as a tnetstring to a file
     :dumps:   dump an object as a tnetstring to a string
     :load:    load a tnetstring-encoded object from a file
+    :load_all: load consecutive tnetstring-encoded objects from a file
+    :iter_load: like load_all, but also yields the offset of each object
     :loads:   load a tnetstring-encoded object from a string
+    :loads_at: load a tnetstring-encoded object at an offset into a buffer
 
 Note that since parsing a tnetstring requires reading all the data into memory
-at once, there's no efficiency gain from using the file-based versions of these
-functions.  They're only here so you can use load() to read precisely one
-item from a file or socket without consuming any extra data.
+at once, there's no efficiency gain from using load() over loads().  It's only
+here so you can read precisely one item from a file or socket without consuming
+any extra data.  To read a stream of items, use load_all(), which reads in large
+blocks.
+
+Parsing works on offsets into the input buffer, which may be bytes or an mmap,
+so only leaf values are copied out of it.  Other buffers such as memoryviews
+are accepted, but copied once.
 
 The tnetstrings specification explicitly states that strings are binary blobs
 and forbids the use of unicode at the protocol level.
@@ -41,10 +49,13 @@ all other strings are returned as plain bytes.
 """
 
 import collections
+import mmap
 import typing
 
 TSerializable = typing.Union[None, str, bool, int, float, bytes, list, tuple, dict]
 
+_BYTES, _STR, _INT, _FLOAT, _BOOL, _NULL, _LIST, _DICT = b",;#^!~]}"
+
 
 def dumps(value: TSerializable) -> bytes:
     """
@@ -153,7 +164,18 @@ def loads(string: bytes) -> TSerializable:
     """
     This function parses a tnetstring into a python object.
     """
-    return pop(string)[0]
+    data = _buffer(string)
+    return _pop(data, 0, len(data))[0]
+
+
+def loads_at(data, offset: int) -> typing.Tuple[TSerializable, int]:
+    """
+    This function parses the tnetstring at the given offset into a python
+    object. It returns a tuple giving the parsed object and the offset just
+    after it.
+    """
+    data = _buffer(data)
+    return _pop(data, offset, len(data))
 
 
 def load(file_handle: typing.BinaryIO) -> TSerializable:
@@ -183,68 +205,160 @@ def load(file_handle: typing.BinaryIO) -> TSerializable:
     return parse(data_type, data)
 
 
+def load_all(file_handle: typing.BinaryIO, bufsize: int = 1024 * 1024) -> typing.Iterator[TSerializable]:
+    """
+    Parse consecutive tnetstrings from a file until EOF.
+
+    Unlike load(), this reads the file in blocks of at least bufsize bytes
+    and parses each item from the buffer in place, so it may consume data
+    after the last item it yields.
+    """
+    for _, value in iter_load(file_handle, bufsize):
+        yield value
+
+
+def iter_load(
+    file_handle: typing.BinaryIO, bufsize: int = 1024 * 1024
+) -> typing.Iterator[typing.Tuple[int, TSerializable]]:
+    """
+    Like load_all(), but yields each item together with its offset from
+    the position the file was at when reading started.
+    """
+    buf = b""
+    base = 0  # the offset of buf[0]
+    pos = 0
+    eof = False
+    while True:
+        colon = buf.find(b":", pos, pos + 11)
+        if colon == -1:
+            if len(buf) - pos > 10:
+                raise ValueError("not a tnetstring: absurdly large length prefix")
+            if eof:
+                if pos == len(buf):
+                    return
+                raise ValueError("not a tnetstring: truncated data")
+            chunk = file_handle.read(bufsize)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            base += pos
+            pos = 0
+            continue
+        try:
+            length = int(buf[pos:colon])
+        except ValueError:
+            raise ValueError("not a tnetstring: missing or invalid length prefix")
+        if length < 0:
+            raise ValueError("not a tnetstring: invalid length prefix: {}".format(length))
+        end = colon + 1 + length
+        if end >= len(buf):
+            if eof:
+                raise ValueError("not a tnetstring: truncated data")
+            # Read at least what is missing for this item, so that large
+            # items cost one read and one copy.
+            chunk = file_handle.read(max(bufsize, end + 1 - len(buf)))
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            base += pos
+            pos = 0
+            continue
+        yield base + pos, _parse(buf[end], buf, colon + 1, end)
+        pos = end + 1
+
+
 def parse(data_type: int, data: bytes) -> TSerializable:
-    if data_type == ord(b','):
+    data = _buffer(data)
+    return _parse(data_type, data, 0, len(data))
+
+
+def _buffer(data):
+    """
+    The parser needs find() and slices that are bytes, which bytes and mmap
+    objects provide. Other buffers are copied once.
+    """
+    if isinstance(data, (bytes, mmap.mmap)):
         return data
-    if data_type == ord(b';'):
-        return data.decode("utf8")
-    if data_type == ord(b'#'):
+    return bytes(data)
+
+
+def _parse(data_type: int, data, start: int, end: int) -> TSerializable:
+    """
+    Parse the payload data[start:end] with the given type tag.
+
+    Containers are parsed by offset, so only leaf values are copied out of
+    the buffer.
+    """
+    if data_type == _BYTES:
+        return data[start:end]
+    if data_type == _STR:
+        return data[start:end].decode("utf8")
+    if data_type == _INT:
         try:
-            return int(data)
+            return int(data[start:end])
         except ValueError:
-            raise ValueError(f"not a tnetstring: invalid integer literal: {data!r}")
-    if data_type == ord(b'^'):
+            raise ValueError(f"not a tnetstring: invalid integer literal: {data[start:end]!r}")
+    if data_type == _FLOAT:
         try:
-            return float(data)
+            return float(data[start:end])
         except ValueError:
-            raise ValueError(f"not a tnetstring: invalid float literal: {data!r}")
-    if data_type == ord(b'!'):
-        if data == b'true':
+            raise ValueError(f"not a tnetstring: invalid float literal: {data[start:end]!r}")
+    if data_type == _BOOL:
+        value = data[start:end]
+        if value == b'true':
             return True
-        elif data == b'false':
+        elif value == b'false':
             return False
         else:
-            raise ValueError(f"not a tnetstring: invalid boolean literal: {data!r}")
-    if data_type == ord(b'~'):
-        if data:
-            raise ValueError(f"not a tnetstring: invalid null literal: {data!r}")
+            raise ValueError(f"not a tnetstring: invalid boolean literal: {value!r}")
+    if data_type == _NULL:
+        if end > start:
+            raise ValueError(f"not a tnetstring: invalid null literal: {data[start:end]!r}")
         return None
-    if data_type == ord(b']'):
+    if data_type == _LIST:
         l = []
-        while data:
-            item, data = pop(data)
-            l.append(item)  # type: ignore
+        while start < end:
+            item, start = _pop(data, start, end)
+            l.append(item)
         return l
-    if data_type == ord(b'}'):
+    if data_type == _DICT:
         d = {}
-        while data:
-            key, data = pop(data)
-            val, data = pop(data)
+        while start < end:
+            key, start = _pop(data, start, end)
+            val, start = _pop(data, start, end)
             d[key] = val  # type: ignore
         return d
     raise ValueError("unknown type tag: {}".format(data_type))
 
 
-def pop(data: bytes) -> typing.Tuple[TSerializable, bytes]:
+def _pop(data, start: int, end: int) -> typing.Tuple[TSerializable, int]:
     """
-    This function parses a tnetstring into a python object.
-    It returns a tuple giving the parsed object and a string
-    containing any unparsed data from the end of the string.
+    Parse the tnetstring at data[start:], which must not extend past end.
+    Returns the parsed object and the offset just after it.
     """
-    #  Parse out data length, type and remaining string.
+    colon = data.find(b":", start, start + 11)
     try:
-        blength, data = data.split(b':', 1)
-        length = int(blength)
+        if colon == -1:
+            raise ValueError
+        length = int(data[start:colon])
     except ValueError:
-        raise ValueError(f"not a tnetstring: missing or invalid length prefix: {data!r}")
-    try:
-        data, data_type, remain = data[:length], data[length], data[length + 1:]
-    except IndexError:
-        #  This fires if len(data) < dlen, meaning we don't need
-        #  to further validate that data is the right length.
+        raise ValueError(f"not a tnetstring: missing or invalid length prefix: {data[start:start + 11]!r}")
+    start = colon + 1
+    tag = start + length
+    if length < 0 or tag >= end:
+        #  This fires if the payload and type tag do not fit into what is
+        #  left, meaning we don't need to further validate the length.
         raise ValueError("not a tnetstring: invalid length prefix: {}".format(length))
     # Parse the data based on the type tag.
-    return parse(data_type, data), remain
+    return _parse(data[tag], data, start, tag), tag + 1
+
+
+def pop(data: bytes) -> typing.Tuple[TSerializable, bytes]:
+    """
+    This function parses a tnetstring into a python object.
+    It returns a tuple giving the parsed object and a string
+    containing any unparsed data from the end of the string.
+    """
+    value, offset = _pop(_buffer(data), 0, len(data))
+    return value, data[offset:]
 
 
-__all__ = ["dump", "dumps", "load", "loads", "pop"]
+__all__ = ["dump", "dumps", "load", "iter_load", "load_all", "loads", "loads_at", "pop"]
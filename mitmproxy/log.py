@@ -56,9 +56,17 @@ class Log:
         self(txt, "error")
 
     def __call__(self, text, level="info"):
-        asyncio.get_event_loop().call_soon(
-            self.master.addons.trigger, "log", LogEntry(text, level)
-        )
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            # We are on a connection thread, e.g. in an @inline event handler.
+            self.master.channel.loop.call_soon_threadsafe(
+                self.master.addons.trigger, "log", LogEntry(text, level)
+            )
+        else:
+            loop.call_soon(
+                self.master.addons.trigger, "log", LogEntry(text, level)
+            )
 
 
 LogTierOrder = [
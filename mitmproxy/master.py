@@ -72,7 +72,10 @@ class Master:
     def start(self):
         self.should_exit.clear()
         if self.server:
-            ServerThread(self.server).start()
+            if getattr(self.server, "asynchronous", False):
+                self.server.start_serving()
+            else:
+                ServerThread(self.server).start()
 
     async def running(self):
         self.addons.trigger("running")
@@ -4,6 +4,7 @@ Utility functions for decoding response bodies.
 
 import codecs
 import collections
+import threading
 from io import BytesIO
 
 import gzip
@@ -11,16 +12,92 @@ import zlib
 import brotli
 import zstandard as zstd
 
-from typing import Union, Optional, AnyStr, overload  # noqa
+from typing import Dict, Iterator, Tuple, Type, Union, Optional, AnyStr, cast, overload  # noqa
 
-# We have a shared single-element cache for encoding and decoding.
-# This is quite useful in practice, e.g.
-# flow.request.content = flow.request.content.replace(b"foo", b"bar")
-# does not require an .encode() call if content does not contain b"foo"
-CachedDecode = collections.namedtuple(
-    "CachedDecode", "encoded encoding errors decoded"
-)
-_cache = CachedDecode(None, None, None, None)
+
+class CodecCache:
+    """
+    A thread-safe LRU cache of (encoded, decoded) body pairs, which can be
+    looked up in both directions. This is quite useful in practice, e.g.
+    flow.request.content = flow.request.content.replace(b"foo", b"bar")
+    does not require an .encode() call if content does not contain b"foo".
+
+    Entries are keyed on the content itself, i.e. its hash, which bytes
+    objects compute once and then keep. The total size of all bodies is
+    bounded by budget.
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.size = 0
+        self.decoded: "collections.OrderedDict[Tuple[bytes, str, str], bytes]" = collections.OrderedDict()
+        self.encoded: Dict[Tuple[bytes, str, str], bytes] = {}
+        self.lock = threading.Lock()
+
+    def get_decoded(self, encoded: bytes, encoding: str, errors: str) -> Optional[bytes]:
+        key = (encoded, encoding, errors)
+        with self.lock:
+            decoded = self.decoded.get(key)
+            if decoded is not None:
+                self.decoded.move_to_end(key)
+            return decoded
+
+    def get_encoded(self, decoded: bytes, encoding: str, errors: str) -> Optional[bytes]:
+        with self.lock:
+            encoded = self.encoded.get((decoded, encoding, errors))
+            if encoded is not None:
+                self.decoded.move_to_end((encoded, encoding, errors))
+            return encoded
+
+    def put(self, encoded: bytes, encoding: str, errors: str, decoded: bytes) -> None:
+        size = len(encoded) + len(decoded)
+        if size > self.budget:
+            return
+        with self.lock:
+            self._remove((encoded, encoding, errors))
+            self._remove_encoded((decoded, encoding, errors))
+            self.decoded[(encoded, encoding, errors)] = decoded
+            self.encoded[(decoded, encoding, errors)] = encoded
+            self.size += size
+            while self.size > self.budget:
+                self._remove(next(iter(self.decoded)))
+
+    def _remove(self, key: Tuple[bytes, str, str]) -> None:
+        decoded = self.decoded.pop(key, None)
+        if decoded is not None:
+            encoded, encoding, errors = key
+            del self.encoded[(decoded, encoding, errors)]
+            self.size -= len(encoded) + len(decoded)
+
+    def _remove_encoded(self, key: Tuple[bytes, str, str]) -> None:
+        encoded = self.encoded.get(key)
+        if encoded is not None:
+            _, encoding, errors = key
+            self._remove((encoded, encoding, errors))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.decoded.clear()
+            self.encoded.clear()
+            self.size = 0
+
+
+# The compression codecs. Only their results are worth caching.
+COMPRESSED_ENCODINGS = ("gzip", "deflate", "br", "zstd")
+_cache = CodecCache(32 * 1024 * 1024)
+# The limit on the decoded size of compressed bodies in decode(), None for no
+# limit. The core addon ties it to the body_size_limit option.
+max_decoded_size: Optional[int] = None
+
+
+def set_max_decoded_size(size: Optional[int]) -> None:
+    """
+    Set the limit on the decoded size of compressed bodies. Cached results
+    from before the change are dropped, as they may exceed the new limit.
+    """
+    global max_decoded_size
+    max_decoded_size = size
+    _cache.clear()
 
 
 @overload
@@ -44,31 +121,33 @@ def decode(
     """
     Decode the given input object
 
+    Compressed bodies are decoded incrementally and must not exceed
+    max_decoded_size.
+
     Returns:
         The decoded value
 
     Raises:
-        ValueError, if decoding fails.
+        ValueError, if decoding fails or the body exceeds max_decoded_size.
     """
     if encoded is None:
         return None
 
-    global _cache
-    cached = (
-            isinstance(encoded, bytes) and
-            _cache.encoded == encoded and
-            _cache.encoding == encoding and
-            _cache.errors == errors
-    )
-    if cached:
-        return _cache.decoded
+    cacheable = isinstance(encoded, bytes) and encoding in COMPRESSED_ENCODINGS
+    if cacheable:
+        cached = _cache.get_decoded(encoded, encoding, errors)  # type: ignore
+        if cached is not None:
+            return cached
     try:
         try:
-            decoded = custom_decode[encoding](encoded)
+            if cacheable and max_decoded_size is not None:
+                decoded = _decode_all(get_decoder(encoding, max_decoded_size), encoded)  # type: ignore
+            else:
+                decoded = custom_decode[encoding](encoded)
         except KeyError:
             decoded = codecs.decode(encoded, encoding, errors)  # type: ignore
-        if encoding in ("gzip", "deflate", "br", "zstd"):
-            _cache = CachedDecode(encoded, encoding, errors, decoded)
+        if cacheable:
+            _cache.put(encoded, encoding, errors, decoded)  # type: ignore
         return decoded
     except TypeError:
         raise
@@ -109,22 +188,18 @@ def encode(decoded: Union[None, str, bytes], encoding, errors='strict') -> Union
     if decoded is None:
         return None
 
-    global _cache
-    cached = (
-            isinstance(decoded, bytes) and
-            _cache.decoded == decoded and
-            _cache.encoding == encoding and
-            _cache.errors == errors
-    )
-    if cached:
-        return _cache.encoded
+    cacheable = isinstance(decoded, bytes) and encoding in COMPRESSED_ENCODINGS
+    if cacheable:
+        cached = _cache.get_encoded(decoded, encoding, errors)  # type: ignore
+        if cached is not None:
+            return cached
     try:
         try:
             encoded = custom_encode[encoding](decoded)
         except KeyError:
             encoded = codecs.encode(decoded, encoding, errors)  # type: ignore
-        if encoding in ("gzip", "deflate", "br", "zstd"):
-            _cache = CachedDecode(encoded, encoding, errors, decoded)
+        if cacheable:
+            _cache.put(encoded, encoding, errors, decoded)  # type: ignore
         return encoded
     except TypeError:
         raise
@@ -145,11 +220,267 @@ def identity(content):
     return content
 
 
-def decode_gzip(content: bytes) -> bytes:
-    if not content:
+class Decoder:
+    """
+        Decodes a body incrementally. feed() takes chunks of encoded data
+        and returns what can be decoded so far, finish() returns the rest
+        and checks that the stream was complete.
+
+        If max_size is set, ValueError is raised as soon as the decoded size
+        exceeds it, which protects against decompression bombs. zlib and
+        brotli stop at the limit. zstd cannot limit its output, so it is fed
+        slices of input that cannot decode to much more than what is left of
+        the limit, and checked in between.
+    """
+    slice_size = 16 * 1024
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.started = False
+
+    def feed(self, data: bytes) -> bytes:
+        if not data:
+            return b""
+        self.started = True
+        try:
+            if self.max_size is None:
+                return self._count(self._decompress(data))
+            out = []
+            pos = 0
+            while pos < len(data):
+                n = self._slice_size()
+                out.append(self._count(self._decompress(data[pos:pos + n])))
+                pos += n
+            return b"".join(out)
+        except (zlib.error, brotli.error, zstd.ZstdError) as e:
+            raise ValueError(str(e)) from e
+
+    def finish(self) -> bytes:
+        if not self.started:
+            return b""
+        try:
+            return self._count(self._finish())
+        except (zlib.error, brotli.error, zstd.ZstdError) as e:
+            raise ValueError(str(e)) from e
+
+    def _count(self, out: bytes) -> bytes:
+        self._count_declared(len(out))
+        self.size += len(out)
+        return out
+
+    def _count_declared(self, size: int) -> None:
+        if self.max_size is not None and self.size + size > self.max_size:
+            raise ValueError("Decoded content exceeds {} bytes.".format(self.max_size))
+
+    def _limit(self) -> int:
+        # The output limit for decompressors that support one, 0 means none.
+        # One byte over what is allowed, so that _count notices.
+        if self.max_size is None:
+            return 0
+        return max(self.max_size - self.size + 1, 1)
+
+    def _slice_size(self) -> int:
+        # How much input to decompress before checking the limit again.
+        return self.slice_size
+
+    def _decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def _finish(self) -> bytes:
+        return b""
+
+
+class IdentityDecoder(Decoder):
+    def _decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class GzipDecoder(Decoder):
+    slice_size = 1024 * 1024
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        super().__init__(max_size)
+        self.obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _decompress(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            out.append(self.obj.decompress(data, self._limit()))
+            if self.obj.unconsumed_tail:
+                # Over the limit, _count will raise.
+                break
+            if self.obj.eof and self.obj.unused_data:
+                # Concatenated gzip members decode to the concatenated data.
+                data = self.obj.unused_data
+                self.obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = b""
+        return b"".join(out)
+
+    def _finish(self) -> bytes:
+        if not self.obj.eof:
+            raise ValueError("Compressed data ended before the end-of-stream marker.")
+        return b""
+
+
+class DeflateDecoder(GzipDecoder):
+    """
+        Some servers may respond with compressed data without a zlib header
+        or checksum. An undocumented feature of zlib permits the lenient
+        decompression of data missing both values.
+
+        http://bugs.python.org/issue5784
+    """
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        Decoder.__init__(self, max_size)
+        self.obj = zlib.decompressobj()
+        # Until the first output, we keep the input to start over without
+        # a zlib header if it turns out not to have one.
+        self.pending: Optional[bytearray] = bytearray()
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.pending is None:
+            return self.obj.decompress(data, self._limit())
+        self.pending += data
+        try:
+            out = self.obj.decompress(data, self._limit())
+        except zlib.error:
+            self.obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            out = self.obj.decompress(bytes(self.pending), self._limit())
+            self.pending = None
+        if out:
+            self.pending = None
+        return out
+
+    def _finish(self) -> bytes:
+        if not self.obj.eof:
+            if self.pending is not None and self.obj.unconsumed_tail == b"":
+                self.obj = zlib.decompressobj(-zlib.MAX_WBITS)
+                out = self.obj.decompress(bytes(self.pending), self._limit())
+                self.pending = None
+                if self.obj.eof:
+                    return out
+            raise ValueError("Compressed data ended before the end-of-stream marker.")
+        return b""
+
+
+class BrotliDecoder(Decoder):
+    # Brotli < 1.1 cannot limit its output. A few bytes of input can still
+    # decode to a lot, so this is only a best effort.
+    slice_size = 64
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        super().__init__(max_size)
+        self.obj = brotli.Decompressor()
+        self.bounded = hasattr(self.obj, "can_accept_more_data")
+        if self.bounded:
+            self.slice_size = Decoder.slice_size
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.max_size is None or not self.bounded:
+            return self.obj.process(data)
+        limit = self._limit()
+        out = [self.obj.process(data, output_buffer_limit=limit)]
+        size = len(out[0])
+        # Without room for more input, the decompressor has more output.
+        while size < limit and not self.obj.can_accept_more_data():
+            out.append(self.obj.process(b"", output_buffer_limit=limit - size))
+            size += len(out[-1])
+        return b"".join(out)
+
+    def _finish(self) -> bytes:
+        if not self.obj.is_finished():
+            raise ValueError("Compressed data ended before the end-of-stream marker.")
         return b""
-    gfile = gzip.GzipFile(fileobj=BytesIO(content))
-    return gfile.read()
+
+
+class ZstdDecoder(Decoder):
+    # A zstd block decodes to at most 128 KiB and takes at least 3 bytes.
+    MAX_RATIO = 128 * 1024 // 3
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        super().__init__(max_size)
+        self.obj = zstd.ZstdDecompressor().decompressobj()
+        self.header = True
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.header and self.max_size is not None:
+            # Frames usually declare their size, so bombs can be rejected
+            # before decompressing anything.
+            self.header = False
+            try:
+                declared = zstd.get_frame_parameters(data).content_size
+            except zstd.ZstdError:
+                pass
+            else:
+                if declared != zstd.CONTENTSIZE_UNKNOWN:
+                    self._count_declared(declared)
+        return self.obj.decompress(data)
+
+    def _slice_size(self) -> int:
+        # Frames that do not declare their size are decoded a few blocks at
+        # a time, so that they stay within about one block of the limit.
+        left = cast(int, self.max_size) - self.size
+        return max(3, min(self.slice_size, left // self.MAX_RATIO))
+
+    def _finish(self) -> bytes:
+        # Older versions of zstandard cannot tell whether the frame is complete.
+        if not getattr(self.obj, "eof", True):
+            raise ValueError("Compressed data ended before the end-of-stream marker.")
+        return b""
+
+
+decoders: Dict[str, Type[Decoder]] = {
+    "none": IdentityDecoder,
+    "identity": IdentityDecoder,
+    "gzip": GzipDecoder,
+    "deflate": DeflateDecoder,
+    "br": BrotliDecoder,
+    "zstd": ZstdDecoder,
+}
+
+
+def get_decoder(encoding: str, max_size: Optional[int] = None) -> Decoder:
+    """
+        Returns a streaming decoder for the given content-encoding.
+
+        Raises:
+            ValueError, if there is no streaming decoder for the encoding.
+    """
+    try:
+        return decoders[encoding](max_size)
+    except KeyError:
+        raise ValueError("No streaming decoder for {}.".format(repr(encoding)))
+
+
+def decode_iter(
+        encoded: bytes, encoding: str, chunk_size: int = 64 * 1024, max_size: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+        Decode a body incrementally, feeding chunk_size bytes at a time.
+        Callers that stop iterating early avoid decoding the rest.
+
+        Raises:
+            ValueError, if decoding fails or the body exceeds max_size.
+    """
+    decoder = get_decoder(encoding, max_size)
+    for i in range(0, len(encoded), chunk_size):
+        out = decoder.feed(encoded[i:i + chunk_size])
+        if out:
+            yield out
+    out = decoder.finish()
+    if out:
+        yield out
+
+
+def _decode_all(decoder: Decoder, content: bytes) -> bytes:
+    return decoder.feed(content) + decoder.finish()
+
+
+def decode_gzip(content: bytes) -> bytes:
+    return _decode_all(GzipDecoder(), content)
 
 
 def encode_gzip(content: bytes) -> bytes:
@@ -161,9 +492,7 @@ def encode_gzip(content: bytes) -> bytes:
 
 
 def decode_brotli(content: bytes) -> bytes:
-    if not content:
-        return b""
-    return brotli.decompress(content)
+    return _decode_all(BrotliDecoder(), content)
 
 
 def encode_brotli(content: bytes) -> bytes:
@@ -171,15 +500,7 @@ def encode_brotli(content: bytes) -> bytes:
 
 
 def decode_zstd(content: bytes) -> bytes:
-    if not content:
-        return b""
-    zstd_ctx = zstd.ZstdDecompressor()
-    try:
-        return zstd_ctx.decompress(content)
-    except zstd.ZstdError:
-        # If the zstd stream is streamed without a size header,
-        # try decoding with a 10MiB output buffer
-        return zstd_ctx.decompress(content, max_output_size=10 * 2 ** 20)
+    return _decode_all(ZstdDecoder(), content)
 
 
 def encode_zstd(content: bytes) -> bytes:
@@ -189,19 +510,10 @@ def encode_zstd(content: bytes) -> bytes:
 
 def decode_deflate(content: bytes) -> bytes:
     """
-        Returns decompressed data for DEFLATE. Some servers may respond with
-        compressed data without a zlib header or checksum. An undocumented
-        feature of zlib permits the lenient decompression of data missing both
-        values.
-
-        http://bugs.python.org/issue5784
+        Returns decompressed data for DEFLATE, with or without a zlib
+        header and checksum. See DeflateDecoder.
     """
-    if not content:
-        return b""
-    try:
-        return zlib.decompress(content)
-    except zlib.error:
-        return zlib.decompress(content, -15)
+    return _decode_all(DeflateDecoder(), content)
 
 
 def encode_deflate(content: bytes) -> bytes:
@@ -228,4 +540,4 @@ custom_encode = {
     "zstd": encode_zstd,
 }
 
-__all__ = ["encode", "decode"]
+__all__ = ["encode", "decode", "decode_iter", "get_decoder"]
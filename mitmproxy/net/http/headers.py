@@ -1,5 +1,5 @@
 import collections
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from mitmproxy.coretypes import multidict
 from mitmproxy.utils import strutils
@@ -89,6 +89,27 @@ class Headers(multidict.MultiDict):
         }
         self.update(headers)
 
+    @property
+    def fields(self) -> Tuple[Tuple[bytes, bytes], ...]:
+        return self._fields
+
+    @fields.setter
+    def fields(self, value):
+        self._fields = value
+        self._index = None
+
+    def _get_index(self) -> Dict[bytes, List[int]]:
+        """
+        A map from lowercase header names to the positions of their fields,
+        in wire order. It is built on first use after the fields change.
+        """
+        if self._index is None:
+            index: Dict[bytes, List[int]] = {}
+            for i, (k, _) in enumerate(self._fields):
+                index.setdefault(k.lower(), []).append(i)
+            self._index = index
+        return self._index
+
     @staticmethod
     def _reduce_values(values):
         # Headers can be folded
@@ -105,13 +126,26 @@ class Headers(multidict.MultiDict):
         else:
             return b""
 
+    def __contains__(self, key):
+        return _always_bytes(key).lower() in self._get_index()
+
     def __delitem__(self, key):
-        key = _always_bytes(key)
-        super().__delitem__(key)
+        positions = self._get_index().get(_always_bytes(key).lower())
+        if not positions:
+            raise KeyError(key)
+        drop = set(positions)
+        self.fields = tuple(
+            field for i, field in enumerate(self._fields)
+            if i not in drop
+        )
 
     def __iter__(self):
-        for x in super().__iter__():
-            yield _native(x)
+        fields = self._fields
+        for positions in self._get_index().values():
+            yield _native(fields[positions[0]][0])
+
+    def __len__(self):
+        return len(self._get_index())
 
     def get_all(self, name):
         """
@@ -119,11 +153,9 @@ class Headers(multidict.MultiDict):
         This is useful for Set-Cookie headers, which do not support folding.
         See also: https://tools.ietf.org/html/rfc7230#section-3.2.2
         """
-        name = _always_bytes(name)
-        return [
-            _native(x) for x in
-            super().get_all(name)
-        ]
+        positions = self._get_index().get(_always_bytes(name).lower(), ())
+        fields = self._fields
+        return [_native(fields[i][1]) for i in positions]
 
     def set_all(self, name, values):
         """
@@ -132,7 +164,39 @@ class Headers(multidict.MultiDict):
         """
         name = _always_bytes(name)
         values = [_always_bytes(x) for x in values]
-        return super().set_all(name, values)
+        index = self._get_index()
+        key = name.lower()
+        positions = index.get(key, [])
+        fields = list(self._fields)
+        # Existing fields keep their name and position, surplus fields are
+        # removed and additional values are added at the end.
+        for i, value in zip(positions, values):
+            fields[i] = (fields[i][0], value)
+        if len(values) < len(positions):
+            drop = set(positions[len(values):])
+            self.fields = tuple(field for i, field in enumerate(fields) if i not in drop)
+            return
+        start = len(fields)
+        fields.extend((name, value) for value in values[len(positions):])
+        self.fields = tuple(fields)
+        # No field has moved, so we can keep the index. It may be shared with
+        # copies of these headers, so we update a copy of it.
+        index = dict(index)
+        if len(fields) > start:
+            index[key] = positions + list(range(start, len(fields)))
+        self._index = index
+
+    def add(self, key, value):
+        key = _always_bytes(key)
+        value = _always_bytes(value)
+        index = self._index
+        self.fields = self._fields + ((key, value),)
+        if index is not None:
+            # Appending does not move other fields, so the index stays valid.
+            # It may be shared with copies of these headers, so we update a copy of it.
+            index = dict(index)
+            index[key.lower()] = index.get(key.lower(), []) + [len(self._fields) - 1]
+            self._index = index
 
     def insert(self, index, key, value):
         key = _always_bytes(key)
@@ -1,6 +1,8 @@
+import collections
 import re
+import threading
 from dataclasses import dataclass, fields
-from typing import Callable, Optional, Union, cast
+from typing import Callable, Optional, Tuple, Union, cast
 
 from mitmproxy.coretypes import serializable
 from mitmproxy.net.http import encoding
@@ -45,6 +47,57 @@ class MessageData(serializable.Serializable):
         return cls(**state)
 
 
+class DecodedCache:
+    """
+    A process-wide LRU cache for decoded message bodies.
+
+    Entries are keyed on the identity of the raw content and the
+    content-encoding, so replacing a message's raw_content or changing its
+    content-encoding header makes the old entry unreachable. Each entry holds
+    a reference to its raw content, which keeps the identity unique for the
+    entry's lifetime. The total size of raw and decoded bodies is bounded by
+    budget; least recently used entries are evicted first.
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.size = 0
+        self.entries: "collections.OrderedDict[Tuple[int, str], Tuple[bytes, bytes]]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, raw: bytes, ce: str) -> Optional[bytes]:
+        key = (id(raw), ce)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] is not raw:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, raw: bytes, ce: str, decoded: bytes) -> None:
+        size = len(raw) + len(decoded)
+        if decoded is raw or size > self.budget:
+            return
+        key = (id(raw), ce)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= len(old[0]) + len(old[1])
+            self.entries[key] = (raw, decoded)
+            self.size += size
+            while self.size > self.budget:
+                _, (r, d) = self.entries.popitem(last=False)
+                self.size -= len(r) + len(d)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+decoded_cache = DecodedCache(64 * 1024 * 1024)
+
+
 class Message(serializable.Serializable):
     @classmethod
     def from_state(cls, state):
@@ -114,19 +167,25 @@ class Message(serializable.Serializable):
         The uncompressed HTTP message body as bytes.
 
         Raises:
-            ValueError, when the HTTP content-encoding is invalid and strict is True.
+            ValueError, when the HTTP content-encoding is invalid or the body
+            decodes to more than the body_size_limit option, and strict is True.
 
         See also: :py:class:`raw_content`, :py:attr:`text`
         """
-        if self.raw_content is None:
+        raw = self.raw_content
+        if raw is None:
             return None
         ce = self.headers.get("content-encoding")
         if ce:
+            content = decoded_cache.get(raw, ce)
+            if content is not None:
+                return content
             try:
-                content = encoding.decode(self.raw_content, ce)
+                content = encoding.decode(raw, ce)
                 # A client may illegally specify a byte -> str encoding here (e.g. utf8)
                 if isinstance(content, str):
                     raise ValueError("Invalid Content-Encoding: {}".format(ce))
+                decoded_cache.put(raw, ce, content)
                 return content
             except ValueError:
                 if strict:
@@ -147,6 +206,8 @@ class Message(serializable.Serializable):
         ce = self.headers.get("content-encoding")
         try:
             self.raw_content = encoding.encode(value, ce or "identity")
+            if ce:
+                decoded_cache.put(self.raw_content, ce, value)
         except ValueError:
             # So we have an invalid content-encoding?
             # Let's remove it!
@@ -1,5 +1,6 @@
 import os
 import errno
+import queue
 import select
 import socket
 import sys
@@ -105,23 +106,32 @@ class Writer(_FileLike):
 
 
 class Reader(_FileLike):
+    """
+    Reads from a socket, pyOpenSSL connection or file object.
+
+    Data is read into preallocated buffers instead of being concatenated. To
+    find the end of a line, readline peeks into the connection and only
+    consumes the bytes up to and including the newline. Nothing is buffered
+    beyond what has been asked for, so the underlying connection can still be
+    upgraded to TLS, relayed or checked for readability with select at any
+    time.
+    """
+    PEEK_SIZE = 256
 
-    def read(self, length):
+    def _call(self, f, *args):
         """
-            If length is -1, we read until connection closes.
+        Calls f, translating errors to our exceptions.
+
+        Returns:
+            f's result, or None if the connection was closed.
         """
-        result = b''
         start = time.time()
-        while length == -1 or length > 0:
-            if length == -1 or length > self.BLOCKSIZE:
-                rlen = self.BLOCKSIZE
-            else:
-                rlen = length
+        while True:
             try:
-                data = self.o.read(rlen)
+                return f(*args)
             except SSL.ZeroReturnError:
                 # TLS connection was shut down cleanly
-                break
+                return None
             except (SSL.WantWriteError, SSL.WantReadError):
                 # From the OpenSSL docs:
                 # If the underlying BIO is non-blocking, SSL_read() will also return when the
@@ -141,34 +151,98 @@ class Reader(_FileLike):
                 raise exceptions.TcpDisconnect(str(e))
             except SSL.SysCallError as e:
                 if e.args == (-1, 'Unexpected EOF'):
-                    break
+                    return None
                 raise exceptions.TlsException(str(e))
             except SSL.Error as e:
                 raise exceptions.TlsException(str(e))
+
+    def _readinto(self, view):
+        """
+        Reads at most len(view) bytes into view.
+
+        Returns:
+            The number of bytes read, 0 if the connection was closed.
+        """
+        if isinstance(self.o, socket_fileobject):
+            n = self._call(self.o.readinto, view)
+        elif isinstance(self.o, SSL.Connection):
+            n = self._call(self.o.recv_into, view, len(view))
+        else:
+            data = self._call(self.o.read, len(view))
+            n = len(data) if data else 0
+            view[:n] = data or b""
+        if n is not None:
             self.first_byte_timestamp = self.first_byte_timestamp or time.time()
-            if not data:
-                break
-            result += data
-            if length != -1:
-                length -= len(data)
+        return n or 0
+
+    def _peek(self, length):
+        """
+        Like .peek, but with the same error handling as .read.
+
+        Returns:
+            Up to the next N bytes, or None if we cannot peek into the underlying file object.
+        """
+        if isinstance(self.o, socket_fileobject):
+            return self._call(self.o._sock.recv, length, socket.MSG_PEEK) or b""
+        elif isinstance(self.o, SSL.Connection):
+            return self._call(self.o.recv, length, socket.MSG_PEEK) or b""
+        return None
+
+    def read(self, length):
+        """
+            If length is -1, we read until connection closes.
+        """
+        if length == -1:
+            result = bytearray()
+            chunk = bytearray(self.BLOCKSIZE)
+            with memoryview(chunk) as view:
+                while True:
+                    n = self._readinto(view)
+                    if not n:
+                        break
+                    result += view[:n]
+        else:
+            # Do not trust length to allocate the full buffer upfront,
+            # the buffer grows as data arrives.
+            result = bytearray(min(length, self.BLOCKSIZE))
+            pos = 0
+            while pos < length:
+                if pos == len(result):
+                    result.extend(bytes(min(length - pos, len(result))))
+                with memoryview(result) as view:
+                    n = self._readinto(view[pos:pos + self.BLOCKSIZE])
+                if not n:
+                    del result[pos:]
+                    break
+                pos += n
+        result = bytes(result)
         self.add_log(result)
         return result
 
     def readline(self, size=None):
-        result = b''
-        bytes_read = 0
-        while True:
-            if size is not None and bytes_read >= size:
-                break
-            ch = self.read(1)
-            bytes_read += 1
-            if not ch:
-                break
-            else:
+        peek_size = self.PEEK_SIZE
+        result = bytearray()
+        while size is None or len(result) < size:
+            data = self._peek(peek_size)
+            if data is None:
+                # We cannot peek into file objects, read byte by byte.
+                ch = self.read(1)
                 result += ch
-                if ch == b'\n':
+                if not ch or ch == b'\n':
                     break
-        return result
+                continue
+            if not data:
+                break
+            end = data.find(b'\n') + 1 or len(data)
+            if size is not None:
+                end = min(end, size - len(result))
+            line = self.read(end)
+            result += line
+            if len(line) < end or line.endswith(b'\n'):
+                break
+            if len(data) == peek_size:
+                peek_size = min(peek_size * 2, self.BLOCKSIZE)
+        return bytes(result)
 
     def safe_read(self, length):
         """
@@ -232,6 +306,66 @@ def ssl_read_select(rlist, timeout):
     ] or select.select(rlist, (), (), timeout)[0]
 
 
+def relay(a, b, counts, bufsize, should_exit):
+    """
+    Copy data between two plain sockets in both directions until both peers
+    have closed their end or should_exit is set. EOF on one side is passed
+    on as a half-close to the other.
+
+    Where splice(2) is available, data is moved through a pipe in the kernel
+    and never copied into Python objects.
+
+    Args:
+        counts: list that receives the number of bytes sent from a to b
+            and from b to a. It is updated as data flows, so it is also
+            accurate if an error is raised.
+        bufsize: maximum number of bytes moved per read.
+        should_exit: threading.Event that is checked at least every 10s.
+
+    Raises:
+        socket.error if either socket fails.
+    """
+    peers = {a: (b, 0), b: (a, 1)}
+    conns = [a, b]
+    pipe = os.pipe() if hasattr(os, "splice") else None
+    buf = memoryview(bytearray(bufsize)) if pipe is None else None
+    try:
+        while conns and not should_exit.is_set():
+            for src in select.select(conns, (), (), 10)[0]:
+                dst, direction = peers[src]
+                try:
+                    if pipe:
+                        size = os.splice(src.fileno(), pipe[1], bufsize)
+                    else:
+                        size = src.recv_into(buf, bufsize)
+                except BlockingIOError:
+                    continue
+                if not size:
+                    conns.remove(src)
+                    dst.shutdown(socket.SHUT_WR)
+                    continue
+                if pipe:
+                    _splice_all(pipe[0], dst, size)
+                else:
+                    dst.sendall(buf[:size])
+                counts[direction] += size
+    finally:
+        if pipe:
+            os.close(pipe[0])
+            os.close(pipe[1])
+
+
+def _splice_all(fd, sock, size):
+    # Sockets with a timeout are non-blocking at the OS level, so we have to
+    # wait for writability ourselves.
+    while size:
+        try:
+            size -= os.splice(fd, sock.fileno(), size)
+        except BlockingIOError:
+            if not select.select((), (sock,), (), sock.gettimeout())[1]:
+                raise socket.timeout("timed out")
+
+
 def close_socket(sock):
     """
     Does a hard close of a socket, without emitting a RST.
@@ -391,9 +525,9 @@ class TCPClient(_Connection):
             **sslctx_kwargs
         )
         self.connection = SSL.Connection(context, self.connection)
+        tls.bind_client_connection(self.connection, sni)
         if sni:
             self.sni = sni
-            self.connection.set_tlsext_host_name(sni.encode("idna"))
         self.connection.set_connect_state()
         try:
             idle_timeout = ctx.options.connection_idle_seconds
@@ -511,7 +645,7 @@ class BaseHandler(_Connection):
         self.server = server
         self.clientcert = None
 
-    def convert_to_tls(self, cert, key, **sslctx_kwargs):
+    def convert_to_tls(self, cert, key, handle_sni=None, alpn_select_callback=None, **sslctx_kwargs):
         """
         Convert connection to SSL.
         For a list of parameters, see tls.create_server_context(...)
@@ -520,8 +654,11 @@ class BaseHandler(_Connection):
         context = tls.create_server_context(
             cert=cert,
             key=key,
+            handle_sni=handle_sni,
+            alpn_select_callback=alpn_select_callback,
             **sslctx_kwargs)
         self.connection = SSL.Connection(context, self.connection)
+        tls.bind_server_connection(self.connection, handle_sni, alpn_select_callback)
         self.connection.set_accept_state()
         try:
             self.connection.do_handshake()
@@ -566,10 +703,89 @@ class Counter:
             self._count -= 1
 
 
+class WorkerPool:
+    """
+        A fixed number of handler threads fed from a bounded queue.
+
+        Connections that do not fit into the queue, or that waited longer than
+        queue_timeout seconds for a worker, are passed to the reject callback
+        instead of the handler.
+    """
+
+    def __init__(self, name, handler, reject, workers, backlog, queue_timeout=0):
+        self.handler = handler
+        self.reject = reject
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(backlog)
+        self._threads = []
+        for i in range(workers):
+            t = basethread.BaseThread(
+                "%s (worker %s)" % (name, i),
+                target=self._work,
+            )
+            t.setDaemon(1)
+            t.start()
+            self._threads.append(t)
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def submit(self, connection, client_address):
+        try:
+            self._queue.put_nowait((connection, client_address, time.time()))
+        except queue.Full:
+            self._reject(connection, client_address)
+
+    def _reject(self, connection, client_address):
+        with self._lock:
+            self.rejected += 1
+        self.reject(connection, client_address)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            connection, client_address, enqueued = item
+            if self.queue_timeout and time.time() - enqueued > self.queue_timeout:
+                self._reject(connection, client_address)
+                continue
+            with self._lock:
+                self.active += 1
+            try:
+                self.handler(connection, client_address)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def shutdown(self):
+        """
+            Close all queued connections and stop idle workers.
+            Workers that are still handling a connection exit once they are done.
+        """
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                close_socket(item[0])
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:  # pragma: no cover
+                break
+
+
 class TCPServer:
 
-    def __init__(self, address):
+    def __init__(self, address, backlog=None):
         self.address = address
+        self.pool: Optional[WorkerPool] = None
         self.__is_shut_down = threading.Event()
         self.__is_shut_down.set()
         self.__shutdown_request = False
@@ -613,13 +829,17 @@ class TCPServer:
             self.socket.bind(self.address)
 
         self.address = self.socket.getsockname()
-        self.socket.listen()
+        if backlog:
+            self.socket.listen(backlog)
+        else:
+            self.socket.listen()
         self.handler_counter = Counter()
 
     def connection_thread(self, connection, client_address):
         with self.handler_counter:
+            keep_open = False
             try:
-                self.handle_client_connection(connection, client_address)
+                keep_open = self.handle_client_connection(connection, client_address)
             except OSError as e:  # pragma: no cover
                 # This catches situations where the underlying connection is
                 # closed beneath us. Syscalls on the connection object at this
@@ -630,7 +850,34 @@ class TCPServer:
             except:
                 self.handle_error(connection, client_address)
             finally:
-                close_socket(connection)
+                if not keep_open:
+                    close_socket(connection)
+
+    def dispatch_connection(self, connection, client_address):
+        """
+            Hand an accepted connection over to the worker pool if there is
+            one, or to a new handler thread otherwise.
+        """
+        if self.pool:
+            self.pool.submit(connection, client_address)
+            return
+        t = basethread.BaseThread(
+            "TCPConnectionHandler (%s: %s:%s -> %s:%s)" % (
+                self.__class__.__name__,
+                client_address[0],
+                client_address[1],
+                self.address[0],
+                self.address[1],
+            ),
+            target=self.connection_thread,
+            args=(connection, client_address),
+        )
+        t.setDaemon(1)
+        try:
+            t.start()
+        except threading.ThreadError:
+            self.handle_error(connection, client_address)
+            connection.close()
 
     def serve_forever(self, poll_interval=0.1):
         self.__is_shut_down.clear()
@@ -639,23 +886,7 @@ class TCPServer:
                 r, w_, e_ = select.select([self.socket], [], [], poll_interval)
                 if self.socket in r:
                     connection, client_address = self.socket.accept()
-                    t = basethread.BaseThread(
-                        "TCPConnectionHandler (%s: %s:%s -> %s:%s)" % (
-                            self.__class__.__name__,
-                            client_address[0],
-                            client_address[1],
-                            self.address[0],
-                            self.address[1],
-                        ),
-                        target=self.connection_thread,
-                        args=(connection, client_address),
-                    )
-                    t.setDaemon(1)
-                    try:
-                        t.start()
-                    except threading.ThreadError:
-                        self.handle_error(connection, client_address)
-                        connection.close()
+                    self.dispatch_connection(connection, client_address)
         finally:
             self.__shutdown_request = False
             self.__is_shut_down.set()
@@ -664,6 +895,8 @@ class TCPServer:
         self.__shutdown_request = True
         self.__is_shut_down.wait()
         self.socket.close()
+        if self.pool:
+            self.pool.shutdown()
         self.handle_shutdown()
 
     def handle_error(self, connection_, client_address, fp=sys.stderr):
@@ -680,9 +913,18 @@ class TCPServer:
             print(exc, file=fp)
             print(u'-' * 40, file=fp)
 
+    def handle_rejected_connection(self, connection, client_address):
+        """
+            Called when the worker pool turns down a connection.
+        """
+        close_socket(connection)
+
     def handle_client_connection(self, conn, client_address):  # pragma: no cover
         """
             Called after client connection.
+
+            Returns True if the server has taken over the connection and it must
+            not be closed yet.
         """
         raise NotImplementedError
 
@@ -2,6 +2,7 @@
 # then add options to disable certain methods
 # https://bugs.launchpad.net/pyopenssl/+bug/1020632/comments/3
 import binascii
+import collections
 import io
 import os
 import struct
@@ -228,6 +229,100 @@ def _create_ssl_context(
     return context
 
 
+class _Ident:
+    """
+    Wraps an object for use in a cache key, hashing and comparing it by identity.
+    """
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _Ident) and other.obj is self.obj
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    try:
+        hash(value)
+    except TypeError:
+        return _Ident(value)
+    return value
+
+
+class ContextCache:
+    """
+    A thread-safe LRU cache of SSL contexts.
+
+    Building a context is expensive: loading the CA bundle for upstream
+    verification alone parses a few hundred certificates. Contexts are
+    therefore shared between all connections with the same configuration.
+    Everything that differs between connections (SNI, hostname verification,
+    SNI and ALPN callbacks) is bound to the SSL.Connection instead, see
+    bind_client_connection and bind_server_connection.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.contexts: "collections.OrderedDict[typing.Hashable, SSL.Context]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: typing.Hashable, create: typing.Callable[[], SSL.Context]) -> SSL.Context:
+        with self.lock:
+            context = self.contexts.get(key)
+            if context is not None:
+                self.contexts.move_to_end(key)
+                return context
+        context = create()
+        with self.lock:
+            self.contexts[key] = context
+            while len(self.contexts) > self.maxsize:
+                self.contexts.popitem(last=False)
+        return context
+
+    def clear(self) -> None:
+        with self.lock:
+            self.contexts.clear()
+
+
+context_cache = ContextCache(256)
+
+
+def _verify_client_callback(
+        conn: SSL.Connection,
+        x509: SSL.X509,
+        errno: int,
+        depth: int,
+        is_cert_verified: bool
+) -> bool:
+    sni = getattr(conn, "verify_sni", None)
+    address = getattr(conn, "verify_address", None)
+    if is_cert_verified and depth == 0 and not sni:
+        conn.cert_error = exceptions.InvalidCertificateException(
+            f"Certificate verification error for {address}: Cannot validate hostname, SNI missing."
+        )
+        is_cert_verified = False
+    elif is_cert_verified:
+        pass
+    else:
+        conn.cert_error = exceptions.InvalidCertificateException(
+            "Certificate verification error for {}: {} (errno: {}, depth: {})".format(
+                sni,
+                SSL._ffi.string(SSL._lib.X509_verify_cert_error_string(errno)).decode(),
+                errno,
+                depth
+            )
+        )
+
+    # SSL_VERIFY_NONE: The handshake will be continued regardless of the verification result.
+    return is_cert_verified
+
+
 def create_client_context(
         cert: str = None,
         sni: str = None,
@@ -241,48 +336,46 @@ def create_client_context(
         sni: Server Name Indication. Required for VERIFY_PEER
         address: server address, used for expressive error messages only
         verify: A bit field consisting of OpenSSL.SSL.VERIFY_* values
+
+    The returned context is shared with other connections. sni and address
+    are only checked here; they must be bound to each connection with
+    bind_client_connection.
     """
 
     if sni is None and verify != SSL.VERIFY_NONE:
         raise exceptions.TlsException("Cannot validate certificate hostname without SNI")
 
-    def verify_callback(
-            conn: SSL.Connection,
-            x509: SSL.X509,
-            errno: int,
-            depth: int,
-            is_cert_verified: bool
-    ) -> bool:
-        if is_cert_verified and depth == 0 and not sni:
-            conn.cert_error = exceptions.InvalidCertificateException(
-                f"Certificate verification error for {address}: Cannot validate hostname, SNI missing."
-            )
-            is_cert_verified = False
-        elif is_cert_verified:
-            pass
-        else:
-            conn.cert_error = exceptions.InvalidCertificateException(
-                "Certificate verification error for {}: {} (errno: {}, depth: {})".format(
-                    sni,
-                    SSL._ffi.string(SSL._lib.X509_verify_cert_error_string(errno)).decode(),
-                    errno,
-                    depth
-                )
-            )
+    def create():
+        context = _create_ssl_context(
+            verify=verify,
+            verify_callback=_verify_client_callback,
+            **sslctx_kwargs,
+        )
 
-        # SSL_VERIFY_NONE: The handshake will be continued regardless of the verification result.
-        return is_cert_verified
+        # Client Certs
+        if cert:
+            try:
+                context.use_privatekey_file(cert)
+                context.use_certificate_chain_file(cert)
+            except SSL.Error as v:
+                raise exceptions.TlsException("SSL client certificate error: %s" % str(v))
+        return context
 
-    context = _create_ssl_context(
-        verify=verify,
-        verify_callback=verify_callback,
-        **sslctx_kwargs,
-    )
+    key = ("client", _Ident(log_master_secret), cert, verify, _freeze(sorted(sslctx_kwargs.items())))
+    return context_cache.get(key, create)
 
+
+def bind_client_connection(conn: SSL.Connection, sni: str = None, address: str = None) -> None:
+    """
+    Set up the per-connection part of a client context: SNI and hostname verification.
+    """
+    conn.verify_sni = sni
+    conn.verify_address = address
     if sni:
-        # Manually enable hostname verification on the context object.
+        conn.set_tlsext_host_name(sni.encode("idna"))
+        # Manually enable hostname verification on the connection object.
         # https://wiki.openssl.org/index.php/Hostname_validation
-        param = SSL._lib.SSL_CTX_get0_param(context._context)
+        param = SSL._lib.SSL_get0_param(conn._ssl)
         # Matching on the CN is disabled in both Chrome and Firefox, so we disable it, too.
         # https://www.chromestatus.com/feature/4981025180483584
         SSL._lib.X509_VERIFY_PARAM_set_hostflags(
@@ -293,15 +386,6 @@ def create_client_context(
             SSL._lib.X509_VERIFY_PARAM_set1_host(param, sni.encode("idna"), 0) == 1
         )
 
-    # Client Certs
-    if cert:
-        try:
-            context.use_privatekey_file(cert)
-            context.use_certificate_chain_file(cert)
-        except SSL.Error as v:
-            raise exceptions.TlsException("SSL client certificate error: %s" % str(v))
-    return context
-
 
 def accept_all(
         conn_: SSL.Connection,
@@ -314,6 +398,19 @@ def accept_all(
     return True
 
 
+def _handle_sni(conn: SSL.Connection) -> None:
+    handle_sni = getattr(conn, "handle_sni", None)
+    if handle_sni:
+        handle_sni(conn)
+
+
+def _alpn_select_callback(conn: SSL.Connection, options):
+    alpn_select_callback = getattr(conn, "alpn_select_callback", None)
+    if alpn_select_callback:
+        return alpn_select_callback(conn, options)
+    return SSL.NO_OVERLAPPING_PROTOCOLS  # pragma: no cover
+
+
 def create_server_context(
         cert: typing.Union[certs.Cert, str],
         key: SSL.PKey,
@@ -333,6 +430,11 @@ def create_server_context(
 
                 connection.get_servername()
 
+        The returned context is shared with other connections, so handle_sni
+        and alpn_select_callback are not stored on it. Instead, the context
+        calls whatever callbacks were bound to the connection with
+        bind_server_connection.
+
         The request_client_cert argument requires some explanation. We're
         supposed to be able to do this with no negative effects - if the
         client has no cert to present, we're notified and proceed as usual.
@@ -348,31 +450,64 @@ def create_server_context(
     else:
         verify = SSL.VERIFY_NONE
 
-    context = _create_ssl_context(
-        ca_pemfile=chain_file,
-        verify=verify,
-        verify_callback=accept_all,
-        **sslctx_kwargs,
-    )
-
-    context.use_privatekey(key)
-    if isinstance(cert, certs.Cert):
-        context.use_certificate(cert.x509)
-    else:
-        context.use_certificate_chain_file(cert)
+    alpn_select_callback = sslctx_kwargs.pop("alpn_select_callback", None)
+    if alpn_select_callback is not None:
+        if not callable(alpn_select_callback):
+            raise exceptions.TlsException("ALPN error: alpn_select_callback must be a function.")
+        sslctx_kwargs["alpn_select_callback"] = _alpn_select_callback
+
+    def create():
+        context = _create_ssl_context(
+            ca_pemfile=chain_file,
+            verify=verify,
+            verify_callback=accept_all,
+            **sslctx_kwargs,
+        )
 
-    if extra_chain_certs:
-        for i in extra_chain_certs:
-            context.add_extra_chain_cert(i.x509)
+        context.use_privatekey(key)
+        if isinstance(cert, certs.Cert):
+            context.use_certificate(cert.x509)
+        else:
+            context.use_certificate_chain_file(cert)
 
-    if handle_sni:
-        # SNI callback happens during do_handshake()
-        context.set_tlsext_servername_callback(handle_sni)
+        if extra_chain_certs:
+            for i in extra_chain_certs:
+                context.add_extra_chain_cert(i.x509)
+
+        if handle_sni:
+            # SNI callback happens during do_handshake()
+            context.set_tlsext_servername_callback(_handle_sni)
+
+        if dhparams:
+            SSL._lib.SSL_CTX_set_tmp_dh(context._context, dhparams)
+
+        return context
+
+    cache_key = (
+        "server",
+        _Ident(log_master_secret),
+        _Ident(cert) if isinstance(cert, certs.Cert) else cert,
+        _Ident(key),
+        handle_sni is not None,
+        request_client_cert,
+        chain_file,
+        _Ident(dhparams),
+        _freeze(extra_chain_certs),
+        _freeze(sorted(sslctx_kwargs.items())),
+    )
+    return context_cache.get(cache_key, create)
 
-    if dhparams:
-        SSL._lib.SSL_CTX_set_tmp_dh(context._context, dhparams)
 
-    return context
+def bind_server_connection(
+        conn: SSL.Connection,
+        handle_sni: typing.Optional[typing.Callable[[SSL.Connection], None]] = None,
+        alpn_select_callback: typing.Callable[[typing.Any, typing.Any], bytes] = None,
+) -> None:
+    """
+    Set up the per-connection part of a server context: the SNI and ALPN callbacks.
+    """
+    conn.handle_sni = handle_sni
+    conn.alpn_select_callback = alpn_select_callback
 
 
 def is_tls_record_magic(d):
@@ -23,6 +23,13 @@ class Options(optmanager.OptManager):
             "showhost", bool, False,
             "Use the Host header to construct URLs for display."
         )
+        self.add_option(
+            "readfile_processes", int, 0,
+            """
+            Number of processes that decode large flow files in parallel.
+            0 uses one process per CPU, 1 decodes in the main process.
+            """
+        )
 
         # Proxy options
         self.add_option(
@@ -51,6 +58,27 @@ class Options(optmanager.OptManager):
             "cert_passphrase", Optional[str], None,
             "Passphrase for decrypting the private key provided in the --cert option."
         )
+        self.add_option(
+            "cert_cache", bool, False,
+            """
+            Keep generated leaf certificates in the conf dir, so that they do
+            not have to be generated again after a restart.
+            """
+        )
+        self.add_option(
+            "cert_store_cap", int, 100,
+            "Maximum number of generated leaf certificates to keep in memory."
+        )
+        self.add_option(
+            "cert_pregenerate", Sequence[str], [],
+            """
+            Hostnames to generate leaf certificates for in the background on
+            startup, so that the first connection to them does not wait for
+            certificate generation. They are used for clients that send one of
+            these hostnames as SNI, unless the certificate is based on the
+            upstream certificate, i.e. only with upstream_cert disabled.
+            """
+        )
         self.add_option(
             "ciphers_client", Optional[str], None,
             "Set supported ciphers for client connections using OpenSSL syntax."
@@ -85,6 +113,59 @@ class Options(optmanager.OptManager):
             "listen_port", int, LISTEN_PORT,
             "Proxy service port."
         )
+        self.add_option(
+            "asyncio_server", bool, False,
+            """
+            Accept proxy connections on the event loop and keep idle clients
+            there until they send data. A handler thread is only assigned to
+            connections that have become readable.
+            """
+        )
+        self.add_option(
+            "connection_workers", int, 0,
+            """
+            Maximum number of client connections handled concurrently. Further
+            connections wait in a queue for a free worker. By default, every
+            connection gets its own thread.
+            """
+        )
+        self.add_option(
+            "connection_backlog", int, 128,
+            """
+            Maximum number of client connections waiting to be handled. This
+            applies to both the listen socket and the worker queue.
+            """
+        )
+        self.add_option(
+            "connection_queue_timeout", int, 0,
+            """
+            Reject client connections that waited longer than this many
+            seconds for a free worker. 0 disables the timeout.
+            """
+        )
+        self.add_option(
+            "connection_reject", str, "close",
+            """
+            How to turn down client connections when all workers are busy and
+            the queue is full: either close them, or send an HTTP 503 response.
+            """,
+            choices=["close", "503"],
+        )
+        self.add_option(
+            "server_pool_size", int, 0,
+            """
+            Maximum number of idle HTTP/1 server connections kept for each
+            server, so that other client connections can reuse them. HTTP/2
+            connections are never pooled. 0 disables the server pool.
+            """
+        )
+        self.add_option(
+            "server_pool_idle_seconds", int, 30,
+            """
+            Close pooled server connections that have been idle for longer
+            than this many seconds.
+            """
+        )
         self.add_option(
             "upstream_bind_address", str, "",
             "Address to bind upstream requests to."
@@ -172,6 +253,21 @@ class Options(optmanager.OptManager):
             The communication contents are printed to the log in verbose mode.
             """
         )
+        self.add_option(
+            "tcp_buffer_size", int, 65536,
+            """
+            Maximum number of bytes read at once when relaying raw TCP and
+            ignored connections.
+            """
+        )
+        self.add_option(
+            "tcp_counters_only", bool, False,
+            """
+            Do not record individual messages for TCP flows, only the number
+            of bytes sent in each direction. Plain TCP connections are then
+            relayed without copying data through Python.
+            """
+        )
         self.add_option(
             "content_view_lines_cutoff", int, CONTENT_VIEW_LINES_CUTOFF,
             """
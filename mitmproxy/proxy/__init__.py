@@ -1,9 +1,9 @@
 from .config import ProxyConfig
 from .root_context import RootContext
-from .server import ProxyServer, DummyServer
+from .server import ProxyServer, AsyncProxyServer, DummyServer
 
 __all__ = [
-    "ProxyServer", "DummyServer",
+    "ProxyServer", "AsyncProxyServer", "DummyServer",
     "ProxyConfig",
     "RootContext"
 ]
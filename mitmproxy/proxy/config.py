@@ -8,6 +8,7 @@ from mitmproxy import certs
 from mitmproxy import exceptions
 from mitmproxy import options as moptions
 from mitmproxy.net import server_spec
+from mitmproxy.proxy import pool
 
 
 class HostMatcher:
@@ -29,6 +30,12 @@ class HostMatcher:
         return bool(self.patterns)
 
 
+# The options that the certificate store is built from.
+CERTSTORE_OPTIONS = {
+    "confdir", "key_size", "cert_passphrase", "certs", "cert_cache", "cert_store_cap", "cert_pregenerate"
+}
+
+
 class ProxyConfig:
 
     def __init__(self, options: moptions.Options) -> None:
@@ -38,6 +45,7 @@ class ProxyConfig:
         self.check_filter: typing.Optional[HostMatcher] = None
         self.check_tcp: typing.Optional[HostMatcher] = None
         self.upstream_server: typing.Optional[server_spec.ServerSpec] = None
+        self.server_pool = pool.ServerConnectionPool()
         self.configure(options, set(options.keys()))
         options.changed.connect(self.configure)
 
@@ -55,19 +63,41 @@ class ProxyConfig:
         if "tcp_hosts" in updated:
             self.check_tcp = HostMatcher("tcp", options.tcp_hosts)
 
+        # Building the store drops all generated certificates, so we only do
+        # that when it is configured differently.
+        if CERTSTORE_OPTIONS.intersection(updated):
+            self.configure_certstore(options)
+
+        self.server_pool.max_per_host = options.server_pool_size
+        self.server_pool.max_idle = options.server_pool_idle_seconds
+        if options.server_pool_size <= 0:
+            self.server_pool.clear()
+
+        m = options.mode
+        if m.startswith("upstream:") or m.startswith("reverse:"):
+            _, spec = server_spec.parse_with_mode(options.mode)
+            self.upstream_server = spec
+
+    def configure_certstore(self, options: moptions.Options) -> None:
         certstore_path = os.path.expanduser(options.confdir)
         if not os.path.exists(os.path.dirname(certstore_path)):
             raise exceptions.OptionsError(
                 "Certificate Authority parent directory does not exist: %s" %
                 os.path.dirname(certstore_path)
             )
+        if options.cert_store_cap < 0:
+            raise exceptions.OptionsError(
+                "cert_store_cap must not be negative: %s" % options.cert_store_cap
+            )
         key_size = options.key_size
         passphrase = options.cert_passphrase.encode("utf-8") if options.cert_passphrase else None
-        self.certstore = certs.CertStore.from_store(
+        certstore = certs.CertStore.from_store(
             certstore_path,
             moptions.CONF_BASENAME,
             key_size,
-            passphrase
+            passphrase,
+            cache_leaf_certs=options.cert_cache,
+            store_cap=options.cert_store_cap
         )
 
         for c in options.certs:
@@ -81,12 +111,21 @@ class ProxyConfig:
                     "Certificate file does not exist: %s" % cert
                 )
             try:
-                self.certstore.add_cert_file(parts[0], cert, passphrase)
+                certstore.add_cert_file(parts[0], cert, passphrase)
             except crypto.Error:
                 raise exceptions.OptionsError(
                     "Invalid certificate format: %s" % cert
                 )
-        m = options.mode
-        if m.startswith("upstream:") or m.startswith("reverse:"):
-            _, spec = server_spec.parse_with_mode(options.mode)
-            self.upstream_server = spec
+        try:
+            pregenerate = [h.encode("idna") for h in options.cert_pregenerate]
+        except UnicodeError:
+            raise exceptions.OptionsError(
+                "Invalid hostname in cert_pregenerate: %s" % options.cert_pregenerate
+            )
+
+        old = getattr(self, "certstore", None)
+        if old:
+            old.stop_pregeneration()
+        self.certstore = certstore
+        if pregenerate:
+            self.certstore.pregenerate(pregenerate)
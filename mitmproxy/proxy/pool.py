@@ -0,0 +1,162 @@
+import collections
+import threading
+import time
+import typing
+
+from mitmproxy import connections  # noqa
+from mitmproxy.net import tcp
+
+
+class ServerConnectionPool:
+    """
+    A pool of idle upstream connections, shared by all client connections.
+
+    Connections are keyed on the server address, TLS, SNI, the negotiated
+    ALPN protocol and the upstream proxy they go through. At most max_per_host
+    connections are kept for each key, and connections that have been idle for
+    longer than max_idle seconds are closed. Before a pooled connection is
+    handed out, we check that the server has neither closed it nor sent
+    unsolicited data. A max_per_host of 0 disables the pool.
+
+    The pool keeps counters for hits, misses and evictions. Expired
+    connections are closed whenever the pool is used, and by reap(), which
+    should be called periodically.
+    """
+
+    def __init__(self, max_per_host: int = 0, max_idle: float = 30) -> None:
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self.idle: typing.Dict[tuple, typing.List["connections.ServerConnection"]] = {}
+        # All idle connections, least recently released first.
+        self.released: "collections.OrderedDict[connections.ServerConnection, typing.Tuple[tuple, float]]" = (
+            collections.OrderedDict()
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.released)
+
+    @staticmethod
+    def key(address, tls: bool, sni: typing.Optional[str], alpn: typing.Optional[bytes], via) -> tuple:
+        return (
+            tuple(address) if address else None,
+            tls,
+            sni,
+            alpn,
+            tuple(via.address) if via and via.address else None,
+        )
+
+    @classmethod
+    def key_of(cls, conn: "connections.ServerConnection") -> tuple:
+        return cls.key(conn.address, conn.tls_established, conn.sni, conn.alpn_proto_negotiated, conn.via)
+
+    @staticmethod
+    def healthy(conn: "connections.ServerConnection") -> bool:
+        """
+        An idle connection must not be readable: that would mean the server
+        has closed it or sent data we did not ask for.
+        """
+        if not conn.connected():
+            return False
+        try:
+            return not tcp.ssl_read_select([conn.connection], 0)
+        except (OSError, ValueError):
+            return False
+
+    def _remove(self, conn) -> None:
+        key, _ = self.released.pop(conn)
+        conns = self.idle[key]
+        conns.remove(conn)
+        if not conns:
+            del self.idle[key]
+
+    def _expire(self) -> typing.List["connections.ServerConnection"]:
+        expired = []
+        now = time.monotonic()
+        for conn, (_, released) in self.released.items():
+            if now - released < self.max_idle:
+                break
+            expired.append(conn)
+        for conn in expired:
+            self._remove(conn)
+        return expired
+
+    def _close(self, conns) -> None:
+        for conn in conns:
+            conn.finish()
+            conn.close()
+            if conn.channel:
+                conn.channel.tell("serverdisconnect", conn)
+
+    def get(self, keys: typing.Iterable[tuple]) -> typing.Optional["connections.ServerConnection"]:
+        """
+        Take a healthy idle connection for the first of keys that has one.
+        """
+        if self.max_per_host <= 0:
+            return None
+        conn = None
+        with self.lock:
+            closed = self._expire()
+            for key in keys:
+                while conn is None and key in self.idle:
+                    c = self.idle[key][-1]
+                    self._remove(c)
+                    if self.healthy(c):
+                        conn = c
+                    else:
+                        closed.append(c)
+                if conn:
+                    break
+            if conn:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.evictions += len(closed)
+        self._close(closed)
+        return conn
+
+    def put(self, conn: "connections.ServerConnection") -> bool:
+        """
+        Hand an idle connection to the pool.
+
+        Returns:
+            True, if the pool has taken over the connection. Otherwise, the
+            caller remains responsible for closing it.
+        """
+        if self.max_per_host <= 0 or not conn.connected():
+            return False
+        key = self.key_of(conn)
+        with self.lock:
+            closed = self._expire()
+            self.evictions += len(closed)
+            accepted = len(self.idle.get(key, ())) < self.max_per_host
+            if accepted:
+                self.idle.setdefault(key, []).append(conn)
+                self.released[conn] = (key, time.monotonic())
+            else:
+                self.evictions += 1
+        self._close(closed)
+        return accepted
+
+    def reap(self) -> int:
+        """
+        Close the connections that have been idle for longer than max_idle.
+
+        Returns:
+            The number of closed connections.
+        """
+        with self.lock:
+            closed = self._expire()
+            self.evictions += len(closed)
+        self._close(closed)
+        return len(closed)
+
+    def clear(self) -> None:
+        with self.lock:
+            closed = list(self.released)
+            self.idle.clear()
+            self.released.clear()
+        self._close(closed)
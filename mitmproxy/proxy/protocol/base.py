@@ -150,16 +150,48 @@ class ServerConnectionMixin:
     def disconnect(self):
         """
         Deletes (and closes) an existing server connection.
+        Idle connections are handed to the server pool instead, if it has room for them.
         Must not be called if there is no existing connection.
         """
-        self.log("serverdisconnect", "debug", [repr(self.server_conn.address)])
         address = self.server_conn.address
-        self.server_conn.finish()
-        self.server_conn.close()
-        self.channel.tell("serverdisconnect", self.server_conn)
+        if (
+            self.server_conn.reusable and
+            not self.server_conn.spoof_source_address and
+            self.config.server_pool.put(self.server_conn)
+        ):
+            self.log("serverdisconnect (pooled)", "debug", [repr(address)])
+        else:
+            self.log("serverdisconnect", "debug", [repr(address)])
+            self.server_conn.finish()
+            self.server_conn.close()
+            self.channel.tell("serverdisconnect", self.server_conn)
 
         self.server_conn = self.__make_server_conn(address)
 
+    def reuse_server_conn(self, tls=False, sni=None, alpn_protos=None):
+        """
+        Takes an idle connection to the current server address from the server pool.
+        Only HTTP/1 connections are pooled, so this fails if the client wants to negotiate
+        another protocol.
+        Must not be called if there is an existing connection.
+
+        Returns:
+            True, if a pooled connection is used from now on.
+        """
+        if alpn_protos and (b"h2" in alpn_protos or b"http/1.1" not in alpn_protos):
+            return False
+        pool = self.config.server_pool
+        conn = pool.get(
+            pool.key(self.server_conn.address, tls, sni, alpn, self.server_conn.via)
+            for alpn in (b"http/1.1", None)
+        )
+        if conn is None:
+            return False
+        conn.channel = self.channel
+        self.server_conn = conn
+        self.log("serverconnect (pooled)", "debug", [repr(conn.address)])
+        return True
+
     def connect(self):
         """
         Establishes a server connection.
@@ -11,6 +11,7 @@ from mitmproxy import flow
 from mitmproxy.exceptions import TcpTimeout
 from mitmproxy.proxy.protocol import base
 from mitmproxy.proxy.protocol.websocket import WebSocketLayer
+from mitmproxy.net import tcp
 from mitmproxy.net import websockets
 
 
@@ -64,6 +65,12 @@ class _HttpTransmissionLayer(base.Layer):
     def check_close_connection(self, f):
         raise NotImplementedError()
 
+    def check_server_conn_reusable(self, f):
+        """
+        Whether the server connection is idle after this flow and may be handed to other clients.
+        """
+        raise NotImplementedError()
+
 
 class ConnectServerConnection:
 
@@ -117,6 +124,10 @@ class UpstreamConnectLayer(base.Layer):
         else:
             pass  # swallow the message
 
+    def reuse_server_conn(self, *args, **kwargs):
+        # Tunnels through an upstream proxy are not pooled.
+        return False
+
     def change_upstream_proxy_server(self, address):
         self.log("Changing upstream proxy to {} (CONNECTed)".format(repr(address)), "debug")
         if address != self.server_conn.via.address:
@@ -194,7 +205,11 @@ class HttpLayer(base.Layer):
         if self.mode == HTTPMode.transparent:
             self.__initial_server_tls = self.server_tls
             self.__initial_server_address = self.server_conn.address
+        first = True
         while True:
+            if not first and self._client_idle():
+                raise exceptions.ClientIdle()
+            first = False
             flow = http.HTTPFlow(
                 self.client_conn,
                 self.server_conn,
@@ -208,6 +223,27 @@ class HttpLayer(base.Layer):
             if not self._process_flow(flow):
                 return
 
+    def _client_idle(self):
+        """
+        Between two requests, check whether the client connection can be handed
+        back to the proxy server instead of blocking this thread until the next
+        request arrives. This is only possible for the outermost HTTP/1 layer of
+        a plain-text connection, so that the next request can be handled by a
+        fresh layer stack. Without a server pool, we keep the thread rather than
+        closing an open server connection.
+        """
+        if not self.get_root_ctx().idle_handoff or self.client_conn.tls_established:
+            return False
+        if self.server_conn.connected() and self.config.server_pool.max_per_host <= 0:
+            return False
+        layer = self.ctx
+        while isinstance(layer, base.Layer):
+            if isinstance(layer, HttpLayer):
+                return False
+            layer = layer.ctx
+        # The client's rfile does not buffer ahead, so the socket is all we need to check.
+        return not tcp.ssl_read_select([self.client_conn.connection], 0)
+
     def handle_regular_connect(self, f):
         self.connect_request = True
 
@@ -358,7 +394,8 @@ class HttpLayer(base.Layer):
                 # allow inline scripts to manipulate the client handshake
                 self.channel.ask("websocket_handshake", f)
 
-            if not f.response:
+            from_server = not f.response
+            if from_server:
                 self.establish_server_connection(
                     f.request.host,
                     f.request.port,
@@ -366,6 +403,7 @@ class HttpLayer(base.Layer):
                 )
 
                 def get_response():
+                    self.server_conn.reusable = False
                     self.channel.ask("http_proxy_to_server_request_started", f)
                     self.send_request_headers(f.request)
                     if f.request.stream:
@@ -461,6 +499,9 @@ class HttpLayer(base.Layer):
                 self.send_response_body(f.response, chunks)
                 f.response.timestamp_end = time.time()
 
+            if from_server:
+                self.server_conn.reusable = self.check_server_conn_reusable(f)
+
             if self.check_close_connection(f):
                 return False
 
@@ -98,6 +98,18 @@ class Http1Layer(httpbase._HttpTransmissionLayer):
             return False
         return close_connection
 
+    def check_server_conn_reusable(self, flow):
+        request_close = http1.connection_close(
+            flow.request.http_version,
+            flow.request.headers
+        )
+        response_close = http1.connection_close(
+            flow.response.http_version,
+            flow.response.headers
+        )
+        read_until_eof = http1.expected_http_body_size(flow.request, flow.response) == -1
+        return not (request_close or response_close or read_until_eof or flow.response.status_code == 101)
+
     def __call__(self):
         layer = httpbase.HttpLayer(self, self.mode)
         layer()
@@ -450,6 +450,10 @@ class Http2SingleStreamLayer(httpbase._HttpTransmissionLayer, basethread.BaseThr
         # RFC 7540 8.1: An HTTP request/response exchange fully consumes a single stream.
         return True
 
+    def check_server_conn_reusable(self, flow):
+        # HTTP/2 connections are multiplexed and never handed to the server pool.
+        return False
+
     @property
     def data_queue(self):
         if self.response_message.arrived.is_set():
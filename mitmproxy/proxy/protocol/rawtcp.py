@@ -10,7 +10,6 @@ from mitmproxy.proxy.protocol import base
 
 
 class RawTCPLayer(base.Layer):
-    chunk_size = 4096
 
     def __init__(self, ctx, ignore=False):
         self.ignore = ignore
@@ -19,14 +18,42 @@ class RawTCPLayer(base.Layer):
     def __call__(self):
         self.connect()
 
+        # Ignored connections and flows that only count bytes do not need
+        # individual messages.
+        record = not self.ignore and not self.config.options.tcp_counters_only
         if not self.ignore:
             f = tcp.TCPFlow(self.client_conn, self.server_conn, self)
             self.channel.ask("tcp_start", f)
 
-        buf = memoryview(bytearray(self.chunk_size))
-
         client = self.client_conn.connection
         server = self.server_conn.connection
+        counts = [0, 0]
+
+        try:
+            if record or isinstance(client, SSL.Connection) or isinstance(server, SSL.Connection):
+                self._relay_tls(client, server, counts, f if record else None)
+            else:
+                mitmproxy.net.tcp.relay(
+                    client, server, counts, self.config.options.tcp_buffer_size, self.channel.should_exit
+                )
+        except (socket.error, exceptions.TcpException, SSL.Error) as e:
+            if not self.ignore:
+                f.error = flow.Error("TCP connection closed unexpectedly: {}".format(repr(e)))
+                self.channel.tell("tcp_error", f)
+        finally:
+            if not self.ignore:
+                if not record:
+                    f.metadata["bytes_from_client"], f.metadata["bytes_from_server"] = counts
+                self.channel.tell("tcp_end", f)
+
+    def _relay_tls(self, client, server, counts, f):
+        """
+            Relay data between client and server, which may be TLS
+            connections, and record a TCPMessage for every chunk if a flow
+            is given.
+        """
+        bufsize = self.config.options.tcp_buffer_size
+        buf = memoryview(bytearray(bufsize))
         conns = [client, server]
 
         # https://github.com/openssl/openssl/issues/6234
@@ -34,39 +61,33 @@ class RawTCPLayer(base.Layer):
             if isinstance(conn, SSL.Connection) and hasattr(SSL._lib, "SSL_clear_mode"):
                 SSL._lib.SSL_clear_mode(conn._ssl, SSL._lib.SSL_MODE_AUTO_RETRY)
 
-        try:
-            while not self.channel.should_exit.is_set():
-                r = mitmproxy.net.tcp.ssl_read_select(conns, 10)
-                for conn in r:
-                    dst = server if conn == client else client
-                    try:
-                        size = conn.recv_into(buf, self.chunk_size)
-                    except (SSL.WantReadError, SSL.WantWriteError):
-                        continue
-                    if not size:
-                        conns.remove(conn)
-                        # Shutdown connection to the other peer
-                        if isinstance(conn, SSL.Connection):
-                            # We can't half-close a connection, so we just close everything here.
-                            # Sockets will be cleaned up on a higher level.
-                            return
-                        else:
-                            dst.shutdown(socket.SHUT_WR)
+        while not self.channel.should_exit.is_set():
+            r = mitmproxy.net.tcp.ssl_read_select(conns, 10)
+            for conn in r:
+                dst = server if conn == client else client
+                try:
+                    size = conn.recv_into(buf, bufsize)
+                except (SSL.WantReadError, SSL.WantWriteError):
+                    continue
+                if not size:
+                    conns.remove(conn)
+                    # Shutdown connection to the other peer
+                    if isinstance(conn, SSL.Connection):
+                        # We can't half-close a connection, so we just close everything here.
+                        # Sockets will be cleaned up on a higher level.
+                        return
+                    else:
+                        dst.shutdown(socket.SHUT_WR)
 
-                        if len(conns) == 0:
-                            return
-                        continue
+                    if len(conns) == 0:
+                        return
+                    continue
 
+                counts[conn != client] += size
+                if f:
                     tcp_message = tcp.TCPMessage(dst == server, buf[:size].tobytes())
-                    if not self.ignore:
-                        f.messages.append(tcp_message)
-                        self.channel.ask("tcp_message", f)
+                    f.messages.append(tcp_message)
+                    self.channel.ask("tcp_message", f)
                     dst.sendall(tcp_message.content)
-
-        except (socket.error, exceptions.TcpException, SSL.Error) as e:
-            if not self.ignore:
-                f.error = flow.Error("TCP connection closed unexpectedly: {}".format(repr(e)))
-                self.channel.tell("tcp_error", f)
-        finally:
-            if not self.ignore:
-                self.channel.tell("tcp_end", f)
+                else:
+                    dst.sendall(buf[:size])
@@ -1,4 +1,4 @@
-from typing import Optional  # noqa
+from typing import List, Optional  # noqa
 from typing import Union
 
 from mitmproxy import exceptions
@@ -295,7 +295,7 @@ class TlsLayer(base.Layer):
             return "TlsLayer(inactive)"
 
     def connect(self):
-        if not self.server_conn.connected():
+        if not self.server_conn.connected() and not self._reuse_server_conn():
             self.ctx.connect()
         if self._server_tls and not self.server_conn.tls_established:
             self._establish_tls_with_server()
@@ -354,8 +354,9 @@ class TlsLayer(base.Layer):
 
     def _establish_tls_with_client_and_server(self):
         try:
-            self.ctx.connect()
-            self._establish_tls_with_server()
+            if not self._reuse_server_conn():
+                self.ctx.connect()
+                self._establish_tls_with_server()
             self.ctx.channel.ask("proxy_to_server_connection_succeeded", self)
         except Exception:
             # If establishing TLS with the server fails, we try to establish TLS with the client nonetheless
@@ -403,32 +404,47 @@ class TlsLayer(base.Layer):
                 sni_str or repr(self.server_conn.address)
             )
 
+    def _reuse_server_conn(self) -> bool:
+        """
+        Try to take an idle connection from the server pool that matches the connection we
+        would establish otherwise.
+        """
+        if self.server_conn.connected():
+            return False
+        if self._server_tls:
+            return self.ctx.reuse_server_conn(True, self.server_sni, self._server_alpn_protos())
+        return self.ctx.reuse_server_conn()
+
+    def _server_alpn_protos(self) -> Optional[List[bytes]]:
+        alpn = None
+        if self._client_tls:
+            if self._client_hello.alpn_protocols:
+                # We only support http/1.1 and h2.
+                # If the server only supports spdy (next to http/1.1), it may select that
+                # and mitmproxy would enter TCP passthrough mode, which we want to avoid.
+                alpn = [
+                    x for x in self._client_hello.alpn_protocols if
+                    not (x.startswith(b"h2-") or x.startswith(b"spdy"))
+                ]
+            if alpn and b"h2" in alpn and not self.config.options.http2:
+                alpn.remove(b"h2")
+
+        if self.client_conn.tls_established and self.client_conn.get_alpn_proto_negotiated():
+            # If the client has already negotiated an ALP, then force the
+            # server to use the same. This can only happen if the host gets
+            # changed after the initial connection was established. E.g.:
+            #   * the client offers http/1.1 and h2,
+            #   * the initial host is only capable of http/1.1,
+            #   * then the first server connection negotiates http/1.1,
+            #   * but after the server_conn change, the new host offers h2
+            #   * which results in garbage because the layers don' match.
+            alpn = [self.client_conn.get_alpn_proto_negotiated()]
+        return alpn
+
     def _establish_tls_with_server(self):
         self.log("Establish TLS with server", "debug")
         try:
-            alpn = None
-            if self._client_tls:
-                if self._client_hello.alpn_protocols:
-                    # We only support http/1.1 and h2.
-                    # If the server only supports spdy (next to http/1.1), it may select that
-                    # and mitmproxy would enter TCP passthrough mode, which we want to avoid.
-                    alpn = [
-                        x for x in self._client_hello.alpn_protocols if
-                        not (x.startswith(b"h2-") or x.startswith(b"spdy"))
-                    ]
-                if alpn and b"h2" in alpn and not self.config.options.http2:
-                    alpn.remove(b"h2")
-
-            if self.client_conn.tls_established and self.client_conn.get_alpn_proto_negotiated():
-                # If the client has already negotiated an ALP, then force the
-                # server to use the same. This can only happen if the host gets
-                # changed after the initial connection was established. E.g.:
-                #   * the client offers http/1.1 and h2,
-                #   * the initial host is only capable of http/1.1,
-                #   * then the first server connection negotiates http/1.1,
-                #   * but after the server_conn change, the new host offers h2
-                #   * which results in garbage because the layers don' match.
-                alpn = [self.client_conn.get_alpn_proto_negotiated()]
+            alpn = self._server_alpn_protos()
 
             # We pass through the list of ciphers send by the client, because some HTTP/2 servers
             # will select a non-HTTP/2 compatible cipher from our default list and then hang up
@@ -488,6 +504,12 @@ class TlsLayer(base.Layer):
             self.server_conn.tls_established and
             self.config.options.upstream_cert
         )
+        if not use_upstream_cert and self._client_hello.sni:
+            # Without upstream information, the client only checks our certificate
+            # against its SNI, which a pregenerated certificate covers.
+            pregenerated = self.config.certstore.get_pregenerated(self._client_hello.sni)
+            if pregenerated:
+                return pregenerated
         if use_upstream_cert:
             upstream_cert = self.server_conn.cert
             sans.update(upstream_cert.altnames)
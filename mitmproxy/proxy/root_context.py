@@ -21,12 +21,17 @@ class RootContext:
             :py:meth:`.tell() <mitmproxy.controller.Channel.tell>` methods.
         config:
             The :py:class:`proxy server's configuration <mitmproxy.proxy.ProxyConfig>`
+        idle_handoff:
+            True, if the outermost HTTP/1 layer may raise
+            :py:class:`~mitmproxy.exceptions.ClientIdle` between two requests
+            to hand a plain-text client connection back to the proxy server.
     """
 
     def __init__(self, client_conn, config, channel):
         self.client_conn = client_conn
         self.channel = channel
         self.config = config
+        self.idle_handoff = False
 
     def get_root_ctx(self):
         result = self
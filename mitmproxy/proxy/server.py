@@ -1,5 +1,9 @@
+import asyncio
+import socket
 import sys
+import time
 import traceback
+import typing
 
 from mitmproxy import exceptions, flow
 from mitmproxy import connections
@@ -36,6 +40,8 @@ class ProxyServer(tcp.TCPServer):
     allow_reuse_address = True
     bound = True
     channel: controller.Channel
+    REJECT_LOG_INTERVAL = 10
+    reject_logged = -float("inf")
 
     def __init__(self, config: config.ProxyConfig) -> None:
         """
@@ -44,7 +50,8 @@ class ProxyServer(tcp.TCPServer):
         self.config = config
         try:
             super().__init__(
-                (config.options.listen_host, config.options.listen_port)
+                (config.options.listen_host, config.options.listen_port),
+                backlog=config.options.connection_backlog,
             )
             if config.options.mode == "transparent":
                 platform.init_transparent_mode()
@@ -54,10 +61,54 @@ class ProxyServer(tcp.TCPServer):
             raise exceptions.ServerException(
                 'Error starting proxy server: ' + repr(e)
             ) from e
+        if config.options.connection_workers > 0:
+            self.pool = tcp.WorkerPool(
+                "ProxyServer ({})".format(human.format_address(self.address)),
+                self.connection_thread,
+                self.handle_rejected_connection,
+                config.options.connection_workers,
+                config.options.connection_backlog,
+                config.options.connection_queue_timeout,
+            )
 
     def set_channel(self, channel):
         self.channel = channel
 
+    def handle_rejected_connection(self, conn, client_address):
+        # This runs on the accept thread or the event loop, so it must not block.
+        # The error response fits into the send buffer of a fresh connection, and
+        # we do not wait for the client to read it before closing.
+        try:
+            conn.setblocking(False)
+            if self.config.options.connection_reject == "503":
+                conn.send(http1.assemble_response(
+                    http.make_error_response(503, "Proxy server is overloaded.")
+                ))
+            conn.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        conn.close()
+        self.log_overload()
+
+    def log_overload(self):
+        """
+            Log the worker pool counters, at most every REJECT_LOG_INTERVAL
+            seconds while connections are being rejected.
+        """
+        now = time.monotonic()
+        channel = getattr(self, "channel", None)
+        if not channel or now - self.reject_logged < self.REJECT_LOG_INTERVAL:
+            return
+        self.reject_logged = now
+        channel.tell("log", log.LogEntry(
+            "Proxy server overloaded: {} connections rejected so far, "
+            "{} active, {} queued.".format(self.pool.rejected, self.pool.active, self.pool.queued),
+            "warn"
+        ))
+
+    def handle_shutdown(self):
+        self.config.server_pool.clear()
+
     def handle_client_connection(self, conn, client_address):
         h = ConnectionHandler(
             conn,
@@ -68,9 +119,100 @@ class ProxyServer(tcp.TCPServer):
         h.handle()
 
 
+class AsyncProxyServer(ProxyServer):
+    """
+        A ProxyServer whose accept loop runs on the master's event loop.
+
+        Connections are parked on the loop until the client has sent data, so
+        idle clients only cost a file descriptor rather than a handler thread.
+        This applies to freshly accepted connections and to plain-text HTTP/1
+        keep-alive connections between two requests in regular, upstream and
+        reverse proxy mode, which the handler hands back after each response.
+        The protocol layers still do blocking I/O, which is why readable
+        connections are then dispatched like in ProxyServer. TLS, CONNECT
+        tunnels, SOCKS, transparent mode and HTTP/2 keep their handler thread
+        for the lifetime of the connection.
+    """
+    asynchronous = True
+
+    def __init__(self, config: config.ProxyConfig) -> None:
+        super().__init__(config)
+        self.socket.setblocking(False)
+        self.parked: typing.Dict[int, typing.Tuple[typing.Any, typing.Any]] = {}
+        # Handlers of idle keep-alive connections, to be resumed once they are readable.
+        self.handlers: typing.Dict[typing.Any, ConnectionHandler] = {}
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._serving: typing.Optional[asyncio.Future] = None
+
+    def start_serving(self):
+        """
+            Schedule the accept loop on the current event loop.
+        """
+        self._loop = asyncio.get_event_loop()
+        self._serving = asyncio.ensure_future(self.serve())
+
+    async def serve(self):
+        while True:
+            try:
+                connection, client_address = await self._loop.sock_accept(self.socket)
+            except OSError:
+                if self.socket.fileno() == -1:
+                    return
+                # Most likely EMFILE/ENFILE. Back off instead of spinning.
+                await asyncio.sleep(0.1)
+                continue
+            self.park(connection, client_address)
+
+    def park(self, connection, client_address):
+        """
+            Keep a connection on the event loop until it becomes readable.
+        """
+        fd = connection.fileno()
+        self.parked[fd] = (connection, client_address)
+        self._loop.add_reader(fd, self._unpark, fd)
+
+    def _unpark(self, fd):
+        self._loop.remove_reader(fd)
+        connection, client_address = self.parked.pop(fd)
+        connection.setblocking(True)
+        self.dispatch_connection(connection, client_address)
+
+    def handle_client_connection(self, conn, client_address):
+        h = self.handlers.pop(conn, None)
+        if h is None:
+            h = ConnectionHandler(
+                conn,
+                client_address,
+                self.config,
+                self.channel,
+                idle_handoff=True
+            )
+        if not h.handle():
+            return False
+        self.handlers[conn] = h
+        self._loop.call_soon_threadsafe(self.park, conn, client_address)
+        return True
+
+    def handle_rejected_connection(self, conn, client_address):
+        h = self.handlers.pop(conn, None)
+        if h:
+            h.finish()
+        super().handle_rejected_connection(conn, client_address)
+
+    def shutdown(self):
+        if self._serving:
+            self._serving.cancel()
+        for fd, (connection, _) in self.parked.items():
+            self._loop.remove_reader(fd)
+            tcp.close_socket(connection)
+        self.parked.clear()
+        self.handlers.clear()
+        super().shutdown()
+
+
 class ConnectionHandler:
 
-    def __init__(self, client_conn, client_address, config, channel):
+    def __init__(self, client_conn, client_address, config, channel, idle_handoff=False):
         self.config: config.ProxyConfig = config
         self.client_conn = connections.ClientConnection(
             client_conn,
@@ -79,6 +221,8 @@ class ConnectionHandler:
         """@type: mitmproxy.proxy.connection.ClientConnection"""
         self.channel = channel
         """@type: mitmproxy.controller.Channel"""
+        self.idle_handoff = idle_handoff
+        self.root_layer = None
 
     def _create_root_layer(self):
         root_ctx = root_context.RootContext(
@@ -112,13 +256,29 @@ class ConnectionHandler:
             raise ValueError("Unknown proxy mode: %s" % mode)
 
     def handle(self):
-        self.log("clientconnect", "info")
+        """
+            Handle the client connection until it is closed.
 
-        root_layer = None
+            With idle_handoff, the handler returns True instead if the client
+            connection has gone idle between two requests. The connection is
+            then still open, and handle() must be called again once the client
+            has sent more data. Returns False otherwise.
+        """
+        if self.root_layer is None:
+            self.log("clientconnect", "info")
         try:
-            root_layer = self._create_root_layer()
-            root_layer = self.channel.ask("clientconnect", root_layer)
-            root_layer()
+            if self.root_layer is None:
+                root_layer = self._create_root_layer()
+                self.root_layer = self.channel.ask("clientconnect", root_layer)
+                # The root layer is called again for every resumed request,
+                # which only works for the modes that keep no state of their own.
+                if self.idle_handoff and isinstance(
+                    self.root_layer, (modes.HttpProxy, modes.HttpUpstreamProxy, modes.ReverseProxy)
+                ):
+                    self.root_layer.ctx.idle_handoff = True
+            self.root_layer()
+        except exceptions.ClientIdle:
+            return True
         except exceptions.Kill:
             self.log(flow.Error.KILLED_MESSAGE, "info")
         except exceptions.ProtocolException as e:
@@ -150,9 +310,13 @@ class ConnectionHandler:
             print("mitmproxy has crashed!", file=sys.stderr)
             print("Please lodge a bug report at: https://github.com/mitmproxy/mitmproxy", file=sys.stderr)
 
+        self.finish()
+        return False
+
+    def finish(self):
         self.log("clientdisconnect", "info")
-        if root_layer is not None:
-            self.channel.tell("clientdisconnect", root_layer)
+        if self.root_layer is not None:
+            self.channel.tell("clientdisconnect", self.root_layer)
         self.client_conn.finish()
 
     def log(self, msg, level):
@@ -1,5 +1,7 @@
 from .concurrent import concurrent
+from .inline import inline
 
 __all__ = [
     "concurrent",
+    "inline",
 ]
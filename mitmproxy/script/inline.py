@@ -0,0 +1,23 @@
+"""
+This module provides an @inline decorator for event handlers that are safe to
+run directly on the proxy thread that raised the event, without a round trip
+through mitmproxy's main master thread.
+"""
+
+from mitmproxy import eventsequence
+
+
+def inline(fn):
+    """
+        Mark an event handler as synchronous, read-only and thread-safe.
+
+        If all handlers for an event are marked this way, the event is handled
+        on the connection thread. Inline handlers must not modify the flow,
+        take the reply, or touch state that is owned by the event loop.
+    """
+    if fn.__name__ not in eventsequence.Events - {"load", "configure", "running", "done"}:
+        raise NotImplementedError(
+            "Inline decorator not supported for '%s' method." % fn.__name__
+        )
+    fn.mitmproxy_inline = True
+    return fn
@@ -94,7 +94,10 @@ def run(
         server: typing.Any = None
         if pconf.options.server:
             try:
-                server = proxy.server.ProxyServer(pconf)
+                if pconf.options.asyncio_server:
+                    server = proxy.server.AsyncProxyServer(pconf)
+                else:
+                    server = proxy.server.ProxyServer(pconf)
             except exceptions.ServerException as v:
                 print(str(v), file=sys.stderr)
                 sys.exit(1)
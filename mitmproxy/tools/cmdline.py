@@ -49,6 +49,7 @@ def common_options(parser, opts):
     opts.make_parser(parser, "stickycookie", metavar="FILTER")
     opts.make_parser(parser, "stickyauth", metavar="FILTER")
     opts.make_parser(parser, "save_stream_file", metavar="PATH", short="w")
+    opts.make_parser(parser, "save_indexed")
     opts.make_parser(parser, "anticomp")
 
     # Proxy options
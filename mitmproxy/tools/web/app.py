@@ -1,5 +1,6 @@
 import asyncio
 import hashlib
+import itertools
 import json
 import logging
 import os.path
@@ -413,10 +414,30 @@ class FlowContentView(RequestHandler):
         #        if error:
         #           add event log
 
-        self.write(dict(
-            lines=list(lines),
-            description=description
-        ))
+        # Content views render lazily, so a page near the start of a large
+        # body is cheap. ?offset=n&lines=m requests a page of m lines.
+        try:
+            offset = int(self.get_argument("offset", "0"))
+            limit = self.get_argument("lines", None)
+            if limit is not None:
+                limit = int(limit)
+        except ValueError:
+            raise APIError(400, "Invalid page range.")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise APIError(400, "Invalid page range.")
+
+        if limit is None:
+            self.write(dict(
+                lines=list(itertools.islice(lines, offset, None)),
+                description=description
+            ))
+        else:
+            page = list(itertools.islice(lines, offset, offset + limit + 1))
+            self.write(dict(
+                lines=page[:limit],
+                description=description,
+                more=len(page) > limit
+            ))
 
 
 class Events(RequestHandler):
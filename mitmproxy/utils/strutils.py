@@ -133,7 +133,8 @@ def is_mostly_bin(s: bytes) -> bool:
 
 
 def is_xml(s: bytes) -> bool:
-    return s.strip().startswith(b"<")
+    # match instead of strip() so that large bodies are not copied.
+    return re.match(rb"\s*<", s) is not None
 
 
 def clean_hanging_newline(t):
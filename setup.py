@@ -63,7 +63,7 @@ setup(
     install_requires=[
         "asgiref>=3.2.10, <3.3",
         "blinker>=1.4, <1.5",
-        "Brotli>=1.0,<1.1",
+        "Brotli>=1.0,<1.3",
         "certifi>=2019.9.11",  # no semver here - this should always be on the last release!
         "click>=7.0,<8",
         "cryptography>=3.0,<3.2",
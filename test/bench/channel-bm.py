@@ -0,0 +1,100 @@
+import threading
+import time
+import typing
+
+from mitmproxy import ctx
+from mitmproxy.test import tflow
+
+# The hooks the HTTP layer asks for on every request/response pair.
+HTTP_EVENTS = (
+    "requestheaders",
+    "request",
+    "http_proxy_to_server_request_started",
+    "http_proxy_to_server_request_finished",
+    "http_server_to_proxy_response_receiving",
+    "responseheaders",
+    "http_server_to_proxy_response_received",
+    "response",
+)
+
+
+class ChannelTester:
+
+    """
+    Simulates proxy connection threads that send the HTTP hook sequence
+    through the master's channel, and measures requests per second with
+    and without inline dispatch of unsubscribed events.
+    """
+
+    def __init__(self):
+        self.started = False
+
+    def load(self, loader):
+        loader.add_option(
+            "channel_requests",
+            int,
+            20000,
+            "Number of simulated requests per run"
+        )
+        loader.add_option(
+            "channel_threads",
+            int,
+            8,
+            "Number of simulated connection threads"
+        )
+        loader.add_option(
+            "benchmark_save_path",
+            typing.Optional[str],
+            None,
+            "Destination for the stats result file"
+        )
+
+    def running(self):
+        if self.started:
+            return
+        self.started = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def simulate(self, n):
+        f = tflow.tflow(resp=True)
+        for _ in range(n):
+            for evt in HTTP_EVENTS:
+                ctx.master.channel.ask(evt, f)
+
+    def measure(self):
+        threads = [
+            threading.Thread(
+                target=self.simulate,
+                args=(ctx.options.channel_requests // ctx.options.channel_threads,)
+            )
+            for _ in range(ctx.options.channel_threads)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return ctx.options.channel_requests / (time.perf_counter() - start)
+
+    def run(self):
+        addons = ctx.master.addons
+        inline = [e for e in HTTP_EVENTS if e in addons.inline]
+        results = [f"Events handled inline: {', '.join(inline) or 'none'}"]
+
+        can_inline = addons.can_inline
+        addons.can_inline = lambda name, message: False
+        results.append(f"Event loop only: {self.measure():.0f} req/s")
+        addons.can_inline = can_inline
+        results.append(f"Inline dispatch: {self.measure():.0f} req/s")
+
+        for r in results:
+            ctx.log.error(r)
+        if ctx.options.benchmark_save_path:
+            with open(ctx.options.benchmark_save_path, "w") as f:
+                f.write("\n".join(results) + "\n")
+        ctx.master.shutdown()
+
+
+addons = [
+    ChannelTester()
+]
@@ -0,0 +1,50 @@
+"""
+Micro-benchmarks for the Headers multidict at typical header counts.
+
+    python ./headers-bm.py [number of runs, default 20000]
+"""
+import sys
+import timeit
+
+from mitmproxy.net.http.headers import Headers
+
+SIZES = (5, 15, 40)
+
+
+def make_headers(n: int) -> Headers:
+    fields = [(b"Host", b"example.com"), (b"Content-Type", b"text/html")]
+    fields += [(b"X-Header-%d" % i, b"value-%d" % i) for i in range(n - 3)]
+    fields.append((b"set-cookie", b"a=b"))
+    return Headers(fields)
+
+
+def ops(h: Headers):
+    return {
+        "get": lambda: h.get("content-type"),
+        "get miss": lambda: h.get("content-encoding"),
+        "contains": lambda: "Host" in h,
+        "get_all": lambda: h.get_all("Set-Cookie"),
+        "set": lambda: h.__setitem__("x-header-1", "new"),
+        "add+del": lambda: (h.add("Via", "1.1 mitm"), h.__delitem__("via")),
+        "len": lambda: len(h),
+        "read flow": lambda: (
+            h.get("content-length"), h.get("transfer-encoding"), h.get("content-encoding"),
+            h.get("content-type"), h.get("connection"), "expect" in h,
+        ),
+    }
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    names = list(ops(make_headers(5)))
+    print("{:>12}".format("µs/op") + "".join("{:>10}".format(n) for n in SIZES))
+    for name in names:
+        row = []
+        for n in SIZES:
+            fn = ops(make_headers(n))[name]
+            row.append(min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6)
+        print("{:>12}".format(name) + "".join("{:>10.2f}".format(t) for t in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measures how fast flow dumps are parsed, comparing the offset-based
+tnetstring parser with the previous parser that sliced the remaining
+data after every element, and sequential with parallel decoding of
+whole flows.
+
+    python ./tnetstring-bm.py [size in MB, default 1024] [body size, default 10000]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from mitmproxy import io
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+
+
+def legacy_pop(data: bytes):
+    blength, data = data.split(b':', 1)
+    length = int(blength)
+    data, data_type, remain = data[:length], data[length], data[length + 1:]
+    return legacy_parse(data_type, data), remain
+
+
+def legacy_parse(data_type: int, data: bytes):
+    if data_type == ord(b']'):
+        l = []
+        while data:
+            item, data = legacy_pop(data)
+            l.append(item)
+        return l
+    if data_type == ord(b'}'):
+        d = {}
+        while data:
+            key, data = legacy_pop(data)
+            val, data = legacy_pop(data)
+            d[key] = val
+        return d
+    return tnetstring.parse(data_type, data)
+
+
+def legacy_load(fo):
+    c = fo.read(1)
+    if not c:
+        raise EOFError
+    data_length = b""
+    while c.isdigit():
+        data_length += c
+        c = fo.read(1)
+    data = fo.read(int(data_length))
+    return legacy_parse(fo.read(1)[0], data)
+
+
+def write_dump(path: str, size: int, body: int) -> int:
+    f = tflow.tflow(resp=True)
+    f.request.content = os.urandom(body // 2)
+    f.response.content = os.urandom(body)
+    record = tnetstring.dumps(f.get_state())
+    n = max(1, size // len(record))
+    with open(path, "wb") as fo:
+        for _ in range(n):
+            fo.write(record)
+    return n
+
+
+def timed(name: str, path: str, read) -> float:
+    start = time.perf_counter()
+    with open(path, "rb") as fo:
+        n = sum(1 for _ in read(fo))
+    t = time.perf_counter() - start
+    mb = os.path.getsize(path) / 1024 / 1024
+    print(f"{name:>12}: {n} flows in {t:.2f}s ({mb / t:.1f} MB/s)")
+    return t
+
+
+def legacy_stream(fo):
+    try:
+        while True:
+            yield legacy_load(fo)
+    except EOFError:
+        pass
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    body = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "flows")
+        n = write_dump(path, size * 1024 * 1024, body)
+        print(f"Wrote {n} flows, {os.path.getsize(path) / 1024 / 1024:.0f} MB")
+        old = timed("legacy", path, legacy_stream)
+        new = timed("load_all", path, tnetstring.load_all)
+        timed("migrated", path, lambda fo: io.FlowReader(fo).records())
+        timed("FlowReader", path, lambda fo: io.FlowReader(fo).stream())
+        timed("parallel", path, lambda fo: (i for batch in io.read_flows_parallel(path) for i in batch))
+        print(f"Speedup: {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 import socket
 
+from mitmproxy.net.http import encoding
 from mitmproxy.utils import data
 
 import pytest
@@ -40,3 +41,14 @@ skip_no_ipv6 = pytest.mark.skipif(
 @pytest.fixture()
 def tdata():
     return data.Data(__name__)
+
+
+@pytest.fixture(autouse=True)
+def max_decoded_size():
+    """
+    Restore the limit on decoded body sizes, which the core addon sets from
+    body_size_limit, after each test.
+    """
+    yield
+    if encoding.max_decoded_size is not None:
+        encoding.set_max_decoded_size(None)
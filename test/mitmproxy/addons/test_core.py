@@ -4,6 +4,7 @@ from mitmproxy.addons import core
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
 from mitmproxy import exceptions
+from mitmproxy.net.http import encoding
 import pytest
 
 
@@ -160,6 +161,12 @@ def test_validation_simple():
         with pytest.raises(exceptions.OptionsError):
             tctx.configure(sa, body_size_limit = "invalid")
         tctx.configure(sa, body_size_limit = "1m")
+        assert encoding.max_decoded_size == 1024 * 1024
+        tctx.configure(sa, body_size_limit = None)
+        assert encoding.max_decoded_size is None
+        tctx.configure(sa, body_size_limit = "1m")
+        sa.done()
+        assert encoding.max_decoded_size is None
 
         with pytest.raises(exceptions.OptionsError, match="mutually exclusive"):
             tctx.configure(
@@ -1,5 +1,7 @@
 import asyncio
 import io
+import os
+import threading
 
 import pytest
 import asynctest
@@ -9,6 +11,15 @@ from mitmproxy import exceptions
 from mitmproxy.addons import readfile
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
+from ...conftest import skip_windows
+
+
+async def wait_for(cond):
+    for _ in range(500):
+        if cond():
+            return True
+        await asyncio.sleep(0.01)
+    return False
 
 
 @pytest.fixture
@@ -63,8 +74,8 @@ class TestReadFile:
                 )
                 assert not mck.awaited
                 rf.running()
-                await asyncio.sleep(0)
-                assert mck.awaited
+                # flows are decoded on a worker thread
+                assert await wait_for(lambda: mck.awaited)
 
             tf.write(corrupt_data.getvalue())
             tctx.configure(rf, rfile=str(tf))
@@ -83,6 +94,24 @@ class TestReadFile:
                 await rf.load_flows(corrupt_data)
             assert await tctx.master.await_log("file corrupted")
 
+    @skip_windows
+    @pytest.mark.asyncio
+    async def test_fifo(self, tmpdir, data):
+        path = str(tmpdir.join("fifo"))
+        os.mkfifo(path)
+
+        def write():
+            with open(path, "wb") as f:
+                f.write(data.getvalue())
+
+        t = threading.Thread(target=write)
+        t.start()
+        rf = readfile.ReadFile()
+        with taddons.context(rf):
+            with asynctest.patch('mitmproxy.master.Master.load_flow'):
+                assert await rf.load_flows_from_path(path) == 4
+        t.join()
+
     @pytest.mark.asyncio
     async def test_nonexistent_file(self):
         rf = readfile.ReadFile()
@@ -118,5 +147,5 @@ class TestReadFileStdin:
                 tctx.configure(rf, rfile=str(tf))
                 assert not mck.awaited
                 rf.running()
-                await asyncio.sleep(0)
-                assert mck.awaited
+                # flows are decoded on a worker thread
+                assert await wait_for(lambda: mck.awaited)
@@ -58,7 +58,7 @@ def test_websocket(tmpdir):
 
 def test_save_command(tmpdir):
     sa = save.Save()
-    with taddons.context() as tctx:
+    with taddons.context(sa) as tctx:
         p = str(tmpdir.join("foo"))
         sa.save([tflow.tflow(resp=True)], p)
         assert len(rd(p)) == 1
@@ -72,7 +72,6 @@ def test_save_command(tmpdir):
 
         v = view.View()
         tctx.master.addons.add(v)
-        tctx.master.addons.add(sa)
         tctx.master.commands.execute("save.file @shown %s" % p)
 
 
@@ -94,3 +93,50 @@ def test_simple(tmpdir):
         sa.request(f)
         tctx.configure(sa, save_stream_file=None)
         assert not rd(p)[1].response
+
+
+def test_indexed(tmpdir):
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_indexed=True, save_stream_file=p, save_stream_filter="~q")
+
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        sa.request(tflow.tflow())
+        tctx.configure(sa, save_stream_file=None)
+        with open(p, "rb") as fo:
+            r = io.open_reader(fo)
+            assert isinstance(r, io.IndexedFlowReader)
+            assert len(r) == 1
+            r.close()
+
+        tctx.configure(sa, save_stream_file="+" + p, save_stream_filter=None)
+        sa.request(tflow.tflow())
+        tctx.configure(sa, save_stream_file=None)
+        assert len(rd(p)) == 2
+        with open(p, "rb") as fo:
+            r = io.IndexedFlowReader(fo)
+            assert len(r) == 2
+            r.close()
+
+        sa.save([tflow.tflow(resp=True)], "+" + p)
+        with open(p, "rb") as fo:
+            r = io.IndexedFlowReader(fo)
+            assert len(r) == 3
+            r.close()
+
+        # Saving lazily loaded flows back to their own file.
+        with open(p, "rb") as fo:
+            r = io.IndexedFlowReader(fo)
+        lazy = list(r.lazy())
+        sa.save(lazy, p)
+        assert [i.id for i in rd(p)] == [i.id for i in lazy]
+
+        with open(p, "wb") as fo:
+            fo.write(b"invalid")
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(sa, save_stream_file="+" + p)
+        with pytest.raises(exceptions.CommandError):
+            sa.save([tflow.tflow(resp=True)], "+" + p)
@@ -39,6 +39,41 @@ def test_config(tmpdir):
             tctx.configure(s, server_replay=[str(tmpdir)])
 
 
+@pytest.mark.asyncio
+async def test_lazy(tmpdir):
+    s = serverplayback.ServerPlayback()
+    with taddons.context(s) as tctx:
+        tctx.configure(s, server_replay_lazy=True)
+        fpath = str(tmpdir.join("flows"))
+        f = tflow.tflow(resp=True)
+        f.response.content = b"replayed"
+        tdump(fpath, [tflow.tflow(), f, tflow.tflow(resp=True)])
+        s.load_file(fpath)
+        assert s.count() == 3
+        refs = s.flowmap[s._hash(f)]
+        assert all(isinstance(r, serverplayback.FlowRef) for r in refs)
+        assert [r.has_response for r in refs] == [False, True, True]
+
+        tctx.configure(s, server_replay_nopop=True)
+        assert s.next_flow(f).response.content == b"replayed"
+        tctx.configure(s, server_replay_nopop=False)
+        assert s.next_flow(f).response.content == b"replayed"
+        assert s.count() == 1
+
+        # the file changed under us
+        with open(fpath, "wb") as fo:
+            fo.write(b"garbage")
+        r = tflow.tflow()
+        s.request(r)
+        assert not r.response
+        assert await tctx.master.await_log("server_playback", "error")
+
+        flowmap = s.flowmap
+        with pytest.raises(exceptions.CommandError):
+            s.load_file(fpath)
+        assert s.flowmap is flowmap
+
+
 def test_server_playback():
     sp = serverplayback.ServerPlayback()
     with taddons.context(sp) as tctx:
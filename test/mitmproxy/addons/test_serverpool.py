@@ -0,0 +1,42 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from mitmproxy.addons import serverpool
+from mitmproxy.proxy.pool import ServerConnectionPool
+from mitmproxy.test import taddons
+
+from ..proxy.test_pool import make_conn
+
+
+@pytest.mark.asyncio
+async def test_reap():
+    sp = serverpool.ServerPool()
+    sp.interval = 0.01
+    with taddons.context(sp) as tctx:
+        pool = ServerConnectionPool(max_per_host=1, max_idle=0)
+        tctx.master.server = mock.Mock()
+        tctx.master.server.config.server_pool = pool
+        conn, peer = make_conn()
+        assert pool.put(conn)
+
+        sp.running()
+        for _ in range(100):
+            if not len(pool):
+                break
+            await asyncio.sleep(0.01)
+        assert not len(pool)
+        assert not conn.connected()
+        sp.done()
+        assert sp.reaper is None
+
+
+@pytest.mark.asyncio
+async def test_stats():
+    sp = serverpool.ServerPool()
+    with taddons.context(sp) as tctx:
+        assert tctx.command(sp.stats) == "No server connection pool."
+        tctx.master.server = mock.Mock()
+        tctx.master.server.config.server_pool = ServerConnectionPool(max_per_host=1)
+        assert tctx.command(sp.stats) == "idle: 0, hits: 0, misses: 0, evictions: 0"
@@ -4,10 +4,12 @@ import pytest
 import os
 
 from mitmproxy import ctx
+from mitmproxy import flowfilter
 from mitmproxy import http
 from mitmproxy.test import tflow, tutils
 from mitmproxy.test import taddons
 from mitmproxy.addons import session
+from mitmproxy.io import protobuf
 from mitmproxy.exceptions import SessionLoadException, CommandError
 from mitmproxy.utils.data import pkg_data
 
@@ -73,7 +75,7 @@ class TestSession:
         with con:
             con.executescript(qry)
             blob = b'blob_of_data'
-            con.execute(f'INSERT INTO FLOW VALUES(1, "{blob}");')
+            con.execute(f'INSERT INTO FLOW (id, content) VALUES(1, "{blob}");')
         con.close()
         session.SessionDB(path)
         con = sqlite3.connect(path)
@@ -85,6 +87,106 @@ class TestSession:
         con.close()
         os.remove(path)
 
+    def test_session_upgrade(self, tmpdir):
+        path = str(tmpdir.join("old.sqlite"))
+        f = self.tft(method="put", start=1)
+        f.response = tutils.tresp()
+        f2 = self.tft(start=2)
+        f2.request.host = "example.com"
+        con = sqlite3.connect(path)
+        with con:
+            con.executescript(
+                "CREATE TABLE flow (id VARCHAR(36) PRIMARY KEY, content BLOB);"
+                "CREATE TABLE body (id INTEGER PRIMARY KEY, flow_id VARCHAR(36), type_id INTEGER, content BLOB);"
+                "CREATE TABLE annotation (id INTEGER PRIMARY KEY, flow_id VARCHAR(36), type VARCHAR(16), content BLOB);"
+            )
+            con.executemany("INSERT INTO flow VALUES(?, ?);", [
+                (f.id, protobuf.dumps(f)), (f2.id, protobuf.dumps(f2)), ("broken", b"blob_of_data")
+            ])
+            # Old sessions may have several bodies for a message.
+            con.executemany("INSERT INTO body (flow_id, type_id, content) VALUES(?, ?, ?);", [
+                (f.id, 2, b"A" * 1001), (f.id, 2, b"B" * 2000)
+            ])
+        con.close()
+
+        assert session.SessionDB.is_session_db(path)
+        s = session.SessionDB(path)
+        assert s.con.execute(
+            "SELECT method, host, status_code, response_size FROM flow WHERE id = ?;", [f.id]
+        ).fetchone() == ("PUT", "address", 200, 2000)
+        assert [fid for _, fid in s.query("time", "host = ?", ["example.com"])] == [f2.id]
+        assert s.con.execute("SELECT content FROM body;").fetchall() == [(b"B" * 2000,)]
+        assert len(s) == 3
+        s.close()
+
+        # upgrading happens only once
+        s = session.SessionDB(path)
+        assert len(s.query("time")) == 3
+        s.close()
+
+    def test_session_wal(self):
+        s = session.SessionDB()
+        assert s.con.execute("PRAGMA journal_mode;").fetchone() == ("wal",)
+        assert s.writer.is_alive()
+        s.close()
+        assert not s.writer
+
+    def test_store_flows(self):
+        s = session.SessionDB()
+        f = tflow.tflow(resp=True)
+        f.request.content = b"A" * 1001
+        s.store_flows([f])
+        s.flush()
+        row = s.con.execute(
+            "SELECT method, host, url, status_code, request_size, response_size FROM flow;"
+        ).fetchone()
+        assert row == ("GET", "address", f.request.url, 200, 1001, len(f.response.raw_content))
+        assert s.con.execute("SELECT flow_id, type_id FROM body;").fetchall() == [(f.id, 1)]
+
+        # Bodies are replaced along with the flow.
+        f.request.content = b"A"
+        f.response.content = b"B" * 1001
+        s.store_flows([f])
+        s.flush()
+        assert s.con.execute("SELECT flow_id, type_id FROM body;").fetchall() == [(f.id, 2)]
+        assert len(s) == 1
+        assert f.id in s
+
+        s.clear()
+        assert len(s) == 0
+        assert not s.con.execute("SELECT * FROM flow;").fetchall()
+
+    def test_query(self):
+        s = session.SessionDB()
+        flows = [self.tft(method=m, start=i) for i, m in enumerate(["put", "get", "post"])]
+        flows[0].response = tutils.tresp(status_code=404)
+        flows[1].request.host = "example.com"
+        s.store_flows(flows)
+        s.flush()
+
+        def q(spec, order="time"):
+            where, params, exact = session._sql_prefilter(flowfilter.parse(spec))
+            assert exact
+            return [fid for _, fid in s.query(order, where, params)]
+
+        a, b, c = (f.id for f in flows)
+        assert q("~http") == [a, b, c]
+        assert q("~m P") == [a, c]
+        assert q("~m P", order="method") == [c, a]
+        assert q("~c 404") == [a]
+        assert q("!~c 404") == [b, c]
+        assert q("~q") == [b, c]
+        assert q("~s") == [a]
+        assert q("~d example") == [b]
+        assert q("~u example | ~c 404") == [a, b]
+        assert q("example.com:22/path") == [b]
+        assert [v for v, _ in s.query("time")] == [0, 1, 2]
+
+        assert session._sql_prefilter(flowfilter.parse("~m get & ~b foo"))[2] is False
+        assert session._sql_prefilter(flowfilter.parse("~m get | ~b foo")) == (None, [], False)
+        assert session._needs_bodies(flowfilter.parse("!(~m get | ~bq foo)"))
+        assert not session._needs_bodies(flowfilter.parse("~m get & ~h foo"))
+
     def test_session_order_generators(self):
         s = session.Session()
         tf = tflow.tflow(resp=True)
@@ -159,6 +261,38 @@ class TestSession:
         s.set_filter(None)
         assert len(s._view) == 4
 
+    def test_storage_filter_stored(self):
+        s = self.start_session()
+        flows = [self.tft(method=m, start=i) for i, m in enumerate(["get", "put", "get", "put"])]
+        s.update(flows)
+        s.db_store.store_flows(flows[:3])
+        for f in flows[:3]:
+            s._writing[f.id] = s._hot_store.pop(f.id)
+        s.set_filter("~m get")
+        assert s._view == [(0, flows[0].id), (2, flows[2].id)]
+        s.db_store.flush()
+        s._writing.clear()
+        s.set_filter("~m get")
+        assert s._view == [(0, flows[0].id), (2, flows[2].id)]
+        s.set_order("method")
+        assert s._view == sorted([("GET", flows[0].id), ("GET", flows[2].id)])
+        s.set_filter("~m put")
+        assert s._view == sorted([("PUT", flows[1].id), ("PUT", flows[3].id)])
+
+    @pytest.mark.asyncio
+    async def test_storage_writer(self):
+        s = self.start_session(fp=0.01)
+        flows = [self.tft(start=i) for i in range(3)]
+        s.update(flows)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not s._hot_store and not s._writing:
+                break
+        assert not s._hot_store and not s._writing
+        assert len(s.db_store.query("time")) == 3
+        assert [f.id for f in s.load_view()] == [f.id for f in flows]
+        s.done()
+
     @pytest.mark.asyncio
     @pytest.mark.skip
     async def test_storage_flush_with_specials(self):
@@ -1,3 +1,8 @@
+import asyncio
+import os
+import threading
+from unittest import mock
+
 import pytest
 
 from mitmproxy.test import tflow
@@ -8,6 +13,7 @@ from mitmproxy import exceptions
 from mitmproxy import io
 from mitmproxy.test import taddons
 from mitmproxy.tools.console import consoleaddons
+from ...conftest import skip_windows
 
 
 def tft(*, method="get", start=0):
@@ -166,6 +172,71 @@ def test_filter():
     assert len(v) == 4
 
 
+def test_filter_narrowing():
+    v = view.View()
+    for m in ["get", "put", "get", "post"]:
+        v.request(tft(method=m))
+    v.set_filter_cmd("~m get | ~m put")
+    assert len(v) == 3
+
+    seen = []
+    get = flowfilter.parse("~m get")
+
+    def record(f):
+        seen.append(f)
+        return get(f)
+
+    v.filter = record
+    v._refilter(narrow=True)
+    assert len(seen) == 3
+    assert len(v) == 2
+
+    v.set_filter_cmd("~m get | ~m put")
+    with mock.patch.object(v, "_refilter", wraps=v._refilter) as refilter:
+        v.set_filter_cmd("~m get | ~m put ~m put")
+        refilter.assert_called_with(narrow=True)
+        assert len(v) == 1
+        v.set_filter_cmd("~m get")
+        refilter.assert_called_with(narrow=False)
+        assert len(v) == 2
+
+    v.set_filter(lambda f: f.request.method == "GET")
+    assert len(v) == 2
+    v.set_filter(lambda f: f.request.method == "PUT")
+    assert len(v) == 1
+
+
+@pytest.mark.asyncio
+async def test_refilter_incremental(monkeypatch):
+    monkeypatch.setattr(view, "REFILTER_SYNC_LIMIT", 2)
+    monkeypatch.setattr(view, "REFILTER_SLICE", 0)
+    v = view.View()
+    for i in range(10):
+        v.request(tft(method="get" if i % 2 else "put", start=i))
+    added = []
+
+    def rec(view, flow):
+        added.append(flow)
+
+    v.sig_view_add.connect(rec)
+
+    v.set_filter_cmd("~m get")
+    assert len(v) == 0
+    assert v._refilter_task
+    # A new filter cancels the refilter in flight.
+    v.set_filter_cmd("~m put")
+    while v._refilter_task:
+        await asyncio.sleep(0)
+    assert len(v) == 5
+    assert all(f.request.method == "PUT" for f in v)
+    assert len(added) == 5
+
+    v.set_filter_cmd("~m get")
+    v.clear()
+    assert not v._refilter_task
+    assert len(v) == 0
+
+
 def tdump(path, flows):
     with open(path, "wb") as f:
         w = io.FlowWriter(f)
@@ -220,6 +291,59 @@ async def test_load(tmpdir):
         assert await tctx.master.await_log("Invalid data format.")
 
 
+@pytest.mark.asyncio
+async def test_load_indexed(tmpdir):
+    path = str(tmpdir.join("path"))
+    flows = [tflow.tflow(resp=True), tflow.tflow(), tflow.ttcpflow()]
+    flows[1].request.host = "example.org"
+    flows[1].request.timestamp_start = 0
+    with open(path, "wb") as f:
+        w = io.IndexedFlowWriter(f)
+        for i in flows:
+            w.add(i)
+        w.close()
+    v = view.View()
+    with taddons.context() as tctx:
+        tctx.master.addons.add(v)
+        v.load_file(path)
+        assert len(v) == 3
+        assert [io.lazy_summary(i) is not None for i in v] == [True, True, False]
+        assert v[0].id != flows[1].id
+        assert io.lazy_summary(v[0]) is not None
+
+        tctx.configure(v, view_filter="~d example.org")
+        assert len(v) == 1
+        assert v[0].request.host == "example.org"
+        assert io.lazy_summary(v[0]) is None
+        assert len([i for i in v._store.values() if io.lazy_summary(i) is not None]) == 1
+
+        v.load_file(path)
+        assert v.store_count() == 6
+
+
+@skip_windows
+@pytest.mark.asyncio
+async def test_load_fifo(tmpdir):
+    path = str(tmpdir.join("fifo"))
+    os.mkfifo(path)
+    flows = [tflow.tflow(resp=True) for _ in range(3)]
+
+    def write():
+        with open(path, "wb") as f:
+            w = io.FlowWriter(f)
+            for i in flows:
+                w.add(i)
+
+    t = threading.Thread(target=write)
+    t.start()
+    v = view.View()
+    with taddons.context() as tctx:
+        tctx.master.addons.add(v)
+        v.load_file(path)
+        t.join()
+        assert len(v) == 3
+
+
 def test_resolve():
     v = view.View()
     with taddons.context() as tctx:
@@ -267,6 +391,69 @@ def test_resolve():
             tctx.command(v.resolve, "~")
 
 
+def test_index():
+    v = view.View()
+    a = tflow.tflow(resp=True)
+    b = tflow.tflow(resp=True)
+    b.request.method = "POST"
+    b.request.host = "example.com"
+    b.response.status_code = 500
+    b.response.headers["content-type"] = "application/json"
+    c = tflow.tflow()
+    t = tflow.ttcpflow()
+    v.add([a, b, c, t])
+
+    def candidates(spec):
+        return v._index.candidates(flowfilter.parse(spec))
+
+    assert candidates("~c 500") == {b.id}
+    assert candidates("~c 404") == set()
+    assert candidates("~m post") == {b.id}
+    assert candidates("~m get") == {a.id, c.id}
+    assert candidates("~d example") == {b.id}
+    assert candidates("~ts json") == {b.id}
+    assert candidates("~m get & ~c 200") == {a.id}
+    assert candidates("~m get & ~b foo") == {a.id, c.id}
+    assert candidates("~c 200 | ~c 500") == {a.id, b.id}
+    assert candidates("~c 200 | ~tcp") is None
+    assert candidates("~tcp") is None
+    assert v.resolve("~m get | ~m post") == [a, b, c]
+
+    a.request.method = "POST"
+    v.update([a])
+    assert candidates("~m post") == {a.id, b.id}
+    assert v._index.indexes["method"][b"GET"] == {c.id}
+
+    v.remove([b])
+    assert candidates("~m post") == {a.id}
+    assert candidates("~c 500") == set()
+    assert not v._index.indexes["code"].get(500)
+
+    v.set_filter_cmd("~m post")
+    assert list(v) == [a]
+
+    v.clear()
+    assert candidates("~m post") == set()
+    assert not v._index.keys
+
+
+def test_index_websocket():
+    v = view.View()
+    a = tflow.tflow()
+    w = tflow.twebsocketflow()
+    w.handshake_flow.request.host = "ws.example.com"
+    v.add([a, w])
+
+    assert v._index.candidates(flowfilter.parse("~d ws.example")) == {w.id}
+    assert v._index.candidates(flowfilter.parse("~m get")) == {a.id}
+    v.set_filter_cmd("~d ws.example")
+    assert list(v) == [w]
+
+    x = tflow.twebsocketflow()
+    x.handshake_flow = None
+    assert view.FlowIndex._keys(x) == {}
+
+
 def test_movement():
     v = view.View()
     with taddons.context():
@@ -80,3 +80,101 @@ def test_get_message_content_view():
     r.content = None
     desc, lines, err = contentviews.get_message_content_view("raw", r, f)
     assert list(lines) == [[("error", "content missing")]]
+
+
+def test_get_message_content_view_stream(monkeypatch):
+    monkeypatch.setattr(contentviews, "STREAM_SIZE", 10)
+    f = tflow.tflow(resp=True)
+    r = f.response
+    r.headers["content-type"] = "application/json"
+    r.content = b'{"foo": [' + b"1, " * 100 + b"2]}"
+    r.encode("gzip")
+    with mock.patch("mitmproxy.net.http.message.Message.get_content") as get_content:
+        desc, lines, err = contentviews.get_message_content_view("auto", r, None)
+        assert desc == "[decoded gzip] JSON"
+        assert len(list(lines)) == 105
+        assert not get_content.called
+
+    monkeypatch.setattr(contentviews.json, "STREAM_THRESHOLD", 10)
+    desc, lines, err = contentviews.get_message_content_view("auto", r, None)
+    assert next(lines) == [("text", "{")]
+
+    r.content = b'{"foo": [' + b"1, " * 100 + b"x]}"
+    r.encode("gzip")
+    desc, lines, err = contentviews.get_message_content_view("auto", r, None)
+    assert desc == "[decoded gzip] JSON"
+    assert list(lines)[-1][0][0] == "error"
+
+
+def test_get_message_content_view_cached():
+    contentviews.render_cache.clear()
+    f = tflow.tflow(resp=True)
+    f.response.content = b"foo\nbar"
+    calls = []
+
+    class CountingView(contentviews.View):
+        name = "Counting"
+
+        def __call__(self, data, **metadata):
+            calls.append(data)
+            return "Counting", contentviews.format_text(data)
+
+    v = CountingView()
+    contentviews.add(v)
+    try:
+        desc, lines, err = contentviews.get_message_content_view("counting", f.response, f)
+        assert next(lines) == [("text", "foo")]
+        desc, lines, err = contentviews.get_message_content_view("counting", f.response, f)
+        assert list(lines) == [[("text", "foo")], [("text", "bar")]]
+        assert len(calls) == 1
+
+        # the request is cached separately
+        contentviews.get_message_content_view("counting", f.request, f)
+        assert len(calls) == 2
+
+        # editing the message invalidates its views
+        f.response.content = b"baz"
+        desc, lines, err = contentviews.get_message_content_view("counting", f.response, f)
+        assert list(lines) == [[("text", "baz")]]
+        f.response.headers["content-type"] = "text/plain"
+        contentviews.get_message_content_view("counting", f.response, f)
+        assert len(calls) == 4
+    finally:
+        contentviews.remove(v)
+
+
+def test_render_cache_evicts():
+    cache = contentviews.RenderCache(1000)
+    lines = contentviews.RenderedLines(iter([[("text", "x" * 600)]] * 2))
+    cache.put("a", b"", (), "Raw", lines, None)
+    assert cache.get("a", b"", ()) is not None
+    list(lines)
+    cache.put("b", b"", (), "Raw", contentviews.RenderedLines(iter([])), None)
+    assert cache.get("a", b"", ()) is None
+    assert cache.get("b", b"", ()) is not None
+    assert cache.get("b", b"x", ()) is None
+    assert cache.size == 0
+
+
+def test_render_cache_counts_content():
+    cache = contentviews.RenderCache(1000)
+    cache.put("a", b"", (), "Raw", contentviews.RenderedLines(iter([]), 600), None)
+    cache.put("b", b"", (), "Raw", contentviews.RenderedLines(iter([]), 600), None)
+    assert cache.get("a", b"", ()) is None
+    assert cache.size == 600
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_rendered_lines_failure():
+    def fail():
+        yield [("text", "foo")]
+        raise ValueError()
+
+    lines = contentviews.RenderedLines(fail())
+    it = iter(lines)
+    assert next(it) == [("text", "foo")]
+    with pytest.raises(ValueError):
+        next(it)
+    assert lines.failed
+    assert list(lines) == [[("text", "foo")]]
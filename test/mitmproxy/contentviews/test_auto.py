@@ -57,3 +57,50 @@ def test_view_auto():
         query=multidict.MultiDict([("foo", "bar")]),
     )
     assert f[0] == "Query"
+
+    f = v(
+        b'{"foo": 1}',
+        headers=http.Headers(content_type="application/ld+json")
+    )
+    assert f[0] == "JSON"
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 30
+    assert auto.choose_view(None, auto.sniff(png), False).name == "Image"
+
+    f = v(
+        b"\xef\xbb\xbf<xml></xml>",
+        headers=http.Headers(content_type="text/flibble")
+    )
+    assert f[0].startswith("XML")
+
+
+def test_sniff():
+    assert auto.sniff(b"") == ("empty", False)
+    assert auto.sniff(b"  \n<foo>") == ("xml", False)
+    assert auto.sniff(b"\xff\xd8\xff\xe0") == ("image", True)
+    assert auto.sniff(b"\xFF" * 30) == ("text", True)
+    # only a bounded prefix is inspected
+    assert auto.sniff(b"foo" + b"\xFF" * 10 ** 6) == auto.sniff(b"foo" + b"\xFF" * auto.SNIFF_SIZE)
+    assert auto.sniff(b" " * auto.SNIFF_SIZE + b"<foo>") == ("text", False)
+
+
+def test_choose_view_memoized():
+    auto.choose_view.cache_clear()
+    v = auto.ViewAuto()
+    v(b"foo", headers=http.Headers(content_type="text/plain"))
+    v(b"bar", headers=http.Headers(content_type="text/plain"))
+    assert auto.choose_view.cache_info().hits == 1
+
+
+def test_view_auto_stream():
+    v = auto.ViewAuto()
+    desc, lines = v.stream(
+        [b"[1", b", 2]"],
+        headers=http.Headers(content_type="application/json")
+    )
+    assert desc == "JSON"
+    assert len(list(lines)) == 4
+    desc, lines = v.stream([b"foo", b"bar"], headers=http.Headers())
+    assert desc == "Raw"
+    assert list(lines) == [[("text", "foobar")]]
+    assert v.stream([], headers=http.Headers()) == ("No content", [])
@@ -30,3 +30,17 @@ def test_format_pairs():
     f_d = base.format_pairs(d)
     with pytest.raises(StopIteration):
         next(f_d)
+
+
+def test_format_text():
+    assert list(base.format_text(b"")) == []
+    assert list(base.format_text("foo\r\nbar\n")) == [[("text", "foo")], [("text", "bar")]]
+
+    text = b"a\r\nb\rc\n\nd" * 10
+    for block_size in (1, 2, 3, 100):
+        assert list(base._lines(text, block_size)) == text.splitlines()
+
+    # lines are split lazily
+    big = b"x" * 100 + b"\n" + b"y" * 10 ** 7
+    lines = base.format_text(big)
+    assert next(lines) == [("text", b"x" * 100)]
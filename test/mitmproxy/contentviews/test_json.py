@@ -1,3 +1,6 @@
+import json as _json
+
+import pytest
 from hypothesis import given
 from hypothesis.strategies import binary
 
@@ -27,6 +30,42 @@ def test_format_json():
     }))
 
 
+def test_format_json_stream():
+    data = {"data": ["str", 42, -1.5e3, True, False, None, {}, [], {"a": [1]}]}
+    expected = [
+        "".join(text for _, text in line) for line in json.format_json(data)
+    ]
+    s = _json.dumps(data).encode()
+    for size in (1, 3, len(s)):
+        chunks = [s[i:i + size] for i in range(0, len(s), size)]
+        lines = list(json.format_json_stream(chunks))
+        assert ["".join(text for _, text in line) for line in lines] == expected
+    assert lines[2] == [("text", "        "), ("json_string", '"str"'), ("text", ",")]
+    assert list(json.format_json_stream([b'{"b": 1, "a": "\\\\"}'])) == [
+        [("text", "{")],
+        [("text", "    "), ("json_string", '"b"'), ("text", ": "), ("json_number", "1"), ("text", ",")],
+        [("text", "    "), ("json_string", '"a"'), ("text", ": "), ("json_string", '"\\\\"')],
+        [("text", "}")],
+    ]
+    assert list(json.format_json_stream([])) == []
+
+    for invalid in (b'{"a": x}', b'["a', b'"\xff"'):
+        with pytest.raises(ValueError):
+            list(json.format_json_stream([invalid]))
+
+
+def test_format_json_same_as_stream():
+    s = b'{"b": ["\\u00e4\\n", 1E2, -0, 1.50], "a": {"\\"": null}}'
+    expected = [
+        "".join(text for _, text in line)
+        for line in json.format_json(json.parse_json(s))
+    ]
+    lines = list(json.format_json_stream([s]))
+    assert ["".join(text for _, text in line) for line in lines] == expected
+    assert lines[1][1] == ("json_string", '"b"')
+    assert lines[2][1] == ("json_string", '"\xe4\\n"')
+
+
 def test_view_json():
     v = full_eval(json.ViewJSON())
     assert v(b"null")
@@ -41,3 +80,16 @@ def test_view_json():
 def test_view_json_doesnt_crash(data):
     v = full_eval(json.ViewJSON())
     v(data)
+
+
+def test_view_json_stream(monkeypatch):
+    monkeypatch.setattr(json, "STREAM_THRESHOLD", 10)
+    v = json.ViewJSON()
+    desc, lines = v.stream([b'{"b": 1, ', b'"a": 2}'])
+    assert desc == "JSON"
+    assert next(lines) == [("text", "{")]
+    assert next(lines)[1] == ("json_string", '"b"')
+
+    desc, lines = v.stream([b'{"b": 1}'])
+    assert list(lines) == list(json.format_json({"b": 1}))
+    assert v.stream([b"{"]) is None
@@ -34,3 +34,15 @@ def test_format_xml(filename, tdata):
         expected = f.read()
     tokens = xml_html.tokenize(input)
     assert xml_html.format_xml(tokens) == expected
+    tokens = xml_html.tokenize(input)
+    assert list(xml_html.format_xml_lines(tokens)) == expected.splitlines()
+
+
+def test_format_xml_lazy():
+    def tokens():
+        yield from xml_html.tokenize("<div>\n<p>foo</p>\n<p>bar</p>\n</div>")
+        raise AssertionError("should not be consumed")
+
+    lines = xml_html.format_xml_lines(tokens())
+    assert next(lines) == "<div>"
+    assert next(lines) == "  <p>foo</p>"
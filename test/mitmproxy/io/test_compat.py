@@ -1,7 +1,12 @@
+from unittest import mock
+
 import pytest
 
 from mitmproxy import io
 from mitmproxy import exceptions
+from mitmproxy import version
+from mitmproxy.io import compat
+from mitmproxy.test import tflow
 
 
 @pytest.mark.parametrize("dumpfile, url", [
@@ -22,3 +27,17 @@ def test_cannot_convert(tdata):
         flow_reader = io.FlowReader(f)
         with pytest.raises(exceptions.FlowReadException):
             list(flow_reader.stream())
+
+
+def test_fast_path():
+    state = tflow.tflow(resp=True).get_state()
+    with mock.patch("mitmproxy.io.compat._converter_chain") as chain:
+        assert compat.migrate_flow(state) is state
+        assert not chain.called
+
+
+def test_converter_chain():
+    assert compat._converter_chain(8) == (compat.convert_8_9,)
+    assert len(compat._converter_chain((0, 11))) == len(compat.converters)
+    with pytest.raises(ValueError, match="please update"):
+        compat._converter_chain(version.FLOW_FORMAT_VERSION + 1)
@@ -1 +1,305 @@
-# TODO: write tests
+import concurrent.futures
+import io
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import pytest
+
+from mitmproxy import exceptions
+from mitmproxy import flowfilter
+from mitmproxy import http
+from mitmproxy import io as mio
+from mitmproxy import tcp
+from mitmproxy.test import tflow
+
+
+@pytest.fixture
+def flows():
+    return [
+        tflow.tflow(resp=True),
+        tflow.tflow(err=True),
+        tflow.ttcpflow(),
+    ]
+
+
+def write_indexed(path, flows):
+    with open(path, "wb") as f:
+        w = mio.IndexedFlowWriter(f)
+        for i in flows:
+            w.add(i)
+        w.close()
+
+
+class TestIndexedDump:
+    def test_roundtrip(self, tmpdir, flows):
+        path = str(tmpdir.join("flows"))
+        write_indexed(path, flows)
+        with open(path, "rb") as f:
+            assert mio.is_indexed(f)
+            assert f.tell() == 0
+            r = mio.open_reader(f)
+            assert isinstance(r, mio.IndexedFlowReader)
+            assert len(r) == 3
+            assert [e.id for e in r.entries] == [i.id for i in flows]
+            assert r.entries[0].summary["status_code"] == 200
+            assert r.entries[0].summary["method"] == "GET"
+            assert r.entries[2].summary == dict(type="tcp", marked=False)
+
+            assert r.get(flows[1].id).get_state() == flows[1].get_state()
+            assert r.get("unknown") is None
+            assert [i.id for i in r.stream()] == [i.id for i in flows]
+            r.close()
+
+    def test_plain_reader(self, tmpdir, flows):
+        # An indexed dump is readable as a plain dump.
+        path = str(tmpdir.join("flows"))
+        write_indexed(path, flows)
+        with open(path, "rb") as f:
+            data = f.read()
+        r = mio.FlowReader(io.BytesIO(data))
+        assert [i.id for i in r.stream()] == [i.id for i in flows]
+
+    def test_not_indexed(self, flows):
+        f = io.BytesIO()
+        w = mio.FlowWriter(f)
+        for i in flows:
+            w.add(i)
+        assert not mio.is_indexed(f)
+        assert not mio.is_indexed(io.BytesIO())
+        assert isinstance(mio.open_reader(f), mio.FlowReader)
+        with pytest.raises(exceptions.FlowReadException, match="Not an indexed dump"):
+            mio.IndexedFlowReader(f)
+
+    def test_bytesio(self, flows):
+        f = io.BytesIO()
+        w = mio.IndexedFlowWriter(f)
+        for i in flows:
+            w.add(i)
+        w.close()
+        r = mio.IndexedFlowReader(f)
+        assert r[1].id == flows[1].id
+
+    def test_invalid(self, tmpdir, flows):
+        path = str(tmpdir.join("flows"))
+        write_indexed(path, flows)
+        with open(path, "r+b") as f:
+            r = mio.IndexedFlowReader(f)
+            f.seek(r.entries[1].offset)
+            f.write(b"x")
+            f.flush()
+            r = mio.IndexedFlowReader(f)
+            with pytest.raises(exceptions.FlowReadException):
+                r[1]
+            f.seek(-5, io.SEEK_END)
+            f.write(b"9")
+            f.flush()
+            with pytest.raises(exceptions.FlowReadException, match="Invalid index"):
+                mio.IndexedFlowReader(f)
+
+    def test_filter_and_append(self, tmpdir, flows):
+        path = str(tmpdir.join("flows"))
+        with open(path, "wb") as f:
+            w = mio.FlowWriter(f)
+            w.add(flows[0])
+        with open(path, "a+b") as f:
+            w = mio.IndexedFlowWriter(f, flowfilter.parse("~tcp"))
+            for i in flows[1:]:
+                w.add(i)
+            w.close()
+        with open(path, "a+b") as f:
+            w = mio.IndexedFlowWriter(f)
+            w.add(flows[1])
+            w.close()
+        with open(path, "rb") as f:
+            r = mio.IndexedFlowReader(f)
+            assert [i.id for i in r.stream()] == [flows[0].id, flows[2].id, flows[1].id]
+            r.close()
+        with open(path, "rb") as f:
+            assert len(list(mio.FlowReader(f).stream())) == 3
+
+        with open(path, "wb") as f:
+            f.write(b"qibble")
+        with open(path, "a+b") as f:
+            with pytest.raises(exceptions.FlowReadException):
+                mio.IndexedFlowWriter(f)
+
+    def test_lazy(self, tmpdir, flows):
+        path = str(tmpdir.join("flows"))
+        flows[0].marked = True
+        write_indexed(path, flows)
+        with open(path, "rb") as f:
+            r = mio.IndexedFlowReader(f)
+        lazy = list(r.lazy())
+        assert [type(i) for i in lazy] == [mio.LazyHTTPFlow, mio.LazyHTTPFlow, tcp.TCPFlow]
+        a, b, _ = lazy
+        assert isinstance(a, http.HTTPFlow)
+        assert a.id == flows[0].id
+        assert a.marked
+        assert mio.lazy_summary(a)["url"] == flows[0].request.pretty_url
+        assert "_source" in a.__dict__
+
+        b.marked = True
+        assert b.request.url == flows[1].request.url
+        assert type(b) is http.HTTPFlow
+        assert b.marked
+        assert b.error.msg == flows[1].error.msg
+        assert mio.lazy_summary(b) is None
+
+        r.close()
+        with pytest.raises(exceptions.FlowReadException):
+            a.request
+
+    def test_lazy_truncated(self, tmpdir, flows):
+        path = str(tmpdir.join("flows"))
+        write_indexed(path, flows)
+        with open(path, "rb") as f:
+            r = mio.IndexedFlowReader(f)
+        a, b, _ = r.lazy()
+        open(path, "wb").close()
+        with pytest.raises(exceptions.FlowReadException):
+            a.request
+
+        # Lazy flows are loaded before their file is overwritten.
+        write_indexed(path, flows)
+        with open(path, "rb") as f:
+            r = mio.IndexedFlowReader(f)
+        a, b, _ = r.lazy()
+        mio.load_pending(path)
+        assert type(a) is type(b) is http.HTTPFlow
+        assert not r.pending
+        write_indexed(path, flows[2:])
+        assert b.request.url == flows[1].request.url
+        mio.load_pending(str(tmpdir.join("missing")))
+
+
+def test_stream_flows_from_paths(tmpdir, flows):
+    path = str(tmpdir.join("flows"))
+    with open(path, "wb") as f:
+        w = mio.FlowWriter(f)
+        for i in flows:
+            w.add(i)
+    assert [i.id for i in mio.stream_flows_from_paths([path, path])] == [i.id for i in flows] * 2
+    assert len(mio.read_flows_from_paths([path])) == 3
+
+    with open(path, "rb") as f:
+        offsets = [o for o, _ in mio.FlowReader(f).stream_offsets()]
+    assert offsets[0] == 0
+    assert mio.read_flow_at(path, offsets[2]).id == flows[2].id
+    with pytest.raises(exceptions.FlowReadException):
+        mio.read_flow_at(path, 1)
+
+    corrupt = str(tmpdir.join("corrupt"))
+    with open(corrupt, "wb") as f:
+        f.write(b"qibble")
+    stream = mio.stream_flows_from_paths([path, corrupt])
+    with pytest.raises(exceptions.FlowReadException):
+        next(stream)
+    with pytest.raises(exceptions.FlowReadException):
+        mio.validate_paths([str(tmpdir.join("nonexistent"))])
+
+
+def test_read_flows_parallel(tmpdir):
+    path = str(tmpdir.join("flows"))
+    flows = [tflow.tflow(resp=True) for _ in range(10)]
+    with open(path, "wb") as f:
+        w = mio.IndexedFlowWriter(f)
+        for i in flows:
+            w.add(i)
+        w.close()
+    size = w.offset // 3
+    segments = mio.io.split_segments(path, size)
+    assert len(segments) == 4
+    assert segments[0][0] == 0
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+
+    expected = [i.id for i in flows]
+    for processes in (1, 2):
+        batches = list(mio.read_flows_parallel(path, processes, size))
+        assert [len(b) for b in batches] == [4, 4, 2, 0]
+        assert [i.id for b in batches for i in b] == expected
+
+    with open(path, "r+b") as f:
+        f.seek(segments[1][0] + 20)
+        f.write(b"garbage")
+    with pytest.raises(exceptions.FlowReadException):
+        list(mio.read_flows_parallel(path, 2, size))
+    with open(path, "ab") as f:
+        f.write(b"10:x")
+    with pytest.raises(exceptions.FlowReadException):
+        mio.io.split_segments(path)
+    with pytest.raises(exceptions.FlowReadException):
+        list(mio.read_flows_parallel(str(tmpdir.join("nonexistent"))))
+
+
+@pytest.mark.timeout(5)
+def test_split_segments_negative_length(tmpdir):
+    path = str(tmpdir.join("flows"))
+    with open(path, "wb") as f:
+        f.write(b"-4:abcd,")
+    with pytest.raises(exceptions.FlowReadException):
+        mio.io.split_segments(path)
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires named pipes")
+@pytest.mark.timeout(10)
+def test_read_flows_parallel_fifo(tmpdir):
+    path = str(tmpdir.join("fifo"))
+    os.mkfifo(path)
+    flows = [tflow.tflow(resp=True) for _ in range(3)]
+
+    def write():
+        with open(path, "wb") as f:
+            w = mio.FlowWriter(f)
+            for i in flows:
+                w.add(i)
+
+    t = threading.Thread(target=write)
+    t.start()
+    assert not mio.is_splittable(path)
+    batches = list(mio.read_flows_parallel(path, 2))
+    t.join()
+    assert [i.id for b in batches for i in b] == [i.id for i in flows]
+
+
+class FakePool:
+    """A process pool that runs tasks on submission."""
+    def __init__(self, *args, **kwargs):
+        self.submitted = 0
+        self.shutdown = mock.Mock()
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        fut = concurrent.futures.Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+
+def test_read_flows_parallel_pool(tmpdir):
+    path = str(tmpdir.join("flows"))
+    with open(path, "wb") as f:
+        w = mio.FlowWriter(f)
+        for _ in range(10):
+            w.add(tflow.tflow(resp=True))
+    size = 1
+
+    pool = FakePool()
+    with mock.patch("concurrent.futures.ProcessPoolExecutor", return_value=pool):
+        batches = mio.read_flows_parallel(path, 2, size)
+        next(batches)
+        # two segments per process are decoded ahead
+        assert pool.submitted == 5
+        assert len(list(batches)) == 9
+        assert pool.submitted == 10
+        pool.shutdown.assert_called_once_with(wait=False)
+
+    # any failure of the pool is a FlowReadException
+    pool = FakePool()
+    pool.submit = mock.Mock(side_effect=BrokenProcessPool("worker died"))
+    with mock.patch("concurrent.futures.ProcessPoolExecutor", return_value=pool):
+        with pytest.raises(exceptions.FlowReadException, match="BrokenProcessPool"):
+            list(mio.read_flows_parallel(path, 2, size))
@@ -2,7 +2,9 @@ import unittest
 import random
 import math
 import io
+import mmap
 import struct
+import tempfile
 
 from mitmproxy.io import tnetstring
 
@@ -86,6 +88,27 @@ class Test_Format(unittest.TestCase):
             self.assertEqual(v, tnetstring.loads(tnetstring.dumps(v)))
             self.assertEqual((v, b''), tnetstring.pop(tnetstring.dumps(v)))
 
+    def test_roundtrip_buffers(self):
+        for data, expect in FORMAT_EXAMPLES.items():
+            self.assertEqual(expect, tnetstring.loads(memoryview(data)))
+            self.assertEqual(expect, tnetstring.loads(bytearray(data)))
+            with tempfile.TemporaryFile() as f:
+                f.write(data)
+                f.flush()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    self.assertEqual(expect, tnetstring.loads(m))
+        leaf = tnetstring.loads(memoryview(b'5:hello,'))
+        self.assertIs(bytes, type(leaf))
+
+    def test_nested_overrun(self):
+        # the inner string claims more data than its list contains
+        with self.assertRaises(ValueError):
+            tnetstring.loads(b'6:4:abc,]x,')
+        with self.assertRaises(ValueError):
+            tnetstring.loads(b'4:abc,')
+        with self.assertRaises(ValueError):
+            tnetstring.loads(b'abc,')
+
     def test_roundtrip_big_integer(self):
         i1 = math.factorial(30000)
         s = tnetstring.dumps(i1)
@@ -129,9 +152,36 @@ class Test_FileLoading(unittest.TestCase):
         self.assertEqual(s.read(1), b':')
 
 
+class Test_LoadAll(unittest.TestCase):
+
+    def test_load_all(self):
+        values = [get_random_object() for _ in range(100)]
+        values.append(b"x" * 1000)
+        data = b"".join(tnetstring.dumps(v) for v in values)
+        for bufsize in (1, 7, 1024 * 1024):
+            self.assertEqual(values, list(tnetstring.load_all(io.BytesIO(data), bufsize)))
+        self.assertEqual([], list(tnetstring.load_all(io.BytesIO(b""))))
+
+    def test_iter_load(self):
+        values = [b"x" * 20, 1, [b"y"] * 5, None]
+        data = [tnetstring.dumps(v) for v in values]
+        offsets = [sum(len(d) for d in data[:i]) for i in range(len(data))]
+        for bufsize in (1, 7, 1024):
+            self.assertEqual(
+                list(zip(offsets, values)),
+                list(tnetstring.iter_load(io.BytesIO(b"".join(data)), bufsize))
+            )
+
+    def test_load_all_errors(self):
+        for data in (b"5:hello,3:ab", b"5:hello,3", b"12345678901:x", b"x:y", b"0:,-4:"):
+            with self.assertRaises(ValueError):
+                list(tnetstring.load_all(io.BytesIO(data), 4))
+
+
 def suite():
     loader = unittest.TestLoader()
     suite = unittest.TestSuite()
     suite.addTest(loader.loadTestsFromTestCase(Test_Format))
     suite.addTest(loader.loadTestsFromTestCase(Test_FileLoading))
+    suite.addTest(loader.loadTestsFromTestCase(Test_LoadAll))
     return suite
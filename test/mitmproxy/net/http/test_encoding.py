@@ -1,5 +1,11 @@
+import threading
+import tracemalloc
+import zlib
 from unittest import mock
+
+import brotli
 import pytest
+import zstandard as zstd
 
 from mitmproxy.net.http import encoding
 
@@ -97,6 +103,172 @@ def test_cache():
             assert encoding.encode(b"decoded", "deflate") != b"decoded"
             assert encode_gzip.call_count == 0
 
-            # This is not in the cache anymore
+            # both entries are kept
             assert encoding.encode(b"decoded", "gzip") == b"encoded"
-            assert encode_gzip.call_count == 1
+            assert encode_gzip.call_count == 0
+
+
+def test_max_decoded_size():
+    encoded = encoding.encode(b"\0" * 1024, "gzip")
+    assert encoding.decode(encoded, "gzip") == b"\0" * 1024
+    encoding.set_max_decoded_size(100)
+    try:
+        # cached results are dropped as well
+        with pytest.raises(ValueError, match="exceeds"):
+            encoding.decode(encoded, "gzip")
+        assert encoding.decode(b"\0" * 1024, "identity") == b"\0" * 1024
+    finally:
+        encoding.set_max_decoded_size(None)
+
+
+def test_codec_cache():
+    c = encoding.CodecCache(12)
+    c.put(b"aa", "gzip", "strict", b"aaaa")
+    c.put(b"bb", "gzip", "strict", b"bbbb")
+    assert c.size == 12
+    assert c.get_decoded(b"aa", "gzip", "strict") == b"aaaa"
+    assert c.get_decoded(b"aa", "br", "strict") is None
+
+    # bb is least recently used
+    c.put(b"cc", "gzip", "strict", b"c")
+    assert c.get_decoded(b"bb", "gzip", "strict") is None
+    assert c.get_encoded(b"bbbb", "gzip", "strict") is None
+    assert c.get_encoded(b"aaaa", "gzip", "strict") == b"aa"
+    assert c.size == 9
+
+    # replacing either side drops the old pair
+    c.put(b"dd", "gzip", "strict", b"aaaa")
+    assert c.get_decoded(b"aa", "gzip", "strict") is None
+    assert c.size == 9
+    c.put(b"ee", "gzip", "strict", b"e" * 20)
+    assert c.size == 9
+    c.clear()
+    assert c.size == 0
+    assert c.get_encoded(b"aaaa", "gzip", "strict") is None
+
+
+def test_codec_cache_threads():
+    c = encoding.CodecCache(1000)
+
+    def worker(n):
+        for i in range(200):
+            key = b"%d-%d" % (n, i % 20)
+            c.put(key, "gzip", "strict", key * 3)
+            assert c.get_decoded(key, "gzip", "strict") in (None, key * 3)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert c.size == sum(len(k) + len(v) for (k, _, _), v in c.decoded.items())
+    assert c.size <= 1000
+    assert len(c.encoded) == len(c.decoded)
+
+
+@pytest.mark.parametrize("encoder", [
+    'gzip',
+    'br',
+    'deflate',
+    'zstd',
+    'identity',
+])
+def test_decoder(encoder):
+    data = bytes(range(256)) * 1000
+    encoded = encoding.encode(data, encoder)
+    d = encoding.get_decoder(encoder)
+    out = b"".join(d.feed(encoded[i:i + 7]) for i in range(0, len(encoded), 7))
+    assert out + d.finish() == data
+    assert b"".join(encoding.decode_iter(encoded, encoder, chunk_size=100)) == data
+
+    # decompression bombs are stopped early
+    bomb = encoding.encode(b"\0" * 10 * 1024 * 1024, encoder)
+    d = encoding.get_decoder(encoder, max_size=1024 * 1024)
+    with pytest.raises(ValueError, match="exceeds"):
+        d.feed(bomb)
+    assert d.size <= 1024 * 1024
+
+    # nothing fed at all
+    assert encoding.get_decoder(encoder).finish() == b""
+
+
+def streamed_bomb(encoder, size):
+    # High-ratio bombs, compressed in chunks so that the test does not need
+    # the decoded data in memory. Streamed zstd frames do not declare their
+    # size, so the decoder cannot reject them up front.
+    chunk = b"\0" * (1024 * 1024)
+    if encoder == "br":
+        c = brotli.Compressor(quality=5)
+        return b"".join(c.process(chunk) for _ in range(size)) + c.finish()
+    if encoder == "zstd":
+        c = zstd.ZstdCompressor(level=1).compressobj()
+        return b"".join(c.compress(chunk) for _ in range(size)) + c.flush()
+    c = zlib.compressobj(wbits=16 + zlib.MAX_WBITS if encoder == "gzip" else zlib.MAX_WBITS)
+    return b"".join(c.compress(chunk) for _ in range(size)) + c.flush()
+
+
+@pytest.mark.parametrize("encoder", [
+    'gzip',
+    'br',
+    'deflate',
+    'zstd',
+])
+def test_decoder_bomb_memory(encoder):
+    bomb = streamed_bomb(encoder, 256)
+    assert len(bomb) < 300 * 1024
+    limit = 1024 * 1024
+    for chunk_size in (len(bomb), 64 * 1024):
+        tracemalloc.start()
+        try:
+            with pytest.raises(ValueError, match="exceeds"):
+                for _ in encoding.decode_iter(bomb, encoder, chunk_size=chunk_size, max_size=limit):
+                    pass
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < 8 * limit
+
+
+def test_brotli_decoder_unbounded():
+    # Brotli < 1.1 has no output limit, and is fed small slices instead.
+    data = bytes(range(256)) * 1000
+    d = encoding.BrotliDecoder(max_size=len(data))
+    d.bounded = False
+    d.slice_size = encoding.BrotliDecoder.slice_size
+    assert d.feed(encoding.encode(data, "br")) + d.finish() == data
+
+
+@pytest.mark.parametrize("encoder", [
+    'gzip',
+    'br',
+    'deflate',
+])
+def test_decoder_truncated(encoder):
+    encoded = encoding.encode(b"string" * 100, encoder)
+    d = encoding.get_decoder(encoder)
+    d.feed(encoded[:len(encoded) // 2])
+    with pytest.raises(ValueError):
+        d.finish()
+
+
+def test_decoder_errors():
+    with pytest.raises(ValueError, match="No streaming decoder"):
+        encoding.get_decoder("utf8")
+    d = encoding.get_decoder("gzip")
+    with pytest.raises(ValueError):
+        d.feed(b"not gzip")
+
+
+def test_gzip_multiple_members():
+    encoded = encoding.encode_gzip(b"foo") + encoding.encode_gzip(b"bar")
+    assert encoding.decode_gzip(encoded) == b"foobar"
+
+
+def test_deflate_raw():
+    import zlib
+    c = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    raw = c.compress(b"string" * 100) + c.flush()
+    assert encoding.decode_deflate(raw) == b"string" * 100
+    d = encoding.get_decoder("deflate")
+    out = b"".join(d.feed(raw[i:i + 1]) for i in range(len(raw)))
+    assert out + d.finish() == b"string" * 100
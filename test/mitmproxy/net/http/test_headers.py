@@ -1,4 +1,5 @@
 import collections
+import copy
 import pytest
 
 from mitmproxy.net.http.headers import Headers, parse_content_type, assemble_content_type
@@ -65,6 +66,46 @@ class TestHeaders:
         headers = Headers()
         assert bytes(headers) == b""
 
+    def test_index(self):
+        headers = self._2host()
+        headers.add("Accept", "text/plain")
+        assert "HOST" in headers
+        assert headers.get_all("host") == ["example.com", "example.org"]
+        assert list(headers) == ["Host", "Accept"]
+
+        # the index follows appends and direct changes to the fields
+        headers.add("ACCEPT", "text/html")
+        assert headers["accept"] == "text/plain, text/html"
+        headers.fields = ((b"Accept", b"*/*"),)
+        assert "host" not in headers
+        assert headers["accept"] == "*/*"
+        headers.set_state([[b"X", b"1"]])
+        assert len(headers) == 1 and headers["x"] == "1"
+
+    def test_set_all(self):
+        headers = Headers([
+            (b"A", b"1"), (b"b", b"2"), (b"a", b"3"), (b"c", b"4"), (b"A", b"5")
+        ])
+        headers.set_all("a", ["x", "y"])
+        assert headers.fields == ((b"A", b"x"), (b"b", b"2"), (b"a", b"y"), (b"c", b"4"))
+        headers.set_all("c", ["z", "w"])
+        assert headers.fields == ((b"A", b"x"), (b"b", b"2"), (b"a", b"y"), (b"c", b"z"), (b"c", b"w"))
+        assert headers.get_all("C") == ["z", "w"]
+        del headers["C"]
+        assert headers.fields == ((b"A", b"x"), (b"b", b"2"), (b"a", b"y"))
+        with pytest.raises(KeyError):
+            del headers["c"]
+
+    def test_copy(self):
+        headers = Headers([(b"c", b"1")])
+        assert headers.get_all("c") == ["1"]
+        h2 = copy.copy(headers)
+        h2.set_all("c", ["2", "3"])
+        h2.add("d", "4")
+        assert headers.get_all("c") == ["1"]
+        assert "d" not in headers
+        assert h2.get_all("c") == ["2", "3"]
+
 
 def test_parse_content_type():
     p = parse_content_type
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+from unittest import mock
 
 import pytest
 
 from mitmproxy.test import tutils
 from mitmproxy.net import http
+from mitmproxy.net.http import encoding
+from mitmproxy.net.http import message
 
 
 def _test_passthrough_attr(message, attr):
@@ -195,6 +198,62 @@ class TestMessageContentEncoding:
         assert r.raw_content == b"foo"
         assert "content-encoding" not in r.headers
 
+    def test_decoded_cache(self):
+        r = tutils.tresp()
+        r.encode("gzip")
+        with mock.patch("mitmproxy.net.http.encoding.decode", wraps=encoding.decode) as decode:
+            assert r.content == b"message"
+            assert not decode.called
+
+            # a new raw_content object is not in the cache
+            r.raw_content = bytes(bytearray(r.raw_content))
+            assert r.content == b"message"
+            assert r.content == b"message"
+            assert decode.call_count == 1
+
+            # neither is a different content-encoding
+            r.headers["content-encoding"] = "deflate"
+            assert r.get_content(strict=False) == r.raw_content
+            assert decode.call_count == 2
+
+    def test_max_decoded_size(self):
+        r = tutils.tresp(content=b"\0" * 1024)
+        r.encode("gzip")
+        message.decoded_cache.clear()
+        encoding.set_max_decoded_size(100)
+        try:
+            with pytest.raises(ValueError, match="exceeds"):
+                assert r.content
+            assert r.get_content(strict=False) == r.raw_content
+        finally:
+            encoding.set_max_decoded_size(None)
+        assert r.content == b"\0" * 1024
+
+    def test_decoded_cache_budget(self):
+        c = message.DecodedCache(10)
+        a, b = b"aa", b"bb"
+        c.put(a, "gzip", b"aaa")
+        c.put(b, "gzip", b"bbb")
+        assert c.size == 10
+        assert c.get(a, "gzip") == b"aaa"
+        assert c.get(a, "br") is None
+
+        # b is least recently used
+        c.put(b"cc", "gzip", b"c")
+        assert c.get(b, "gzip") is None
+        assert c.get(a, "gzip") == b"aaa"
+        assert c.size == 8
+
+        # too large, or not actually encoded
+        c.put(b"dd", "gzip", b"d" * 10)
+        c.put(a, "identity", a)
+        assert c.size == 8
+        c.put(a, "gzip", b"a")
+        assert c.size == 6
+        c.clear()
+        assert c.size == 0
+        assert c.get(a, "gzip") is None
+
 
 class TestMessageText:
     def test_simple(self):
@@ -1,4 +1,5 @@
 from io import BytesIO
+import os
 import re
 import queue
 import time
@@ -650,6 +651,103 @@ class TestTCPServer:
             s.shutdown()
 
 
+class TestWorkerPool:
+
+    def test_backlog_and_timeout(self):
+        release = threading.Event()
+        handled, rejected = [], []
+
+        def handler(conn, addr):
+            release.wait(5)
+            handled.append(addr)
+
+        p = tcp.WorkerPool(
+            "test",
+            handler,
+            lambda conn, addr: rejected.append(addr),
+            workers=1,
+            backlog=1,
+            queue_timeout=0.1,
+        )
+        p.submit(mock.Mock(), 1)
+        for _ in range(100):
+            if p.active:
+                break
+            time.sleep(0.01)
+        assert p.active == 1
+        p.submit(mock.Mock(), 2)
+        assert p.queued == 1
+        p.submit(mock.Mock(), 3)
+        assert rejected == [3]
+
+        time.sleep(0.2)
+        release.set()
+        for _ in range(100):
+            if p.rejected == 2:
+                break
+            time.sleep(0.01)
+        assert handled == [1]
+        assert rejected == [3, 2]
+        assert p.active == 0
+        p.shutdown()
+
+    def test_shutdown(self):
+        p = tcp.WorkerPool("test", mock.Mock(), mock.Mock(), workers=0, backlog=5)
+        conn = mock.Mock()
+        p.submit(conn, 1)
+        p.shutdown()
+        assert conn.close.called
+        assert p.queued == 0
+
+
+class TestRelay:
+
+    @pytest.mark.parametrize("splice", [True, False])
+    def test_relay(self, splice, monkeypatch):
+        if not splice:
+            monkeypatch.delattr(os, "splice", raising=False)
+        elif not hasattr(os, "splice"):
+            pytest.skip("splice(2) is not available")
+
+        client, a = socket.socketpair()
+        b, server = socket.socketpair()
+        b.settimeout(5)  # non-blocking at the OS level
+        counts = [0, 0]
+        t = threading.Thread(target=tcp.relay, args=(a, b, counts, 4, threading.Event()))
+        t.start()
+
+        def recv(sock, n):
+            data = b""
+            while len(data) < n:
+                data += sock.recv(n - len(data))
+            return data
+
+        client.sendall(b"hello world")
+        assert recv(server, 11) == b"hello world"
+        server.sendall(b"foo")
+        assert recv(client, 3) == b"foo"
+
+        client.shutdown(socket.SHUT_WR)
+        assert server.recv(1) == b""
+        server.close()
+        assert client.recv(1) == b""
+        t.join(5)
+        assert not t.is_alive()
+        assert counts == [11, 3]
+        for sock in (client, a, b):
+            sock.close()
+
+    def test_should_exit(self):
+        a, b = socket.socketpair()
+        should_exit = threading.Event()
+        should_exit.set()
+        counts = [0, 0]
+        tcp.relay(a, b, counts, 4096, should_exit)
+        assert counts == [0, 0]
+        a.close()
+        b.close()
+
+
 class TestFileLike:
 
     def test_blocksize(self):
@@ -781,6 +879,25 @@ class TestFileLike:
         with pytest.raises(exceptions.TcpReadIncomplete):
             s.safe_read(10)
 
+    def test_socket(self):
+        a, b = socket.socketpair()
+        s = tcp.Reader(socket.SocketIO(a, "rb"))
+        s.PEEK_SIZE = 4
+        s.start_log()
+        b.sendall(b"foobar\r\nfoo\nbar" + b"x" * 10000)
+        assert s.readline() == b"foobar\r\n"
+        assert s.readline(2) == b"fo"
+        assert s.readline() == b"o\n"
+        # nothing beyond the line has been consumed from the socket
+        assert a.recv(3, socket.MSG_PEEK) == b"bar"
+        assert s.read(10003) == b"bar" + b"x" * 10000
+        assert s.get_log() == b"foobar\r\nfoo\nbar" + b"x" * 10000
+        b.sendall(b"foo")
+        b.close()
+        assert s.readline() == b"foo"
+        assert s.read(10) == b""
+        a.close()
+
 
 class TestPeek(tservers.ServerTestBase):
     handler = EchoHandler
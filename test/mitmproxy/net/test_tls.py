@@ -1,8 +1,11 @@
 import io
+import socket
+import threading
 
 import pytest
+from OpenSSL import SSL
 
-from mitmproxy import exceptions
+from mitmproxy import certs, exceptions
 from mitmproxy.net import tls
 from mitmproxy.net.tcp import TCPClient
 from test.mitmproxy.net.test_tcp import EchoHandler
@@ -68,6 +71,63 @@ class TestTLSInvalid:
             tls.create_client_context(alpn_select="foo", alpn_select_callback="bar")
 
 
+class TestContextCache:
+    def _handshake(self, tmpdir, store, sni, **client_kwargs):
+        cert, key, _ = store.get_cert(b"example.mitmproxy.org", [b"example.mitmproxy.org"])
+        seen_sni = []
+
+        def handle_sni(conn):
+            seen_sni.append(conn.get_servername())
+
+        a, b = socket.socketpair()
+        server = SSL.Connection(tls.create_server_context(cert, key, handle_sni=handle_sni), a)
+        tls.bind_server_connection(server, handle_sni)
+        server.set_accept_state()
+        client = SSL.Connection(tls.create_client_context(
+            sni=sni,
+            ca_pemfile=str(tmpdir.join("mitmproxy-ca-cert.pem")),
+            **client_kwargs
+        ), b)
+        tls.bind_client_connection(client, sni)
+        client.set_connect_state()
+
+        t = threading.Thread(target=server.do_handshake)
+        t.start()
+        try:
+            client.do_handshake()
+        except SSL.Error:
+            pass
+        a.close()
+        t.join()
+        b.close()
+        return seen_sni, getattr(client, "cert_error", None)
+
+    def test_reuse(self, tdata):
+        tls.context_cache.clear()
+        assert tls.create_client_context() is tls.create_client_context()
+        assert tls.create_client_context() is not tls.create_client_context(cipher_list="AES256-SHA")
+        assert tls.create_client_context(alpn_protos=[b"h2"]) is tls.create_client_context(alpn_protos=[b"h2"])
+
+    def test_per_connection_state(self, tmpdir):
+        tls.context_cache.clear()
+        store = certs.CertStore.from_store(str(tmpdir), "mitmproxy", 2048)
+        assert self._handshake(tmpdir, store, "example.mitmproxy.org", verify=SSL.VERIFY_PEER) == ([b"example.mitmproxy.org"], None)
+        # The hostname is bound to the connection, not to the shared context.
+        seen_sni, err = self._handshake(tmpdir, store, "wrong.host", verify=SSL.VERIFY_PEER)
+        assert seen_sni == [b"wrong.host"]
+        assert "wrong.host" in str(err)
+        assert len(tls.context_cache.contexts) == 2
+
+    def test_lru(self):
+        cache = tls.ContextCache(2)
+        cache.get("a", lambda: "a")
+        cache.get("b", lambda: "b")
+        assert cache.get("a", lambda: "new") == "a"
+        cache.get("c", lambda: "c")
+        assert cache.get("a", lambda: "new") == "a"
+        assert cache.get("b", lambda: "new") == "new"
+
+
 def test_is_record_magic():
     assert not tls.is_tls_record_magic(b"POST /")
     assert not tls.is_tls_record_magic(b"\x16\x03")
@@ -1 +1,33 @@
-# TODO: write tests
+from unittest import mock
+
+from mitmproxy import options
+from mitmproxy.proxy import modes
+from mitmproxy.proxy import root_context
+from mitmproxy.proxy.config import ProxyConfig
+
+from ..test_pool import make_conn
+
+
+class TestServerConnectionMixin:
+    def test_server_pool(self, tmpdir):
+        opts = options.Options(confdir=str(tmpdir), server_pool_size=1)
+        client_conn = mock.Mock(address=("127.0.0.1", 51234))
+        ctx = root_context.RootContext(client_conn, ProxyConfig(opts), mock.Mock())
+        layer = modes.HttpProxy(ctx)
+        layer.server_conn, peer = make_conn()
+        conn = layer.server_conn
+
+        layer.disconnect()
+        assert conn.connected()
+        assert not layer.server_conn.connected()
+        assert len(ctx.config.server_pool) == 1
+
+        assert not layer.reuse_server_conn(alpn_protos=[b"h2", b"http/1.1"])
+        assert not layer.reuse_server_conn(True, "example.com")
+        assert layer.reuse_server_conn()
+        assert layer.server_conn is conn
+
+        conn.reusable = False
+        layer.disconnect()
+        assert not conn.connected()
+        assert len(ctx.config.server_pool) == 0
@@ -1 +1,55 @@
-# TODO: write tests
+import socket
+import threading
+from unittest import mock
+
+import pytest
+
+from mitmproxy import options
+from mitmproxy.proxy.protocol import rawtcp
+
+
+def tlayer(ignore, **opts):
+    ctx = mock.Mock()
+    ctx.config.options = options.Options(**opts)
+    ctx.channel.should_exit = threading.Event()
+    return rawtcp.RawTCPLayer(ctx, ignore=ignore), ctx
+
+
+@pytest.mark.parametrize("ignore, counters_only", [
+    (True, False),
+    (False, True),
+    (False, False),
+])
+def test_relay(ignore, counters_only):
+    layer, ctx = tlayer(ignore, tcp_counters_only=counters_only, tcp_buffer_size=1024)
+    client, ctx.client_conn.connection = socket.socketpair()
+    ctx.server_conn.connection, server = socket.socketpair()
+    t = threading.Thread(target=layer)
+    t.start()
+
+    client.sendall(b"x" * 4096)
+    data = b""
+    while len(data) < 4096:
+        data += server.recv(4096)
+    server.sendall(b"y")
+    assert client.recv(1) == b"y"
+    client.shutdown(socket.SHUT_WR)
+    assert server.recv(1) == b""
+    server.close()
+    assert client.recv(1) == b""
+    t.join(5)
+    client.close()
+
+    if ignore:
+        assert not ctx.channel.ask.called
+        assert not ctx.channel.tell.called
+    else:
+        name, f = ctx.channel.tell.call_args[0]
+        assert name == "tcp_end"
+        if counters_only:
+            assert not f.messages
+            assert f.metadata == {"bytes_from_client": 4096, "bytes_from_server": 1}
+        else:
+            assert len(f.messages) >= 5
+            assert sum(len(m.content) for m in f.messages if m.from_client) == 4096
+            assert "bytes_from_client" not in f.metadata
@@ -26,3 +26,42 @@ class TestProxyConfig:
                                                           "mutually exclusive; please choose "
                                                           "one."):
             ProxyConfig(opts)
+
+    def test_cert_cache(self, tmpdir):
+        opts = options.Options()
+        opts.confdir = str(tmpdir)
+        opts.cert_cache = True
+        opts.cert_pregenerate = ["example.com"]
+        config = ProxyConfig(opts)
+        assert config.certstore.cache_dir == str(tmpdir.join("mitmproxy-certs"))
+
+    def test_invalid_cert_pregenerate(self, tmpdir):
+        opts = options.Options()
+        opts.confdir = str(tmpdir)
+        opts.cert_pregenerate = ["a..b"]
+        with pytest.raises(exceptions.OptionsError, match="Invalid hostname"):
+            ProxyConfig(opts)
+
+    def test_invalid_cert_store_cap(self, tmpdir):
+        opts = options.Options()
+        opts.confdir = str(tmpdir)
+        opts.cert_store_cap = -1
+        with pytest.raises(exceptions.OptionsError, match="cert_store_cap"):
+            ProxyConfig(opts)
+        opts.cert_store_cap = 0
+        config = ProxyConfig(opts)
+        assert config.certstore.get_cert(b"example.com", [])
+
+    def test_certstore_rebuild(self, tmpdir):
+        opts = options.Options()
+        opts.confdir = str(tmpdir)
+        config = ProxyConfig(opts)
+        certstore = config.certstore
+        opts.update(ignore_hosts=["example.org"], server_pool_size=1)
+        assert config.certstore is certstore
+
+        opts.cert_store_cap = 10
+        assert config.certstore is not certstore
+        assert config.certstore.store_cap == 10
+        assert certstore.pregeneration_stopped.is_set()
+        assert not config.certstore.pregeneration_stopped.is_set()
@@ -0,0 +1,91 @@
+import socket
+from unittest import mock
+
+from mitmproxy import connections
+from mitmproxy.proxy.pool import ServerConnectionPool
+
+
+def make_conn(address=("example.com", 80), sni=None):
+    a, b = socket.socketpair()
+    conn = connections.ServerConnection(address, channel=mock.Mock())
+    conn.connection = a
+    conn._makefile()
+    conn.sni = sni
+    conn.reusable = True
+    return conn, b
+
+
+class TestServerConnectionPool:
+    def test_disabled(self):
+        pool = ServerConnectionPool()
+        conn, _ = make_conn()
+        assert not pool.put(conn)
+        assert pool.get([pool.key_of(conn)]) is None
+        assert pool.misses == 0
+
+    def test_get_put(self):
+        pool = ServerConnectionPool(max_per_host=2)
+        conn, peer = make_conn()
+        assert pool.put(conn)
+        assert len(pool) == 1
+
+        other = pool.key(("example.com", 80), True, "example.com", b"http/1.1", None)
+        assert pool.get([other]) is None
+        assert pool.get([other, pool.key_of(conn)]) is conn
+        assert pool.get([pool.key_of(conn)]) is None
+        assert (pool.hits, pool.misses, pool.evictions) == (1, 2, 0)
+        assert len(pool) == 0
+
+    def test_per_host_limit(self):
+        pool = ServerConnectionPool(max_per_host=1)
+        a, peer = make_conn()
+        b, _ = make_conn()
+        c, _ = make_conn(("example.org", 80))
+        assert pool.put(a)
+        assert not pool.put(b)
+        assert pool.put(c)
+        assert pool.evictions == 1
+        assert pool.get([pool.key_of(b)]) is a
+
+    def test_max_idle(self):
+        pool = ServerConnectionPool(max_per_host=1, max_idle=0)
+        conn, _ = make_conn()
+        assert pool.put(conn)
+        assert pool.get([pool.key_of(conn)]) is None
+        assert pool.evictions == 1
+        assert not conn.connected()
+        conn.channel.tell.assert_called_once_with("serverdisconnect", conn)
+
+    def test_reap(self):
+        pool = ServerConnectionPool(max_per_host=2)
+        a, peer = make_conn()
+        b, peer2 = make_conn()
+        assert pool.put(a)
+        assert pool.put(b)
+        assert pool.reap() == 0
+        pool.max_idle = 0
+        assert pool.reap() == 2
+        assert pool.evictions == 2
+        assert len(pool) == 0
+        assert not a.connected()
+
+    def test_health_check(self):
+        pool = ServerConnectionPool(max_per_host=2)
+        closed, peer = make_conn()
+        unsolicited, peer2 = make_conn()
+        assert pool.put(closed)
+        assert pool.put(unsolicited)
+        peer.close()
+        peer2.sendall(b"HTTP/1.1 408 Request Timeout\r\n\r\n")
+        assert pool.get([pool.key_of(closed)]) is None
+        assert pool.evictions == 2
+        assert not closed.connected()
+        assert not unsolicited.connected()
+
+    def test_clear(self):
+        pool = ServerConnectionPool(max_per_host=1)
+        conn, _ = make_conn()
+        assert pool.put(conn)
+        pool.clear()
+        assert len(pool) == 0
+        assert not conn.connected()
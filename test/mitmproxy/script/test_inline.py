@@ -0,0 +1,23 @@
+import pytest
+
+from mitmproxy import script
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+
+
+class TestInline:
+    def test_inline(self):
+        class Addon:
+            @script.inline
+            def response(self, f):
+                pass
+
+        assert Addon.response.mitmproxy_inline
+        with taddons.context(Addon(), loadcore=False) as tctx:
+            assert tctx.master.addons.can_inline("response", tflow.tflow(resp=True))
+
+    def test_inline_err(self):
+        with pytest.raises(NotImplementedError, match="not supported"):
+            @script.inline
+            def configure(updated):
+                pass
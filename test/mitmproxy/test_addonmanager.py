@@ -8,6 +8,7 @@ from mitmproxy import exceptions
 from mitmproxy import options
 from mitmproxy import command
 from mitmproxy import master
+from mitmproxy import script
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
 
@@ -151,6 +152,60 @@ async def test_simple():
         assert ta in a
 
 
+def test_handlers():
+    o = options.Options()
+    m = master.Master(o)
+    a = addonmanager.AddonManager(m)
+    assert not a.handlers
+
+    a.add(TAddon("one", addons=[TAddon("two")]), D(), TAddon("three"))
+    assert [x.name for x in a.handlers["running"]] == ["one", "two", "three"]
+    assert len(a.handlers["log"]) == 1
+    assert "request" not in a.handlers
+
+    a.remove(a.get("two"))
+    a.get("one").addons = []
+    a.invalidate()
+    assert [x.name for x in a.handlers["running"]] == ["one", "three"]
+    a.trigger("running")
+    assert a.get("three").running_called
+
+
+def test_can_inline():
+    o = options.Options()
+    m = master.Master(o)
+    a = addonmanager.AddonManager(m)
+    f = tflow.tflow()
+
+    class Inline:
+        @script.inline
+        def request(self, f):
+            pass
+
+    a.add(TAddon("one"))
+    assert a.can_inline("request", f)
+    assert not a.can_inline("response", f)
+    assert not a.can_inline("running", None)
+
+    a.add(Inline())
+    assert a.can_inline("request", f)
+
+    d = D()
+    a.add(d)
+    assert a.can_inline("request", f)
+    assert not a.can_inline("log", None)
+
+    d.addons = [TAddon("two")]
+    d.addons[0].update = lambda flows: None
+    assert a.can_inline("request", f)
+    a.invalidate()
+    assert not a.can_inline("request", f)
+    assert a.can_inline("requestheaders", None)
+
+    a.clear()
+    assert a.can_inline("response", f)
+
+
 def test_load_option():
     o = options.Options()
     m = master.Master(o)
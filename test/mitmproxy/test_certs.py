@@ -71,8 +71,7 @@ class TestCertStore:
         assert b"*.baz.com" in cert.altnames
 
     def test_expire(self, tmpdir):
-        ca = certs.CertStore.from_store(str(tmpdir), "test", 2048)
-        ca.STORE_CAP = 3
+        ca = certs.CertStore.from_store(str(tmpdir), "test", 2048, store_cap=3)
         ca.get_cert(b"one.com", [])
         ca.get_cert(b"two.com", [])
         ca.get_cert(b"three.com", [])
@@ -89,10 +88,31 @@ class TestCertStore:
 
         ca.get_cert(b"four.com", [])
 
-        assert (b"one.com", ()) not in ca.certs
-        assert (b"two.com", ()) in ca.certs
+        assert (b"one.com", ()) in ca.certs
+        assert (b"two.com", ()) not in ca.certs
         assert (b"three.com", ()) in ca.certs
         assert (b"four.com", ()) in ca.certs
+        assert len(ca.expire_queue) == 3
+
+    def test_wildcard_lookup(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test", 2048)
+        entries = {}
+        for name in [b"*.com", b"*.example.com", b"www.example.com", b"*.www.example.com"]:
+            entries[name] = certs.CertStoreEntry(ca.get_cert(b"x", [])[0], ca.default_privatekey, None)
+            ca.add_cert(entries[name], name)
+
+        def lookup(name):
+            for form in certs.CertStore.asterisk_forms(name):
+                if form in ca.certs:
+                    return ca.certs[form]
+
+        for name in [b"www.example.com", b"foo.example.com", b"foo.com", b"example.com", b"a.b.www.example.com",
+                     b"*.example.com", b"org", b"foo.org", b"com"]:
+            assert ca.names.lookup(name) is lookup(name)
+
+        assert ca.get_cert(b"foo.example.com", [])[0] is entries[b"*.example.com"].cert
+        assert ca.get_cert(b"foo.org", [b"bar.com"])[0] is entries[b"*.com"].cert
+        assert ca.get_cert(b"foo.org", [])[0].cn == b"foo.org"
 
     def test_overrides(self, tmpdir):
         ca1 = certs.CertStore.from_store(str(tmpdir.join("ca1")), "test", 2048)
@@ -107,6 +127,52 @@ class TestCertStore:
         ret = ca1.get_cert(b"foo.com", [])
         assert ret[0].serial == dc[0].serial
 
+    def test_cache_leaf_certs(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test", 2048, cache_leaf_certs=True)
+        c1 = ca.get_cert(b"foo.com", [b"foo.com", b"www.foo.com"])[0]
+        assert len(tmpdir.join("test-certs").listdir()) == 1
+
+        # a new store reads the cert from disk, regardless of the order of sans.
+        ca2 = certs.CertStore.from_store(str(tmpdir), "test", 2048, cache_leaf_certs=True)
+        assert ca2.get_cert(b"foo.com", [b"www.foo.com", b"foo.com"])[0].serial == c1.serial
+        assert ca2.get_cert(b"foo.com", [b"foo.com"])[0].serial != c1.serial
+
+        # certs of another CA are not reused.
+        other = certs.CertStore.from_store(str(tmpdir.join("other")), "test", 2048)
+        other.cache_dir = ca.cache_dir
+        assert other.get_cert(b"foo.com", [b"foo.com", b"www.foo.com"])[0].serial != c1.serial
+
+        # without the option, nothing is written.
+        ca3 = certs.CertStore.from_store(str(tmpdir.join("nocache")), "test", 2048)
+        ca3.get_cert(b"foo.com", [])
+        assert not tmpdir.join("nocache", "test-certs").exists()
+
+    def test_cache_leaf_certs_broken(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test", 2048, cache_leaf_certs=True)
+        path = ca._cache_path(b"foo.com", [], None)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"garbage")
+        assert ca.get_cert(b"foo.com", [])[0].cn == b"foo.com"
+
+    def test_pregenerate(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test", 2048)
+        ca.pregenerate([b"foo.com", b"bar.com"]).join()
+        assert (b"foo.com", (b"foo.com",)) in ca.certs
+        assert (b"bar.com", (b"bar.com",)) in ca.certs
+        cert = ca.certs[(b"foo.com", (b"foo.com",))].cert
+        assert ca.get_cert(b"foo.com", [b"foo.com"])[0] is cert
+        assert ca.get_pregenerated(b"foo.com")[0] is cert
+        assert ca.get_pregenerated(b"baz.com") is None
+
+        # manually added certs take precedence
+        ca.add_cert(certs.CertStoreEntry(cert, None, None), b"*.com")
+        assert ca.get_pregenerated(b"foo.com") is None
+
+        ca.stop_pregeneration()
+        ca.pregenerate([b"baz.com"]).join()
+        assert ca.get_pregenerated(b"baz.com") is None
+
     def test_create_dhparams(self, tmpdir):
         filename = str(tmpdir.join("dhparam.pem"))
         certs.CertStore.load_dhparam(filename)
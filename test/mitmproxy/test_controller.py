@@ -1,11 +1,16 @@
 import asyncio
 import queue
+import threading
+from unittest import mock
+
 import pytest
 
 from mitmproxy.exceptions import Kill, ControlException
 from mitmproxy import controller
 from mitmproxy.test import taddons
+from mitmproxy.test import tflow
 import mitmproxy.ctx
+import mitmproxy.script
 
 
 @pytest.mark.asyncio
@@ -26,6 +31,38 @@ async def test_master():
         assert ctx.master.should_exit.is_set()
 
 
+class TestChannel:
+    def test_inline(self):
+        class tAddon:
+            @mitmproxy.script.inline
+            def request(self, f):
+                f.seen = threading.current_thread()
+
+        with taddons.context(tAddon(), loadcore=False) as tctx:
+            channel = controller.Channel(tctx.master, mock.Mock(), threading.Event())
+            f = tflow.tflow()
+            assert channel.ask("request", f) is f
+            assert f.reply.state == "committed"
+            assert f.seen is threading.current_thread()
+            assert not channel.loop.method_calls
+
+    @pytest.mark.asyncio
+    async def test_loop(self):
+        class tAddon:
+            def request(self, f):
+                f.seen = threading.current_thread()
+
+        with taddons.context(tAddon(), loadcore=False) as tctx:
+            loop = asyncio.get_event_loop()
+            channel = controller.Channel(tctx.master, loop, threading.Event())
+            f = tflow.tflow()
+            assert await loop.run_in_executor(None, channel.ask, "request", f) is f
+            assert f.seen is threading.current_thread()
+
+            channel.should_exit.set()
+            assert channel.ask("request", f) is None
+
+
 class TestReply:
     def test_simple(self):
         reply = controller.Reply(42)
@@ -5,6 +5,8 @@ from unittest.mock import patch
 from mitmproxy.test import tflow
 
 from mitmproxy import flowfilter
+from mitmproxy.net.http import encoding
+from mitmproxy.net.http import message
 
 
 class TestParsing:
@@ -212,6 +214,38 @@ class TestMatchingHTTPFlow:
         s.response.encode("gzip")
         self.match_body(q, s)
 
+    def test_body_incremental(self):
+        s = self.resp()
+        s.response.headers["content-encoding"] = "gzip"
+        body = b"needle" + bytes(range(256)) * 4096 + b"foo\nbar"
+        s.response.raw_content = encoding.encode_gzip(body)
+        message.decoded_cache.clear()
+
+        # a match near the start does not decode the whole body
+        assert self.q("~bs needle", s)
+        assert message.decoded_cache.get(s.response.raw_content, "gzip") is None
+
+        # patterns that depend on where the body ends wait for all of it
+        assert not self.q("~bs foo$", s)
+        assert self.q("~bs bar$", s)
+        assert message.decoded_cache.get(s.response.raw_content, "gzip") == body
+
+        s.response.raw_content = b"needle, not gzip"
+        assert self.q("~bs needle", s)
+
+    def test_body_max_decoded_size(self):
+        s = self.resp()
+        s.response.headers["content-encoding"] = "gzip"
+        s.response.raw_content = encoding.encode_gzip(b"\0" * 1024 + b"needle")
+        message.decoded_cache.clear()
+        encoding.set_max_decoded_size(100)
+        try:
+            assert not self.q("~bs needle", s)
+            assert message.decoded_cache.get(s.response.raw_content, "gzip") is None
+        finally:
+            encoding.set_max_decoded_size(None)
+        assert self.q("~bs needle", s)
+
     def test_method(self):
         q = self.req()
         assert self.q("~m get", q)
@@ -296,6 +330,18 @@ class TestMatchingHTTPFlow:
         assert self.q("!~c 201 !~c 202", s)
         assert not self.q("!~c 201 !~c 200", s)
 
+    def test_cost_order(self):
+        s = self.resp()
+        with patch.object(flowfilter.FBod, "__call__") as body:
+            assert not self.q("~b content & ~d nonexistent", s)
+            assert self.q("~b content | ~c 200", s)
+            assert not self.q("!(~b content | ~c 200)", s)
+            assert not body.called
+            assert self.q("~d address ~b content", s)
+            assert body.called
+        assert flowfilter.parse("~s & ~h head").cost == 3
+        assert flowfilter.parse("!~b foo").cost == 4
+
 
 class TestMatchingTCPFlow:
 
@@ -600,3 +646,30 @@ def test_match():
 
     assert flowfilter.match(None, None)
     assert not flowfilter.match('foobar', None)
+
+
+def test_implies():
+    def implies(a, b):
+        return flowfilter.implies(flowfilter.parse(a), flowfilter.parse(b))
+
+    assert implies("~m get", "~m get")
+    assert implies("~m get & ~d foo", "~m get")
+    assert implies("~m get ~d foo", "~d foo")
+    assert implies("~m get & ~d foo & ~c 200", "~d foo & ~m get")
+    assert implies("~m get", "~m get | ~m put")
+    assert implies("~m get | ~m put", "~m get | ~m put | ~m post")
+    assert implies("(~m get | ~m put) & ~c 200", "~m get | ~m put")
+    assert implies("~m get & ~c 200", "(~m get & ~c 200) | ~s")
+    assert implies("!(~m get | ~c 200) & ~s", "!(~m get | ~c 200)")
+
+    assert not implies("~m get", "~m ge")
+    assert not implies("~c 200", "~c 404")
+    assert not implies("~m get", "~m get & ~d foo")
+    assert not implies("~m get | ~m put", "~m get")
+    assert not implies("~m get & ~d foo | ~c 200", "~m get")
+    assert not implies("!~m get", "~m get")
+
+    get = lambda f: f.request.method == "GET"  # noqa
+    put = lambda f: f.request.method == "PUT"  # noqa
+    assert flowfilter.implies(get, get)
+    assert not flowfilter.implies(get, put)
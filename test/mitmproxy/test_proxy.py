@@ -1,5 +1,8 @@
 import argparse
+import asyncio
 import platform
+import socket
+import threading
 from unittest import mock
 
 import pytest
@@ -7,7 +10,8 @@ import pytest
 from mitmproxy import options
 from mitmproxy.proxy import ProxyConfig
 from mitmproxy.proxy import config
-from mitmproxy.proxy.server import ConnectionHandler, DummyServer, ProxyServer
+from mitmproxy.proxy.server import AsyncProxyServer, ConnectionHandler, DummyServer, ProxyServer
+from mitmproxy.test import taddons
 from mitmproxy.tools import cmdline
 from mitmproxy.tools import main
 from ..conftest import skip_windows
@@ -63,6 +67,109 @@ class TestProxyServer:
         with pytest.raises(Exception, match="Error starting proxy server"):
             ProxyServer(conf)
 
+    def test_worker_pool(self):
+        conf = ProxyConfig(options.Options(
+            listen_host="127.0.0.1",
+            listen_port=0,
+            connection_workers=2,
+            connection_backlog=3,
+            connection_reject="503",
+        ))
+        server = ProxyServer(conf)
+        try:
+            assert server.pool
+            assert server.pool.queue_timeout == 0
+            assert len(server.pool._threads) == 2
+
+            server.set_channel(mock.Mock())
+            a, b = socket.socketpair()
+            server.handle_rejected_connection(a, None)
+            assert b.recv(1024).startswith(b"HTTP/1.1 503")
+            assert a.fileno() == -1
+            b.close()
+            assert server.channel.tell.call_count == 1
+            assert "0 active, 0 queued" in server.channel.tell.call_args[0][1].msg
+
+            # the counters are logged at most every REJECT_LOG_INTERVAL seconds
+            a, b = socket.socketpair()
+            server.handle_rejected_connection(a, None)
+            b.close()
+            assert server.channel.tell.call_count == 1
+        finally:
+            server.shutdown()
+
+    def test_no_worker_pool(self):
+        server = ProxyServer(ProxyConfig(options.Options(listen_host="127.0.0.1", listen_port=0)))
+        assert server.pool is None
+        server.shutdown()
+
+
+class TestAsyncProxyServer:
+
+    @pytest.mark.asyncio
+    async def test_park_and_dispatch(self):
+        conf = ProxyConfig(options.Options(listen_host="127.0.0.1", listen_port=0))
+        server = AsyncProxyServer(conf)
+        dispatched = []
+        server.dispatch_connection = lambda conn, addr: dispatched.append(conn)
+        server.start_serving()
+
+        idle = socket.create_connection(server.address)
+        active = socket.create_connection(server.address)
+        active.sendall(b"GET / HTTP/1.1\r\n")
+        for _ in range(100):
+            if dispatched and len(server.parked) == 1:
+                break
+            await asyncio.sleep(0.01)
+
+        assert len(dispatched) == 1
+        assert dispatched[0].getblocking()
+        assert dispatched[0].getpeername() == active.getsockname()
+        assert len(server.parked) == 1
+
+        server.shutdown()
+        assert not server.parked
+        await asyncio.sleep(0)
+        assert idle.recv(1) == b""
+        for s in [idle, active] + dispatched:
+            s.close()
+
+    @pytest.mark.asyncio
+    async def test_resume_idle(self):
+        conf = ProxyConfig(options.Options(listen_host="127.0.0.1", listen_port=0))
+        server = AsyncProxyServer(conf)
+        server.set_channel(mock.Mock())
+        dispatched = []
+        server.dispatch_connection = lambda conn, addr: dispatched.append(conn)
+        server.start_serving()
+
+        a, b = socket.socketpair()
+        handler = mock.Mock()
+        handler.handle.return_value = True
+        with mock.patch("mitmproxy.proxy.server.ConnectionHandler", return_value=handler) as cls:
+            server.connection_thread(a, ("127.0.0.1", 1234))
+            assert a.fileno() != -1
+            assert server.handlers[a] is handler
+            await asyncio.sleep(0)
+            assert len(server.parked) == 1
+
+            b.sendall(b"GET / HTTP/1.1\r\n")
+            for _ in range(100):
+                if dispatched:
+                    break
+                await asyncio.sleep(0.01)
+            assert dispatched == [a]
+
+            handler.handle.return_value = False
+            server.connection_thread(a, ("127.0.0.1", 1234))
+            assert cls.call_count == 1
+            assert handler.handle.call_count == 2
+            assert not server.handlers
+            assert a.fileno() == -1
+
+        server.shutdown()
+        b.close()
+
 
 class TestDummyServer:
 
@@ -94,3 +201,57 @@ class TestConnectionHandler:
 
         _, err = capsys.readouterr()
         assert "mitmproxy has crashed" in err
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("pool_size", [0, 1])
+    async def test_idle_handoff(self, pool_size):
+        upstream = socket.socket()
+        upstream.bind(("127.0.0.1", 0))
+        upstream.listen()
+
+        def serve():
+            conn, _ = upstream.accept()
+            with conn:
+                for _ in range(2):
+                    data = b""
+                    while not data.endswith(b"\r\n\r\n"):
+                        data += conn.recv(1024)
+                    conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                conn.recv(1)
+
+        t = threading.Thread(target=serve, daemon=True)
+        t.start()
+        request = b"GET http://127.0.0.1:%d/ HTTP/1.1\r\nHost: example.com\r\n\r\n" % upstream.getsockname()[1]
+        response = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+        with taddons.context() as tctx:
+            tctx.options.update(server_pool_size=pool_size)
+            pconf = config.ProxyConfig(tctx.options)
+            channel = mock.Mock()
+            channel.ask = lambda _, x: x
+            a, b = socket.socketpair()
+            c = ConnectionHandler(a, ("127.0.0.1", 1234), pconf, channel, idle_handoff=True)
+
+            if pool_size:
+                # The client is handed back after every response.
+                b.sendall(request)
+                assert c.handle()
+                assert b.recv(1024) == response
+                b.sendall(request)
+                assert c.handle()
+                assert b.recv(1024) == response
+                assert pconf.server_pool.hits == 1
+            else:
+                # Without a pool, the handler keeps the server connection and its thread.
+                b.sendall(request * 2)
+            b.shutdown(socket.SHUT_WR)
+            assert not c.handle()
+            if not pool_size:
+                assert b.recv(1024) == response * 2
+            assert [x for x in channel.tell.call_args_list if x[0][0] == "clientdisconnect"] == [
+                mock.call("clientdisconnect", c.root_layer)
+            ]
+            a.close()
+            b.close()
+            pconf.server_pool.clear()
+        upstream.close()
@@ -258,6 +258,21 @@ class TestApp(tornado.testing.AsyncHTTPTestCase):
             "description": "Raw"
         }
 
+    def test_flow_content_view_page(self):
+        f = self.view.get_by_id("42")
+        f.backup()
+        f.request.content = b"\n".join(b"line %d" % i for i in range(100))
+        j = json(self.fetch("/flows/42/request/content/raw?offset=10&lines=2"))
+        assert j["lines"] == [[["text", "line 10"]], [["text", "line 11"]]]
+        assert j["more"]
+        j = json(self.fetch("/flows/42/request/content/raw?offset=98&lines=5"))
+        assert len(j["lines"]) == 2
+        assert not j["more"]
+        assert len(json(self.fetch("/flows/42/request/content/raw?offset=90"))["lines"]) == 10
+        assert self.fetch("/flows/42/request/content/raw?lines=-1").code == 400
+        assert self.fetch("/flows/42/request/content/raw?offset=x").code == 400
+        f.revert()
+
     def test_events(self):
         resp = self.fetch("/events")
         assert resp.code == 200
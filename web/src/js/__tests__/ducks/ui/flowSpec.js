@@ -23,6 +23,7 @@ describe('flow reducer', () => {
             contentView: 'Auto',
             tab: 'request',
             content: [],
+            contentMore: false,
             maxContentLines: 80,
         })
     })
@@ -60,6 +61,15 @@ describe('flow reducer', () => {
         expect(newState.content).toEqual(content)
     })
 
+    it('should not show full content if the server has more lines', () => {
+        let maxLines = 5
+        const newState = reducer({maxContentLines: maxLines}, setContent(_.range(maxLines), true))
+        expect(newState.showFullContent).toBeFalsy()
+        expect(newState.contentMore).toBeTruthy()
+        expect(reducer({...newState, showFullContent: true}, setContent(_.range(maxLines + 1))).showFullContent)
+            .toBeTruthy()
+    })
+
     it('should not change the contentview mode', () => {
         expect(reducer({contentView: 'foo'}, flowActions.select(1)).contentView).toEqual('foo')
     })
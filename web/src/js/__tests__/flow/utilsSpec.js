@@ -30,6 +30,9 @@ describe('MessageUtils', () => {
         expect(utils.MessageUtils.getContentURL(flow, msg, '')).toEqual(
             "./flows/1/request/content.data"
         )
+        expect(utils.MessageUtils.getContentURL(flow, msg, view, 80)).toEqual(
+            "./flows/1/request/content/bar.json?lines=80"
+        )
         // response
         flow = {response: msg, id: 2}
         expect(utils.MessageUtils.getContentURL(flow, msg, view)).toEqual(
@@ -31,7 +31,9 @@ export default function withContentLoader(View) {
             if (
                 nextProps.message.content !== this.props.message.content ||
                 nextProps.message.contentHash !== this.props.message.contentHash ||
-                nextProps.contentView !== this.props.contentView
+                nextProps.contentView !== this.props.contentView ||
+                // We only fetched the first page, but now need everything.
+                (nextProps.showFullContent && !this.props.showFullContent && nextProps.contentMore)
             ) {
                 this.updateContent(nextProps)
             }
@@ -55,7 +57,9 @@ export default function withContentLoader(View) {
                 return this.setState({request: undefined, content: ""})
             }
 
-            let requestUrl = MessageUtils.getContentURL(props.flow, props.message, props.contentView)
+            // Views that show a limited number of lines only fetch those.
+            let lines = props.showFullContent === false ? props.maxLines : undefined
+            let requestUrl = MessageUtils.getContentURL(props.flow, props.message, props.contentView, lines)
 
             // We use XMLHttpRequest instead of fetch() because fetch() is not (yet) abortable.
             let request = new XMLHttpRequest();
@@ -56,7 +56,7 @@ export class PureViewServer extends Component {
         }
 
         props.setContentViewDescription(props.contentView != this.data.description ? this.data.description : '')
-        props.setContent(this.data.lines)
+        props.setContent(this.data.lines, this.data.more)
     }
 
     render() {
@@ -88,6 +88,7 @@ export class PureViewServer extends Component {
 const ViewServer = connect(
     state => ({
         showFullContent: state.ui.flow.showFullContent,
+        contentMore: state.ui.flow.contentMore,
         maxLines: state.ui.flow.maxContentLines
     }),
     {
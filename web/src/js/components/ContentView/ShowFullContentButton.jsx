@@ -12,7 +12,7 @@ ShowFullContentButton.propTypes = {
         showFullContent: PropTypes.bool.isRequired
 }
 
-export function ShowFullContentButton ( {setShowFullContent, showFullContent, visibleLines, contentLines} ){
+export function ShowFullContentButton ( {setShowFullContent, showFullContent, visibleLines, contentLines, contentMore} ){
 
     return (
         !showFullContent &&
@@ -20,7 +20,11 @@ export function ShowFullContentButton ( {setShowFullContent, showFullContent, vi
                 <Button className="view-all-content-btn btn-xs" onClick={() => setShowFullContent()}>
                     Show full content
                 </Button>
-                <span className="pull-right"> {visibleLines}/{contentLines} are visible &nbsp; </span>
+                {contentMore ? (
+                    <span className="pull-right"> first {visibleLines} lines are visible &nbsp; </span>
+                ) : (
+                    <span className="pull-right"> {visibleLines}/{contentLines} are visible &nbsp; </span>
+                )}
             </div>
     )
 }
@@ -29,7 +33,8 @@ export default connect(
     state => ({
         showFullContent: state.ui.flow.showFullContent,
         visibleLines: state.ui.flow.maxContentLines,
-        contentLines: state.ui.flow.content.length
+        contentLines: state.ui.flow.content.length,
+        contentMore: state.ui.flow.contentMore
 
     }),
     {
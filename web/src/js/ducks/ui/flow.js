@@ -22,6 +22,8 @@ const defaultState = {
     contentView: 'Auto',
     tab: 'request',
     content: [],
+    // The server has more lines than we have fetched.
+    contentMore: false,
     maxContentLines: 80,
 }
 
@@ -53,7 +55,7 @@ export default function reducer(state = defaultState, action) {
                 modifiedFlow: false,
                 displayLarge: false,
                 contentView: (wasInEditMode ? 'Auto' : state.contentView),
-                showFullContent: isFullContentShown,
+                showFullContent: false,
             }
 
         case flowsActions.UPDATE:
@@ -103,7 +105,9 @@ export default function reducer(state = defaultState, action) {
             return {
                 ...state,
                 content: action.content,
-                showFullContent: isFullContentShown
+                contentMore: !!action.more,
+                // Once all content is shown, loading it must not hide it again.
+                showFullContent: state.showFullContent || (isFullContentShown && !action.more)
             }
 
         case DISPLAY_LARGE:
@@ -144,8 +148,8 @@ export function setShowFullContent() {
     return { type: SET_SHOW_FULL_CONTENT }
 }
 
-export function setContent(content){
-    return { type: SET_CONTENT, content }
+export function setContent(content, more = false){
+    return { type: SET_CONTENT, content, more }
 }
 
 export function stopEdit(flow, modifiedFlow) {
@@ -43,13 +43,17 @@ export var MessageUtils = {
         }
         return false;
     },
-    getContentURL: function (flow, message, view) {
+    getContentURL: function (flow, message, view, lines) {
         if (message === flow.request) {
             message = "request";
         } else if (message === flow.response) {
             message = "response";
         }
-        return `./flows/${flow.id}/${message}/` + (view ? `content/${view}.json` : 'content.data');
+        let url = `./flows/${flow.id}/${message}/` + (view ? `content/${view}.json` : 'content.data');
+        if (view && lines !== undefined) {
+            url += `?lines=${lines}`
+        }
+        return url
     }
 };
 